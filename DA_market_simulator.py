@@ -1,7 +1,17 @@
 import mosaik_api_v3
 from web3 import Web3
 import json
-from time import sleep
+
+from ledger_backends import AsyncWeb3Ledger, InMemoryLedger, Web3Ledger
+from offchain_clearing import clear_slot, merkle_root
+from sim_profiling import SimProfilingMixin
+
+# Prezzo fisso degli ordini (esempio, si può migliorare)
+ORDER_PRICE_ETH = 0.01
+
+# Executor degli slot per i backend senza chiavi (InMemoryLedger) se
+# non sono state fornite private_keys
+DEFAULT_EXECUTOR = "0x" + "0" * 40
 
 META = {
     "api_version": "3.0",
@@ -9,93 +19,162 @@ META = {
     "models": {
         "DAMarket": {
             "public": True,
-            "params": ["rpc_url", "contract_address", "abi_path", "private_keys"],
-            "attrs": ["slot"],  # slot corrente (ora)
+            "params": [
+                "rpc_url", "contract_address", "abi_path", "private_keys",
+                "meter_accounts",  # {full_id o eid dello smart meter: indirizzo}
+            ],
+            "attrs": [
+                "slot",                # slot corrente (ora)
+                "P_net_DA[kW]",        # input: netto Day-Ahead degli smart meter
+                "P_DA_committed[kW]",  # output: {full_id del meter: kWh venduti (+) / acquistati (-)}
+            ],
         },
     },
 }
 
 
-class DAMarketSimulator(mosaik_api_v3.Simulator):
+class DAMarketSimulator(SimProfilingMixin, mosaik_api_v3.Simulator):
     def __init__(self):
         super().__init__(META)
         self.smart_meters = {}
+
+        # Indice indirizzo -> smart meter (e inverso) per il regolamento dei trade
+        self.addr_to_meter = {}
+        self.meter_to_addr = {}
+
+        # Meter di meter_accounts non ancora visti negli input (avviso al primo step)
+        self.unseen_meters = set()
         self.slot = 0
         self.cache = {}
         self.step_size = 3600
 
-    def init(self, sid, step_size=3600, rpc_url=None, contract_address=None, abi_path=None, private_keys=None, **kwargs):
+        # Backend del registro (ledger_backends): Web3, AsyncWeb3 o in memoria
+        self.ledger = None
+
+    def init(self, sid, step_size=3600, rpc_url=None, contract_address=None, abi_path=None, private_keys=None,
+             receipt_workers=16, receipt_timeout=120, async_mode=False, max_in_flight=32,
+             clearing="onchain", clearing_rule="uniform", settlement_fn="settleSlot", backend="web3", **kwargs):
         self.step_size = step_size
 
-        # --- Connessione Web3 ---
-        if rpc_url is None or contract_address is None or abi_path is None:
-            raise ValueError("RPC, contract_address e abi_path devono essere forniti")
-        self.w3 = Web3(Web3.HTTPProvider(rpc_url))
-        if not self.w3.is_connected():
-            raise RuntimeError(f"Cannot connect to RPC: {rpc_url}")
+        # Clearing: "onchain" = un placeOrder per ordine + executeSlot,
+        # "offchain" = matching in Python e una sola transazione di settlement
+        if clearing not in ("onchain", "offchain"):
+            raise ValueError(f"clearing non valido: {clearing}")
+        self.clearing = clearing
+        self.clearing_rule = clearing_rule
+        self.settlement_fn = settlement_fn
 
-        # --- Carica ABI ---
-        with open(abi_path) as f:
-            self.contract_abi = json.load(f)["abi"]
-        self.contract = self.w3.eth.contract(address=Web3.to_checksum_address(contract_address), abi=self.contract_abi)
+        # Backend: "web3" (nodo RPC, async_mode=True per AsyncWeb3)
+        # o "memory" (contratto simulato in Python, nessun nodo richiesto)
+        if backend == "memory":
+            self.ledger = InMemoryLedger(slot_duration=step_size)
+        elif backend == "web3":
+            if rpc_url is None or contract_address is None or abi_path is None:
+                raise ValueError("RPC, contract_address e abi_path devono essere forniti")
+
+            # --- Carica ABI ---
+            with open(abi_path) as f:
+                contract_abi = json.load(f)["abi"]
+
+            # --- Connessione Web3 ---
+            if async_mode:
+                # Backend asincrono: sessione HTTP condivisa, RPC in parallelo
+                self.ledger = AsyncWeb3Ledger(rpc_url, contract_address, contract_abi,
+                                              max_in_flight=max_in_flight, receipt_timeout=receipt_timeout)
+            else:
+                self.ledger = Web3Ledger(rpc_url, contract_address, contract_abi,
+                                         receipt_workers=receipt_workers, receipt_timeout=receipt_timeout)
+        else:
+            raise ValueError(f"backend non valido: {backend}")
 
         # --- Private keys dict ---
-        self.private_keys = {Web3.to_checksum_address(addr): key for addr, key in private_keys.items()}
+        self.private_keys = {Web3.to_checksum_address(addr): key for addr, key in (private_keys or {}).items()}
 
         return META
 
-    def create(self, num, model, **model_params):
+    def create(self, num, model, meter_accounts=None, **model_params):
         eid = f"DAMarket_{num}"
-        self.cache[eid] = {"slot": 0}
+        self.cache[eid] = {"slot": 0, "P_DA_committed[kW]": {}}
+
+        # Associazioni esplicite smart meter -> indirizzo
+        for sm_eid, addr in (meter_accounts or {}).items():
+            self.register_meter(sm_eid, addr)
+            self.unseen_meters.add(sm_eid)
+
         return [{"eid": eid, "type": model, "rel": []}]
 
+    def register_meter(self, sm_eid, addr=None):
+        """
+        Registra uno smart meter nell'indice indirizzo -> eid.
+        Gli input arrivano per full_id ("sid.eid"): un meter registrato in
+        meter_accounts con il solo eid viene riconosciuto dalla parte dopo
+        il primo ".". Senza addr, l'indirizzo viene ricavato dalla coda
+        dell'eid (ultimi 42 caratteri); se non è un indirizzo il meter non
+        partecipa. Restituisce l'indirizzo (checksum) oppure None.
+        """
+        if sm_eid in self.meter_to_addr:
+            return self.meter_to_addr[sm_eid]
+
+        _, sep, eid = sm_eid.partition(".")
+        if addr is None and sep and self.meter_to_addr.get(eid) is not None:
+            addr = self.meter_to_addr[eid]
+        if addr is None and Web3.is_address(sm_eid[-42:]):
+            addr = sm_eid[-42:]
+        if addr is not None:
+            addr = Web3.to_checksum_address(addr)
+            self.addr_to_meter[addr] = sm_eid
+
+        self.meter_to_addr[sm_eid] = addr
+        return addr
+
     def step(self, time, inputs, max_advance=None):
         """
         - Legge P_net_DA dagli SmartMeter
         - Piazza ordini sulla blockchain
-        - Aggiorna P_DA_committed sugli SmartMeter
+        - Somma i trade per meter nell'output P_DA_committed[kW]
         """
         self.slot = int(time // self.step_size)
 
-        # Raccogli tutti i netti DA dagli smart meter
+        # Raccogli tutti i netti DA dagli smart meter (sorgente -> valore)
         net_da_orders = {}
         for eid, attrs in inputs.items():
-            if "P_net_DA[kW]" in attrs:
-                net_da_orders[eid] = attrs["P_net_DA[kW]"]
+            net_da_orders.update(attrs.get("P_net_DA[kW]", {}))
 
-        # --- Invio ordini al contratto blockchain ---
+        if self.unseen_meters:
+            self.warn_unseen_meters(net_da_orders)
+
+        # Ordini dello slot: (sm_eid, account, private_key, is_sell, kWh, price_wei)
+        price_wei = Web3.to_wei(ORDER_PRICE_ETH, "ether")
+        orders = []
         for sm_eid, P_net in net_da_orders.items():
-            if sm_eid not in self.private_keys:
+            acct = self.register_meter(sm_eid)
+            if acct is None:
+                continue
+            # Con il backend in memoria partecipano anche gli account senza chiave
+            private_key = self.private_keys.get(acct)
+            if private_key is None and self.ledger.needs_keys:
                 continue
-            acct = Web3.to_checksum_address(sm_eid[-42:])  # assume che l'ultimo addr sia l'indirizzo
-            private_key = self.private_keys[acct]
 
             # Decide tipo ordine
             is_sell = P_net > 0
             kWh = abs(P_net)
-            price_eth = 0.01  # esempio: prezzo fisso, si può migliorare
 
-            try:
-                self.place_order_onchain(acct, private_key, is_sell, kWh, price_eth, self.slot)
-            except Exception as e:
-                print(f"Error placing order for {sm_eid}: {e}")
+            orders.append((sm_eid, acct, private_key, is_sell, kWh, price_wei))
 
-        # --- Esegui slot ---
-        try:
-            executor = next(iter(self.private_keys.keys()))
-            self.execute_slot_onchain(executor, self.private_keys[executor], self.slot)
-        except Exception as e:
-            print(f"Error executing slot {self.slot}: {e}")
+        executor = next(iter(self.private_keys.keys()), None)
+        if executor is None and not self.ledger.needs_keys:
+            executor = DEFAULT_EXECUTOR
 
-        # --- Aggiorna P_DA_committed sui SmartMeter ---
-        trades_list = self.contract.functions.getTrades(self.slot).call()
-        for t in trades_list:
-            seller, buyer, kwh, price_wei, ts = t
-            for sm_eid in self.cache:
-                if sm_eid.endswith(seller):
-                    self.cache[sm_eid]["P_DA_committed[kW]"] = kwh
-                if sm_eid.endswith(buyer):
-                    self.cache[sm_eid]["P_DA_committed[kW]"] = -kwh
+        if self.clearing == "offchain":
+            trades_list = self.run_slot_offchain(orders, executor)
+        else:
+            trades_list = self.run_slot_onchain(orders, executor)
+
+        # --- P_DA_committed per smart meter ---
+        committed = self.settle_trades(trades_list)
+        for state in self.cache.values():
+            state["slot"] = self.slot
+            state["P_DA_committed[kW]"] = committed
 
         return time + self.step_size
 
@@ -105,42 +184,79 @@ class DAMarketSimulator(mosaik_api_v3.Simulator):
             for eid, attrs in outputs.items()
         }
 
+    def warn_unseen_meters(self, net_da_orders):
+        """
+        Avvisa (una volta) per i meter di meter_accounts che non compaiono
+        negli input del primo step, né come full_id né come eid.
+        """
+        seen = set(net_da_orders) | {src.partition(".")[2] for src in net_da_orders}
+        missing = sorted(self.unseen_meters - seen)
+        if missing:
+            print(f"Warning: meter_accounts senza input P_net_DA[kW]: {missing}")
+        self.unseen_meters = set()
+
+    def settle_trades(self, trades_list):
+        """
+        Somma i trade dello slot per smart meter in O(trade):
+        + kWh venduti, - kWh acquistati. I meter senza trade valgono 0.
+        Restituisce {full_id del meter: kWh}.
+        """
+        committed = dict.fromkeys(self.addr_to_meter.values(), 0.0)
+        for seller, buyer, kwh, price_wei, ts in trades_list:
+            sm_eid = self.addr_to_meter.get(seller)
+            if sm_eid is not None:
+                committed[sm_eid] += kwh
+            sm_eid = self.addr_to_meter.get(buyer)
+            if sm_eid is not None:
+                committed[sm_eid] -= kwh
+
+        return committed
+
+    # ------------------------
+    # Slot on-chain
+    # ------------------------
+    def run_slot_onchain(self, orders, executor):
+        """
+        placeOrder per tutti gli ordini dello slot, poi executeSlot
+        e lettura dei trade dello slot.
+        """
+        for sm_eid, err in self.ledger.place_orders(self.slot, orders):
+            print(f"Error placing order for {sm_eid}: {err}")
+
+        # --- Esegui slot ---
+        try:
+            self.ledger.execute_slot(self.slot, executor, self.private_keys.get(executor))
+        except Exception as e:
+            print(f"Error executing slot {self.slot}: {e}")
+
+        return self.ledger.get_trades(self.slot)
+
     # ------------------------
-    # Funzioni blockchain
+    # Slot off-chain
     # ------------------------
-    def safe_nonce(self, addr):
-        return self.w3.eth.get_transaction_count(addr)
-
-    def sign_and_send(self, tx_dict, private_key):
-        signed = self.w3.eth.account.sign_transaction(tx_dict, private_key=private_key)
-        raw = getattr(signed, "raw_transaction", None) or getattr(signed, "rawTransaction", None)
-        tx_hash = self.w3.eth.send_raw_transaction(raw)
-        receipt = self.w3.eth.wait_for_transaction_receipt(tx_hash)
-        return receipt
-
-    def place_order_onchain(self, account, private_key, is_sell, kWh, price_eth, slot):
-        price_wei = self.w3.to_wei(price_eth, "ether")
-        value = 0
-        if not is_sell:
-            value = int(kWh * price_wei)
-        tx = self.contract.functions.placeOrder(is_sell, int(kWh), int(price_wei), slot).build_transaction({
-            "from": account,
-            "value": value,
-            "gas": 600000,
-            "gasPrice": self.w3.eth.gas_price,
-            "nonce": self.safe_nonce(account),
-            "chainId": 31337,
-        })
-        receipt = self.sign_and_send(tx, private_key)
-        return receipt
-
-    def execute_slot_onchain(self, executor_account, private_key, slot):
-        tx = self.contract.functions.executeSlot(slot).build_transaction({
-            "from": executor_account,
-            "gas": 1500000,
-            "gasPrice": self.w3.eth.gas_price,
-            "nonce": self.safe_nonce(executor_account),
-            "chainId": 31337,
-        })
-        receipt = self.sign_and_send(tx, private_key)
-        return receipt
+    def run_slot_offchain(self, orders, executor):
+        """
+        Clearing dello slot in Python (offchain_clearing) e settlement
+        on-chain della sola Merkle root dei trade, con una transazione.
+
+        Le quantità sono troncate a kWh interi come in placeOrder (contratto
+        e InMemoryLedger): a parità di ordini i trade non dipendono dal
+        tipo di clearing.
+        """
+        trades = clear_slot(
+            ((acct, is_sell, int(kWh), price_wei) for _, acct, _, is_sell, kWh, price_wei in orders),
+            rule=self.clearing_rule,
+            timestamp=self.slot * self.step_size,
+        )
+        root = merkle_root(trades)
+
+        try:
+            self.ledger.settle(self.slot, root, executor, self.private_keys.get(executor), self.settlement_fn)
+        except Exception as e:
+            print(f"Error settling slot {self.slot}: {e}")
+
+        return trades
+
+    def finalize(self):
+        if self.ledger is not None:
+            self.ledger.close()
@@ -1,9 +1,48 @@
 import subprocess
 import json
+import itertools
+import queue
+import threading
+from collections import deque
+
 
 class DABlockchainAdapter:
-    def __init__(self, hardhat_path="blockchain/hardhat"):
+    """
+    Adapter verso gli script Hardhat di clearing del mercato DA.
+
+    Due modalità:
+    - persistent=False: un processo `npx hardhat run scripts/clearMarket.js`
+      per ogni slot (payload JSON su stdin, risultato JSON su stdout)
+    - persistent=True: un solo processo Node di lunga durata
+      (`worker_script`) che scambia JSON delimitato da newline:
+
+        richiesta:  {"id": 1, "slot": 0, "orders": {"Home_0": 1.2}}
+        risposta:   {"id": 1, "result": ...}  oppure  {"id": 1, "error": "..."}
+
+      Le righe di stdout che non sono JSON (log di Hardhat) vengono ignorate.
+      Il worker viene riavviato se termina e ucciso se una richiesta
+      supera `timeout` secondi.
+
+      L'invio degli ordini non è idempotente: una richiesta viene ripetuta
+      su un worker nuovo solo se la scrittura su stdin è fallita (il worker
+      non l'ha ricevuta). Se il worker muore dopo averla ricevuta l'errore
+      arriva al chiamante, a meno di retry_delivered=True.
+    """
+
+    def __init__(self, hardhat_path="blockchain/hardhat", persistent=False,
+                 worker_script="scripts/clearMarketWorker.js", timeout=60, max_retries=1, retry_delivered=False):
         self.path = hardhat_path
+        self.persistent = persistent
+        self.worker_script = worker_script
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.retry_delivered = retry_delivered
+
+        self.proc = None
+        self.responses = None
+        self.stderr_tail = deque(maxlen=50)
+        self.ids = itertools.count(1)
+        self.lock = threading.Lock()
 
     def submit_orders(self, slot, orders):
         """
@@ -17,6 +56,9 @@ class DABlockchainAdapter:
             "orders": orders
         }
 
+        if self.persistent:
+            return self.request(payload)
+
         result = subprocess.run(
             ["npx", "hardhat", "run", "scripts/clearMarket.js"],
             cwd=self.path,
@@ -26,3 +68,118 @@ class DABlockchainAdapter:
         )
 
         return json.loads(result.stdout)
+
+    # ------------------------
+    # Worker persistente
+    # ------------------------
+    def start_worker(self):
+        self.proc = subprocess.Popen(
+            ["npx", "hardhat", "run", self.worker_script],
+            cwd=self.path,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            bufsize=1,
+        )
+        self.responses = queue.Queue()
+        self.stderr_tail.clear()
+
+        threading.Thread(target=self._read_stdout, args=(self.proc, self.responses), daemon=True).start()
+        threading.Thread(target=self._read_stderr, args=(self.proc,), daemon=True).start()
+
+    def _read_stdout(self, proc, responses):
+        for line in proc.stdout:
+            line = line.strip()
+            if not line.startswith("{"):
+                continue
+            try:
+                responses.put(json.loads(line))
+            except ValueError:
+                continue
+        # EOF: il worker è terminato
+        responses.put(None)
+
+    def _read_stderr(self, proc):
+        for line in proc.stderr:
+            self.stderr_tail.append(line.rstrip())
+
+    def stop_worker(self):
+        if self.proc is None:
+            return
+        try:
+            self.proc.stdin.close()
+        except OSError:
+            pass
+        try:
+            self.proc.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+            self.proc.wait()
+        self.proc = None
+
+    def close(self):
+        self.stop_worker()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def request(self, payload):
+        """
+        Invia una richiesta al worker e ne attende la risposta.
+        Se la richiesta non arriva al worker (stdin chiuso) viene ripetuta
+        (max_retries volte) su un worker nuovo; se il worker muore dopo
+        averla ricevuta si ripete solo con retry_delivered=True, perché
+        gli ordini potrebbero essere già stati piazzati. In timeout il
+        worker viene ucciso.
+        """
+        with self.lock:
+            for attempt in range(self.max_retries + 1):
+                if self.proc is None or self.proc.poll() is not None:
+                    self.start_worker()
+
+                req_id = next(self.ids)
+                try:
+                    self.proc.stdin.write(json.dumps({"id": req_id, **payload}) + "\n")
+                    self.proc.stdin.flush()
+                except (BrokenPipeError, OSError):
+                    self.stop_worker()
+                    continue
+
+                response = self._wait_response(req_id)
+                if response is None:
+                    # Worker terminato dopo aver ricevuto la richiesta: esito ignoto
+                    stderr = "\n".join(self.stderr_tail)
+                    self.stop_worker()
+                    if self.retry_delivered:
+                        continue
+                    raise RuntimeError(
+                        f"Hardhat worker terminato durante la richiesta (slot {payload.get('slot')}), "
+                        f"gli ordini potrebbero essere già stati inviati:\n{stderr}"
+                    )
+
+                if "error" in response:
+                    raise RuntimeError(f"Hardhat worker error (slot {payload.get('slot')}): {response['error']}")
+                return response.get("result")
+
+        stderr = "\n".join(self.stderr_tail)
+        raise RuntimeError(f"Hardhat worker crashed repeatedly:\n{stderr}")
+
+    def _wait_response(self, req_id):
+        while True:
+            try:
+                response = self.responses.get(timeout=self.timeout)
+            except queue.Empty:
+                # Richiesta bloccata: il worker viene ucciso e riavviato alla prossima
+                self.proc.kill()
+                self.stop_worker()
+                raise TimeoutError(f"Hardhat worker: nessuna risposta in {self.timeout}s (id={req_id})")
+
+            if response is None:
+                return None
+            if response.get("id") == req_id:
+                return response
+            # Risposta a una richiesta precedente (andata in timeout): scartata
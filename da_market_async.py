@@ -0,0 +1,215 @@
+import asyncio
+import aiohttp
+from web3 import AsyncWeb3, Web3
+from web3.exceptions import TimeExhausted, TransactionNotFound
+
+
+# Intervallo tra due letture della ricevuta di una transazione (s)
+RECEIPT_POLL_INTERVAL = 0.1
+
+
+class AsyncDAMarketClient:
+    """
+    Client asincrono (AsyncWeb3) del contratto di mercato DA,
+    usato da ledger_backends.AsyncWeb3Ledger.
+
+    - una sola sessione HTTP (aiohttp) condivisa da tutte le richieste
+    - al più `max_in_flight` richieste RPC contemporanee; l'attesa delle
+      ricevute non occupa il semaforo: ogni lettura della ricevuta
+      (get_transaction_receipt) è una richiesta a sé, tra una lettura
+      e l'altra il posto resta libero per nuovi invii
+    - nonce tenuti in locale, gas price letto una volta per slot
+
+    Gli ordini di uno slot vengono inviati in parallelo e le ricevute
+    attese in parallelo: la latenza dello slot è limitata dalla RPC più
+    lenta invece che dalla somma di tutte.
+    """
+
+    def __init__(self, rpc_url, contract_address, abi, max_in_flight=32, receipt_timeout=120, chain_id=31337,
+                 receipt_poll_interval=RECEIPT_POLL_INTERVAL):
+        self.rpc_url = rpc_url
+        self.contract_address = Web3.to_checksum_address(contract_address)
+        self.abi = abi
+        self.max_in_flight = max_in_flight
+        self.receipt_timeout = receipt_timeout
+        self.receipt_poll_interval = receipt_poll_interval
+        self.chain_id = chain_id
+
+        self.w3 = None
+        self.contract = None
+        self.session = None
+        self.sem = None
+
+        # Nonce locali: account -> prossimo nonce libero
+        self.nonces = {}
+
+        # Gas price letto una volta per slot: (slot, gas_price)
+        self.gas_price_cache = (None, None)
+
+    async def connect(self):
+        """
+        Apre la sessione HTTP condivisa e verifica la connessione al nodo.
+        """
+        self.sem = asyncio.Semaphore(self.max_in_flight)
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.max_in_flight)
+        )
+        provider = AsyncWeb3.AsyncHTTPProvider(self.rpc_url)
+        await provider.cache_async_session(self.session)
+
+        self.w3 = AsyncWeb3(provider)
+        if not await self.w3.is_connected():
+            await self.close()
+            raise RuntimeError(f"Cannot connect to RPC: {self.rpc_url}")
+
+        self.contract = self.w3.eth.contract(address=self.contract_address, abi=self.abi)
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    # ------------------------
+    # Richieste RPC limitate
+    # ------------------------
+    async def rpc(self, awaitable):
+        async with self.sem:
+            return await awaitable
+
+    async def sync_nonces(self, accounts):
+        """
+        Legge dal nodo (in parallelo) i nonce degli account non ancora noti.
+        """
+        missing = [a for a in set(accounts) if a not in self.nonces]
+        counts = await asyncio.gather(
+            *(self.rpc(self.w3.eth.get_transaction_count(a, "pending")) for a in missing)
+        )
+        self.nonces.update(zip(missing, counts))
+
+    def next_nonce(self, account):
+        nonce = self.nonces[account]
+        self.nonces[account] = nonce + 1
+        return nonce
+
+    async def send(self, fn, account, private_key, nonce, gas, gas_price, value=0):
+        tx = await fn.build_transaction({
+            "from": account,
+            "value": value,
+            "gas": gas,
+            "gasPrice": gas_price,
+            "nonce": nonce,
+            "chainId": self.chain_id,
+        })
+        signed = self.w3.eth.account.sign_transaction(tx, private_key=private_key)
+        return await self.rpc(self.w3.eth.send_raw_transaction(signed.raw_transaction))
+
+    async def wait_receipt(self, tx_hash):
+        """
+        Attende la ricevuta con letture periodiche, ognuna limitata dal
+        semaforo; l'attesa tra le letture non occupa posti.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.receipt_timeout
+        while True:
+            try:
+                return await self.rpc(self.w3.eth.get_transaction_receipt(tx_hash))
+            except TransactionNotFound:
+                pass
+            if loop.time() >= deadline:
+                raise TimeExhausted(
+                    f"Transaction {Web3.to_hex(tx_hash)} not in chain after {self.receipt_timeout} seconds"
+                )
+            await asyncio.sleep(self.receipt_poll_interval)
+
+    async def send_and_wait(self, *args, **kwargs):
+        tx_hash = await self.send(*args, **kwargs)
+        return await self.wait_receipt(tx_hash)
+
+    # ------------------------
+    # Slot di mercato
+    # ------------------------
+    async def slot_gas_price(self, slot):
+        """
+        Gas price letto via RPC una sola volta per slot.
+        """
+        cached_slot, gas_price = self.gas_price_cache
+        if cached_slot != slot:
+            gas_price = await self.rpc(self.w3.eth.gas_price)
+            self.gas_price_cache = (slot, gas_price)
+        return gas_price
+
+    async def place_orders(self, slot, orders):
+        """
+        Invio parallelo di tutti gli ordini dello slot (placeOrder) e attesa delle ricevute.
+
+        orders: lista di (label, account, private_key, is_sell, kWh, price_wei)
+        Restituisce errors: lista di (label, eccezione o messaggio).
+        """
+        errors = []
+        gas_price, _ = await asyncio.gather(
+            self.slot_gas_price(slot),
+            self.sync_nonces([o[1] for o in orders]),
+        )
+
+        async def place(label, account, private_key, is_sell, kWh, price_wei):
+            value = 0 if is_sell else int(kWh * price_wei)
+            fn = self.contract.functions.placeOrder(is_sell, int(kWh), int(price_wei), slot)
+            try:
+                receipt = await self.send_and_wait(fn, account, private_key, self.next_nonce(account),
+                                                   600000, gas_price, value=value)
+            except Exception as e:
+                # Nonce da rileggere dal nodo al prossimo slot
+                self.nonces.pop(account, None)
+                errors.append((label, e))
+                return
+            if receipt["status"] != 1:
+                errors.append((label, f"reverted {receipt['transactionHash'].hex()}"))
+
+        await asyncio.gather(*(place(*o) for o in orders))
+        return errors
+
+    async def execute_slot(self, slot, executor, executor_key):
+        gas_price, _ = await asyncio.gather(
+            self.slot_gas_price(slot),
+            self.sync_nonces([executor]),
+        )
+        try:
+            return await self.send_and_wait(self.contract.functions.executeSlot(slot), executor, executor_key,
+                                            self.next_nonce(executor), 1500000, gas_price)
+        except Exception:
+            self.nonces.pop(executor, None)
+            raise
+
+    async def get_trades(self, slot):
+        return await self.rpc(self.contract.functions.getTrades(slot).call())
+
+    async def settle(self, slot, root, executor, executor_key, settlement_fn):
+        """
+        Settlement di uno slot off-chain: una transazione con la Merkle root
+        (settlement_fn se presente nell'ABI, altrimenti calldata verso sé stessi).
+        """
+        gas_price, _ = await asyncio.gather(
+            self.slot_gas_price(slot),
+            self.sync_nonces([executor]),
+        )
+        nonce = self.next_nonce(executor)
+        try:
+            if any(item.get("name") == settlement_fn for item in self.abi):
+                fn = getattr(self.contract.functions, settlement_fn)(slot, root)
+                return await self.send_and_wait(fn, executor, executor_key, nonce, 300000, gas_price)
+
+            tx = {
+                "to": executor,
+                "value": 0,
+                "data": root,
+                "gas": 300000,
+                "gasPrice": gas_price,
+                "nonce": nonce,
+                "chainId": self.chain_id,
+            }
+            signed = self.w3.eth.account.sign_transaction(tx, private_key=executor_key)
+            tx_hash = await self.rpc(self.w3.eth.send_raw_transaction(signed.raw_transaction))
+            return await self.wait_receipt(tx_hash)
+        except Exception:
+            self.nonces.pop(executor, None)
+            raise
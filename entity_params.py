@@ -0,0 +1,49 @@
+# entity_params.py
+#
+# Supporto alla creazione in blocco delle entità mosaik.
+#
+# Con create(num, model, profile_ids=[...], area=[...], ...) un
+# simulatore crea num entità con una sola chiamata: ogni parametro
+# può essere uno scalare (uguale per tutte) o una lista di num valori.
+# profile_id (scalare) resta accettato per compatibilità.
+
+import numpy as np
+
+
+def expand_params(num, model_params):
+    """
+    Espande i parametri di create() in liste di lunghezza num.
+
+    - profile_ids (lista) viene rinominato in profile_id
+    - scalari: ripetuti num volte
+    - liste/tuple/array: devono avere esattamente num elementi
+    """
+    params = dict(model_params)
+    if "profile_ids" in params:
+        if "profile_id" in params:
+            raise ValueError("Specificare profile_id oppure profile_ids, non entrambi")
+        params["profile_id"] = params.pop("profile_ids")
+
+    expanded = {}
+    for key, value in params.items():
+        if isinstance(value, (list, tuple, np.ndarray)):
+            if len(value) != num:
+                raise ValueError(
+                    f"Parametro '{key}': {len(value)} valori per {num} entità"
+                )
+            expanded[key] = list(value)
+        else:
+            expanded[key] = [value] * num
+
+    return expanded
+
+
+def unique_eid(eid, taken, counter):
+    """
+    Restituisce eid se libero, altrimenti eid_<n> con n preso da counter
+    (es. più entità create per lo stesso profile_id).
+    """
+    base = eid
+    while eid in taken:
+        eid = f"{base}_{next(counter)}"
+    return eid
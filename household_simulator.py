@@ -0,0 +1,241 @@
+# household_simulator.py
+#
+# Simulatore mosaik "fuso" delle abitazioni.
+#
+# Ogni entità Household sostituisce le cinque entità di una casa
+# (HomePV, PV_DA_Production, LoadProfileDA, LoadProfileRT, SmartMeter):
+# - produzione PV RT dal parco PVFleet (DNI in ingresso)
+# - previsione PV DA e consumi DA/RT dai ProfileStore dei CSV
+# - bilanci dello smart meter con compute_balances
+#
+# Tutto è calcolato nello stesso processo su array condivisi (una
+# posizione per casa): mosaik non deve più instradare i quattro flussi
+# per casa verso lo SmartMeter. Il simulatore espone gli attributi dello
+# SmartMeter, quindi Output e mercati si collegano come prima.
+
+import itertools
+from datetime import datetime, timedelta
+import numpy as np
+import mosaik_api_v3
+
+from entity_params import expand_params, unique_eid
+from profile_stream import DEFAULT_CHUNK_ROWS, open_profile_store
+from pv_simulator_kw import DEFAULT_START_DATE, PVFleet
+from sim_profiling import SimProfilingMixin
+from sim_trace import make_tracer
+from smart_meter_simulator import INPUT_ATTRS, OUTPUT_ATTRS, compute_balances
+from time_axis import DA_HORIZON, DEFAULT_RESOLUTION, ForecastHorizon, TimeAxis
+
+
+META = {
+    "api_version": "3.0",
+    "type": "hybrid",
+    "models": {
+        "Household": {
+            "public": True,
+            "params": [
+                "profile_id",
+                "profile_ids",  # lista di profili: una casa per valore
+
+                # Impianto PV (come HomePV)
+                "latitude",
+                "area",
+                "efficiency",
+                "el_tilt",
+                "az_tilt",
+                "max_kW",
+            ],
+            "attrs": [
+                # Input
+                "DNI[W/m2]",            # irradianza per il PV RT
+                "P_DA_committed[kW]",   # Energia acquistata/venduta Day-Ahead
+                "P_RT_committed[kW]",   # Energia acquistata/venduta Real-Time
+
+                # Misure (calcolate internamente)
+                "P_PV_DA[kW]",
+                "P_PV_RT[kW]",
+                "P_load_DA[kW]",
+                "P_load_RT[kW]",
+
+                # Bilanci dello smart meter
+                "P_net_DA[kW]",
+                "P_net_phys_RT[kW]",
+                "P_net_RT[kW]",
+            ],
+        },
+    },
+}
+
+# Attributi ricevuti da altri simulatori
+EXTERNAL_INPUTS = ["P_DA_committed[kW]", "P_RT_committed[kW]"]
+
+
+class HouseholdSimulator(SimProfilingMixin, mosaik_api_v3.Simulator):
+    """
+    Case in forma struct-of-arrays: PV, profili e smart meter
+    calcolati nello stesso step, senza scambi tramite mosaik.
+    """
+
+    def __init__(self):
+        super().__init__(META)
+
+        self.sid = None
+        self.step_size = None
+
+        self.fleet = PVFleet()
+
+        # Store dei profili (creati in init)
+        self.load_da_store = None
+        self.load_rt_store = None
+        self.pv_da_store = None
+
+        # Asse temporale e previsioni DA (creati in init)
+        self.axis = None
+        self.load_da = None
+        self.pv_da = None
+        self.tracer = None
+
+        # eid -> posizione negli array
+        self.eid_pos = {}
+        self.eid_counter = itertools.count()
+
+        # Indici di colonna delle case in ciascuno store
+        self.load_da_cols = np.empty(0, dtype=np.intp)
+        self.load_rt_cols = np.empty(0, dtype=np.intp)
+        self.pv_da_cols = np.empty(0, dtype=np.intp)
+
+        # Irradianza dello step e attributi dello smart meter
+        self.irradiance = np.zeros(0)
+        self.arrays = {attr: np.zeros(0) for attr in INPUT_ATTRS + OUTPUT_ATTRS}
+
+    # --------------------------------------------------
+    # INIT
+    # --------------------------------------------------
+    def init(self, sid, load_da_csv, load_rt_csv, pv_da_csv, step_size=3600, start_date=None,
+             poa_correction=False, binary=True, stream=False, chunk_rows=DEFAULT_CHUNK_ROWS, lazy=True,
+             data_resolution=DEFAULT_RESOLUTION, interpolation="hold", horizon=DA_HORIZON, **kwargs):
+        self.sid = sid
+        self.step_size = step_size
+
+        # PV RT (come PVSimulatorKW)
+        self.poa_correction = poa_correction
+        self.start_date = datetime.fromisoformat(start_date or DEFAULT_START_DATE)
+
+        # Profili (come i simulatori LoadProfileDA/RT e PV_DA_Production)
+        store_opts = dict(binary=binary, stream=stream, chunk_rows=chunk_rows, lazy=lazy,
+                          resolution=data_resolution)
+        self.load_da_store = open_profile_store(load_da_csv, **store_opts)
+        self.load_rt_store = open_profile_store(load_rt_csv, **store_opts)
+        self.pv_da_store = open_profile_store(pv_da_csv, **store_opts)
+
+        self.axis = TimeAxis(step_size, data_resolution, interpolation)
+        self.load_da = ForecastHorizon(self.axis, horizon=horizon)
+        self.pv_da = ForecastHorizon(self.axis, horizon=horizon)
+
+        # Logging per step (disattivato di default, vedi sim_trace.py)
+        self.tracer = make_tracer(sid, **kwargs)
+
+        return META
+
+    # --------------------------------------------------
+    # CREATE
+    # --------------------------------------------------
+    def create(self, num, model, **model_params):
+        entities = []
+
+        params = expand_params(num, model_params)
+        profile_ids = params["profile_id"]
+
+        # Colonne dei profili (errore subito se un profile_id manca)
+        load_da_cols = self.load_da_store.column_indices(profile_ids)
+        load_rt_cols = self.load_rt_store.column_indices(profile_ids)
+        pv_da_cols = self.pv_da_store.column_indices(profile_ids)
+
+        pos = self.fleet.add(
+            area=params["area"],
+            efficiency=params["efficiency"],
+            max_kW=params.get("max_kW", 6),
+            latitude=params.get("latitude", 0.0),
+            el_tilt=params.get("el_tilt", 0.0),
+            az_tilt=params.get("az_tilt", 0.0),
+        )
+        for i, pid in zip(pos, profile_ids):
+            eid = unique_eid(f"Home_{pid}_Household", self.eid_pos, self.eid_counter)
+            self.eid_pos[eid] = i
+            entities.append({
+                "eid": eid,
+                "type": model,
+                "rel": [],
+            })
+
+        # Estende gli array con le nuove case (una volta per create)
+        self.load_da_cols = np.concatenate([self.load_da_cols, load_da_cols])
+        self.load_rt_cols = np.concatenate([self.load_rt_cols, load_rt_cols])
+        self.pv_da_cols = np.concatenate([self.pv_da_cols, pv_da_cols])
+
+        self.irradiance = np.zeros(len(self.fleet))
+        for attr, arr in self.arrays.items():
+            self.arrays[attr] = np.concatenate([arr, np.zeros(len(entities))])
+
+        return entities
+
+    # --------------------------------------------------
+    # STEP
+    # --------------------------------------------------
+    def step(self, time, inputs, max_advance=None):
+        arrays = self.arrays
+
+        # Input mosaik: DNI (0 per chi non lo riceve) e commit di mercato
+        irr = self.irradiance
+        irr[:] = 0.0
+        for eid, attrs in inputs.items():
+            pos = self.eid_pos[eid]
+            dni = attrs.get("DNI[W/m2]", {})
+            if dni:
+                irr[pos] = next(iter(dni.values()))
+            for attr in EXTERNAL_INPUTS:
+                values = attrs.get(attr)
+                if values:
+                    arrays[attr][pos] = next(iter(values.values()))
+
+        # PV RT di tutte le case
+        when = self.start_date + timedelta(seconds=time) if self.poa_correction else None
+        arrays["P_PV_RT[kW]"] = self.fleet.power(irr, when)
+
+        # Previsioni DA (t + horizon) e consumi RT (W → kW)
+        if self.load_da.cols is not self.load_da_cols:
+            self.load_da.prepare(self.load_da_store, self.load_da_cols)
+        if self.pv_da.cols is not self.pv_da_cols:
+            self.pv_da.prepare(self.pv_da_store, self.pv_da_cols)
+
+        arrays["P_load_DA[kW]"] = self.load_da.point(time) / 1000.0
+        arrays["P_PV_DA[kW]"] = self.pv_da.point(time) / 1000.0
+        arrays["P_load_RT[kW]"] = self.axis.sample(self.load_rt_store, time, self.load_rt_cols) / 1000.0
+
+        # Bilanci dello smart meter di tutte le case
+        compute_balances(arrays)
+
+        if self.tracer.enabled and self.tracer.sample():
+            self.tracer.record(time, arrays["P_net_RT[kW]"], eids=self.eid_pos)
+
+        return time + self.step_size
+
+    def get_data(self, outputs):
+        data = {}
+        for eid, attrs in outputs.items():
+            pos = self.eid_pos.get(eid)
+            data[eid] = {
+                attr: self.arrays[attr][pos] if pos is not None and attr in self.arrays else 0.0
+                for attr in attrs
+            }
+        return data
+
+    def finalize(self):
+        """
+        Fine simulazione: svuota i buffer del trace e chiude gli store.
+        """
+        if self.tracer is not None:
+            self.tracer.flush()
+        for store in (self.load_da_store, self.load_rt_store, self.pv_da_store):
+            if store is not None:
+                store.close()
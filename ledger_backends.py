@@ -0,0 +1,319 @@
+import abc
+import asyncio
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from web3 import Web3
+
+from offchain_clearing import clear_slot
+
+
+# Chain ID della rete locale Hardhat
+HARDHAT_CHAIN_ID = 31337
+
+
+class LedgerBackend(abc.ABC):
+    """
+    Interfaccia dei backend di registro usati dal DAMarketSimulator.
+    Rispecchia le funzioni del contratto di mercato:
+
+    - place_orders(slot, orders): placeOrder per ogni ordine dello slot
+      orders: lista di (label, account, private_key, is_sell, kWh, price_wei)
+      restituisce la lista degli errori come (label, errore)
+    - execute_slot(slot, executor, private_key): executeSlot
+    - get_trades(slot): getTrades -> [(seller, buyer, kwh, price_wei, ts)]
+    - settle(slot, root, executor, private_key, settlement_fn): settlement
+      di uno slot chiuso off-chain (Merkle root dei trade)
+
+    needs_keys: False se il backend non firma transazioni (gli account
+    partecipano anche senza chiave privata).
+    """
+
+    needs_keys = True
+
+    @abc.abstractmethod
+    def place_orders(self, slot, orders):
+        ...
+
+    @abc.abstractmethod
+    def execute_slot(self, slot, executor, private_key):
+        ...
+
+    @abc.abstractmethod
+    def get_trades(self, slot):
+        ...
+
+    @abc.abstractmethod
+    def settle(self, slot, root, executor, private_key, settlement_fn):
+        ...
+
+    def close(self):
+        pass
+
+
+# -------------------------------------------------------------------
+# WEB3 SINCRONO
+# -------------------------------------------------------------------
+class Web3Ledger(LedgerBackend):
+    """
+    Contratto di mercato su un nodo RPC (es. Hardhat) con Web3 sincrono.
+
+    - nonce tenuti in locale, gas price letto una volta per slot
+    - gli ordini di uno slot vengono prima tutti inviati, poi
+      se ne attendono le ricevute in parallelo
+    """
+
+    def __init__(self, rpc_url, contract_address, abi, receipt_workers=16, receipt_timeout=120,
+                 chain_id=HARDHAT_CHAIN_ID):
+        self.w3 = Web3(Web3.HTTPProvider(rpc_url))
+        if not self.w3.is_connected():
+            raise RuntimeError(f"Cannot connect to RPC: {rpc_url}")
+
+        self.abi = abi
+        self.contract = self.w3.eth.contract(address=Web3.to_checksum_address(contract_address), abi=abi)
+        self.receipt_workers = receipt_workers
+        self.receipt_timeout = receipt_timeout
+        self.chain_id = chain_id
+
+        # Nonce tenuti in locale: account -> prossimo nonce libero
+        self.nonces = {}
+
+        # Gas price letto una volta per slot: (slot, gas_price)
+        self.gas_price_cache = (None, None)
+
+    def place_orders(self, slot, orders):
+        errors = []
+        pending = {}
+        for label, acct, private_key, is_sell, kWh, price_wei in orders:
+            try:
+                tx_hash = self.place_order(acct, private_key, is_sell, kWh, price_wei, slot, wait=False)
+                pending[label] = (acct, tx_hash)
+            except Exception as e:
+                errors.append((label, e))
+                # Transazione rifiutata: il nonce locale va riletto dal nodo
+                self.nonces.pop(acct, None)
+
+        receipts = self.wait_for_receipts(tx_hash for _, tx_hash in pending.values())
+        for (label, (acct, _)), receipt in zip(pending.items(), receipts):
+            if isinstance(receipt, Exception):
+                errors.append((label, receipt))
+                self.nonces.pop(acct, None)
+            elif receipt["status"] != 1:
+                errors.append((label, f"reverted {receipt['transactionHash'].hex()}"))
+
+        return errors
+
+    def execute_slot(self, slot, executor, private_key):
+        tx = self.contract.functions.executeSlot(slot).build_transaction({
+            "from": executor,
+            "gas": 1500000,
+            "gasPrice": self.slot_gas_price(slot),
+            "nonce": self.safe_nonce(executor),
+            "chainId": self.chain_id,
+        })
+        try:
+            return self.sign_and_send(tx, private_key)
+        except Exception:
+            self.nonces.pop(executor, None)
+            raise
+
+    def get_trades(self, slot):
+        return self.contract.functions.getTrades(slot).call()
+
+    def settle(self, slot, root, executor, private_key, settlement_fn):
+        """
+        Se l'ABI espone settlement_fn(slot, root) la usa; altrimenti la root
+        viene ancorata come calldata di una transazione verso l'executor stesso.
+        """
+        tx_fields = {
+            "from": executor,
+            "gas": 300000,
+            "gasPrice": self.slot_gas_price(slot),
+            "nonce": self.safe_nonce(executor),
+            "chainId": self.chain_id,
+        }
+        if any(item.get("name") == settlement_fn for item in self.abi):
+            fn = getattr(self.contract.functions, settlement_fn)(slot, root)
+            tx = fn.build_transaction(tx_fields)
+        else:
+            tx = {**tx_fields, "to": executor, "value": 0, "data": root}
+        try:
+            return self.sign_and_send(tx, private_key)
+        except Exception:
+            self.nonces.pop(executor, None)
+            raise
+
+    # ------------------------
+    # Funzioni blockchain
+    # ------------------------
+    def safe_nonce(self, addr):
+        """
+        Prossimo nonce di addr, tenuto in locale.
+        Il nodo viene interrogato solo alla prima transazione dell'account
+        (o dopo un errore di invio, che cancella il valore locale).
+        """
+        nonce = self.nonces.get(addr)
+        if nonce is None:
+            nonce = self.w3.eth.get_transaction_count(addr, "pending")
+        self.nonces[addr] = nonce + 1
+        return nonce
+
+    def slot_gas_price(self, slot):
+        """
+        Gas price letto via RPC una sola volta per slot.
+        """
+        cached_slot, gas_price = self.gas_price_cache
+        if cached_slot != slot:
+            gas_price = self.w3.eth.gas_price
+            self.gas_price_cache = (slot, gas_price)
+        return gas_price
+
+    def sign_and_send(self, tx_dict, private_key, wait=True):
+        """
+        Firma e invia una transazione.
+        wait=True: attende e restituisce la ricevuta; altrimenti restituisce l'hash.
+        """
+        signed = self.w3.eth.account.sign_transaction(tx_dict, private_key=private_key)
+        raw = getattr(signed, "raw_transaction", None) or getattr(signed, "rawTransaction", None)
+        tx_hash = self.w3.eth.send_raw_transaction(raw)
+        if not wait:
+            return tx_hash
+        receipt = self.w3.eth.wait_for_transaction_receipt(tx_hash, timeout=self.receipt_timeout)
+        return receipt
+
+    def wait_for_receipts(self, tx_hashes):
+        """
+        Attende le ricevute di più transazioni in parallelo.
+        Restituisce, nello stesso ordine, la ricevuta o l'eccezione.
+        """
+        tx_hashes = list(tx_hashes)
+        if not tx_hashes:
+            return []
+
+        def wait(tx_hash):
+            try:
+                return self.w3.eth.wait_for_transaction_receipt(tx_hash, timeout=self.receipt_timeout)
+            except Exception as e:
+                return e
+
+        workers = min(self.receipt_workers, len(tx_hashes))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(wait, tx_hashes))
+
+    def place_order(self, account, private_key, is_sell, kWh, price_wei, slot, wait=True):
+        value = 0
+        if not is_sell:
+            value = int(kWh * price_wei)
+        tx = self.contract.functions.placeOrder(is_sell, int(kWh), int(price_wei), slot).build_transaction({
+            "from": account,
+            "value": value,
+            "gas": 600000,
+            "gasPrice": self.slot_gas_price(slot),
+            "nonce": self.safe_nonce(account),
+            "chainId": self.chain_id,
+        })
+        return self.sign_and_send(tx, private_key, wait=wait)
+
+
+# -------------------------------------------------------------------
+# WEB3 ASINCRONO
+# -------------------------------------------------------------------
+class AsyncWeb3Ledger(LedgerBackend):
+    """
+    Adatta AsyncDAMarketClient (da_market_async.py) all'interfaccia
+    sincrona dei backend: ogni chiamata esegue la coroutine sul loop
+    attivo (mosaik + nest_asyncio) o su un loop privato.
+    """
+
+    def __init__(self, rpc_url, contract_address, abi, max_in_flight=32, receipt_timeout=120,
+                 chain_id=HARDHAT_CHAIN_ID):
+        from da_market_async import AsyncDAMarketClient
+
+        self.loop = None
+        self.client = AsyncDAMarketClient(rpc_url, contract_address, abi, max_in_flight=max_in_flight,
+                                          receipt_timeout=receipt_timeout, chain_id=chain_id)
+        self.run(self.client.connect())
+
+    def run(self, coro):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            if self.loop is None:
+                self.loop = asyncio.new_event_loop()
+            loop = self.loop
+        return loop.run_until_complete(coro)
+
+    def place_orders(self, slot, orders):
+        return self.run(self.client.place_orders(slot, orders))
+
+    def execute_slot(self, slot, executor, private_key):
+        return self.run(self.client.execute_slot(slot, executor, private_key))
+
+    def get_trades(self, slot):
+        return self.run(self.client.get_trades(slot))
+
+    def settle(self, slot, root, executor, private_key, settlement_fn):
+        return self.run(self.client.settle(slot, root, executor, private_key, settlement_fn))
+
+    def close(self):
+        self.run(self.client.close())
+
+
+# -------------------------------------------------------------------
+# IN MEMORIA
+# -------------------------------------------------------------------
+class InMemoryLedger(LedgerBackend):
+    """
+    Sostituto in puro Python del contratto di mercato, senza nodo né Node.
+
+    Stesse semantiche del percorso Web3:
+    - placeOrder(isSell, kWh, priceWei, slot): kWh e prezzo interi come
+      nella chiamata al contratto
+    - executeSlot(slot): abbina gli ordini dello slot con priorità
+      prezzo-tempo; uno slot può essere eseguito una sola volta
+    - getTrades(slot): trade (seller, buyer, kwh, price_wei, timestamp)
+
+    Il timestamp dei trade è l'inizio dello slot (slot * slot_duration),
+    non l'ora di sistema: a parità di ordini i risultati sono identici.
+    Le chiavi private non servono (needs_keys = False) e non vengono
+    verificate. Non vengono simulati i depositi in wei del contratto.
+    """
+
+    needs_keys = False
+
+    def __init__(self, clearing_rule="price_time", slot_duration=3600):
+        self.clearing_rule = clearing_rule
+        self.slot_duration = slot_duration
+
+        # slot -> [(account, is_sell, kwh, price_wei)] in ordine di arrivo
+        self.orders = defaultdict(list)
+
+        # slot -> trade eseguiti
+        self.trades = {}
+
+        # Regolamenti off-chain: slot -> root
+        self.settlements = {}
+
+    def place_orders(self, slot, orders):
+        errors = []
+        for label, acct, _, is_sell, kWh, price_wei in orders:
+            if slot in self.trades:
+                errors.append((label, f"reverted: slot {slot} already executed"))
+                continue
+            self.orders[slot].append((Web3.to_checksum_address(acct), is_sell, int(kWh), int(price_wei)))
+        return errors
+
+    def execute_slot(self, slot, executor, private_key):
+        if slot in self.trades:
+            raise RuntimeError(f"reverted: slot {slot} already executed")
+        trades = clear_slot(self.orders.pop(slot, []), rule=self.clearing_rule, timestamp=slot * self.slot_duration)
+
+        # I trade sono interi come sul contratto
+        self.trades[slot] = [(s, b, int(q), p, ts) for s, b, q, p, ts in trades]
+        return {"status": 1}
+
+    def get_trades(self, slot):
+        return list(self.trades.get(slot, []))
+
+    def settle(self, slot, root, executor, private_key, settlement_fn):
+        self.settlements[slot] = root
+        return {"status": 1}
@@ -13,9 +13,15 @@
 # Fornisce i valori t+24h per il mercato DA.
 
 import itertools
-import pandas as pd
+import numpy as np
 import mosaik_api_v3
 
+from entity_params import expand_params, unique_eid
+from profile_stream import DEFAULT_CHUNK_ROWS, open_profile_store
+from sim_profiling import SimProfilingMixin
+from sim_trace import make_tracer
+from time_axis import DA_HORIZON, DEFAULT_RESOLUTION, ForecastHorizon, TimeAxis
+
 
 # -------------------------------------------------------------------
 # META-DATA MOSAIK
@@ -37,19 +43,21 @@ META = {
 
             # Parametri assegnati alla creazione dell'entità
             "params": [
-                "profile_id",  # nome della colonna del CSV
+                "profile_id",   # nome della colonna del CSV
+                "profile_ids",  # lista di colonne: una entità per valore
             ],
 
             # Attributi dinamici prodotti a ogni step
             "attrs": [
                 "P_load_DA[kW]",  # potenza assorbita nello slot orario
+                "P_load_DA_block[kW]",  # consumi previsti del blocco DA (lista)
             ],
         },
     },
 }
 
 
-class LoadProfileDASimulator(mosaik_api_v3.Simulator):
+class LoadProfileDASimulator(SimProfilingMixin, mosaik_api_v3.Simulator):
     """
     Simulatore mosaik per profili di carico orari.
 
@@ -71,8 +79,15 @@ class LoadProfileDASimulator(mosaik_api_v3.Simulator):
         # Dimensione dello step temporale (secondi)
         self.step_size = None
 
-        # DataFrame con i dati orari (8760 righe)
-        self.data = None
+        # Profili orari condivisi (ProfileStore, 8760 righe)
+        self.store = None
+
+        # Tracer per il logging degli step (creato in init)
+        self.tracer = None
+
+        # Asse temporale dati -> step e orizzonte di previsione (creati in init)
+        self.axis = None
+        self.forecast = None
 
         # Stato interno delle entità: eid -> dict
         self.entities = {}
@@ -80,13 +95,25 @@ class LoadProfileDASimulator(mosaik_api_v3.Simulator):
         # Contatore per ID univoci delle entità
         self.eid_counter = itertools.count()
 
+        # Indici di colonna delle entità, nell'ordine di creazione
+        self.cols = np.empty(0, dtype=np.intp)
+
+        # eid -> posizione nell'array dei valori
+        self.eid_pos = {}
+
         # Cache dei valori calcolati nello step corrente
-        self.cache = {}
+        # (un valore in kW per entità, allineato a self.cols)
+        self.cache = np.zeros(0)
+
+        # Blocco DA dello step corrente (da_block × entità, in kW)
+        self.block = np.zeros((0, 0))
 
     # ----------------------------------------------------------------
     # INIT
     # ----------------------------------------------------------------
-    def init(self, sid, csv_path, step_size=3600, **kwargs):
+    def init(self, sid, csv_path, step_size=3600, binary=True, stream=False, chunk_rows=DEFAULT_CHUNK_ROWS,
+             lazy=True, data_resolution=DEFAULT_RESOLUTION, interpolation="hold", horizon=DA_HORIZON, da_block=0,
+             precompute=True, **kwargs):
         """
         Inizializzazione del simulatore.
         - Carica CSV
@@ -96,31 +123,24 @@ class LoadProfileDASimulator(mosaik_api_v3.Simulator):
         self.sid = sid
         self.step_size = step_size
 
-        # Caricamento CSV (pandas legge automaticamente la prima riga come intestazione)
-        df = pd.read_csv(csv_path)
-
-        # Rimuove eventuali righe completamente vuote
-        df = df.dropna(how="all")
-
-        # Controllo: 8760 righe (ore), 10 colonne (profili 0–9)
-        # Se ci sono 8761 righe → la prima è identificativa
-        if len(df) == 8761:
-            df = df.iloc[1:].reset_index(drop=True)
+        # Profili condivisi (CSV letto una sola volta per processo,
+        # con binary=True mappato in memoria dal formato binario);
+        # stream=True legge il CSV a blocchi di chunk_rows righe;
+        # lazy=True carica solo le colonne dei profile_id usati nelle create
+        self.store = open_profile_store(csv_path, binary=binary, stream=stream, chunk_rows=chunk_rows,
+                                        lazy=lazy, resolution=data_resolution)
 
-        # Se ce n'è una in meno (caso reale che stai vedendo)
-        elif len(df) == 8759:
-            raise ValueError(
-                "CSV ha 8759 righe: manca un'ora. "
-                "Controlla DST o dati mancanti."
-            )
+        # Asse temporale: risoluzione dei dati vs step della simulazione
+        # (interpolazione per step più brevi, media per step più lunghi)
+        self.axis = TimeAxis(step_size, data_resolution, interpolation)
 
-        if len(df) != 8760:
-            raise ValueError(
-                f"Numero righe inatteso: {len(df)} (atteso 8760)"
-            )
+        # Previsione a time + horizon (s); con da_block > 0 anche il blocco
+        # dei da_block valori orari successivi. precompute=True ruota una
+        # volta le colonne delle entità invece di indicizzare a ogni step.
+        self.forecast = ForecastHorizon(self.axis, horizon=horizon, block=da_block, precompute=precompute)
 
-        # Salva i dati
-        self.data = df.astype(float)
+        # Logging per step (disattivato di default, vedi sim_trace.py)
+        self.tracer = make_tracer(sid, **kwargs)
 
         return META
 
@@ -137,15 +157,17 @@ class LoadProfileDASimulator(mosaik_api_v3.Simulator):
         """
 
         entities = []
-        profile_id = model_params["profile_id"]
+        profile_ids = expand_params(num, model_params)["profile_id"]
+        new_cols = self.store.column_indices(profile_ids)
 
-        for _ in range(num):
-            eid = f"Home_{profile_id}"
+        for i, profile_id in enumerate(profile_ids):
+            eid = unique_eid(f"Home_{profile_id}", self.eid_pos, self.eid_counter)
 
             self.entities[eid] = {
                 "profile_id": profile_id,
-                "P_load_DA[kW]": 0.0,
+                "col": new_cols[i],
             }
+            self.eid_pos[eid] = len(self.cols) + i
 
             entities.append({
                 "eid": eid,
@@ -153,6 +175,10 @@ class LoadProfileDASimulator(mosaik_api_v3.Simulator):
                 "rel": []
             })
 
+        # Estende gli array con le nuove entità (una volta per create)
+        self.cols = np.concatenate([self.cols, new_cols])
+        self.cache = np.zeros(len(self.cols))
+
         return entities
 
     # ----------------------------------------------------------------
@@ -163,28 +189,28 @@ class LoadProfileDASimulator(mosaik_api_v3.Simulator):
         Aggiornamento dello stato a ogni step temporale.
 
         - time è espresso in secondi dall'inizio simulazione
-        - 1 step = 1 ora
+        - step e risoluzione dei dati raccordati da TimeAxis (time_axis.py)
         - il valore viene letto dal CSV e convertito in kW
         """
 
-        # Conversione tempo mosaik → indice orario
-        hour_idx = int(time // self.step_size) % len(self.data)
-
-        self.cache = {}
+        # Conversione tempo mosaik → riga dei dati
+        hour_idx = self.axis.row_index(time) % len(self.store)
 
-        for eid, ent in self.entities.items():
-            profile = ent["profile_id"]
+        # Consumo Day-Ahead a t + horizon
+        future_idx = self.axis.row_index(time + self.forecast.horizon) % len(self.store)
 
-            # Consumo Day-Ahead t+24h
-            future_idx = (hour_idx + 24) % len(self.data)
-            p_w_da = self.data.iloc[future_idx][profile]
-            p_kw_da = p_w_da / 1000.0
+        # Tabella di previsione (ri)preparata quando cambiano le entità
+        if self.forecast.cols is not self.cols:
+            self.forecast.prepare(self.store, self.cols)
 
-            print(f"[Load] time={time}, eid={eid}, hour_idx={hour_idx}, "
-                  f"t+24h_idx={future_idx}, P_load_DA={p_kw_da:.3f} kW")
+        # Tutte le entità in una sola lettura (W → kW)
+        self.cache = self.forecast.point(time) / 1000.0
+        if self.forecast.block:
+            self.block = self.forecast.values(time) / 1000.0
 
-            ent["P_load_DA[kW]"] = p_kw_da
-            self.cache[eid] =  p_kw_da
+        if self.tracer.enabled and self.tracer.sample():
+            self.tracer.record(time, self.cache, eids=self.eid_pos,
+                               hour_idx=hour_idx, future_idx=future_idx)
 
         # Richiesta del prossimo step
         return time + self.step_size
@@ -204,6 +230,22 @@ class LoadProfileDASimulator(mosaik_api_v3.Simulator):
             data[eid] = {}
             for attr in attrs:
                 if attr == "P_load_DA[kW]":
-                    data[eid][attr] = self.cache.get(eid, 0.0)
+                    pos = self.eid_pos.get(eid)
+                    data[eid][attr] = self.cache[pos] if pos is not None else 0.0
+                elif attr == "P_load_DA_block[kW]":
+                    pos = self.eid_pos.get(eid)
+                    data[eid][attr] = self.block[:, pos].tolist() if pos is not None and self.block.size else []
 
         return data
+
+    # ----------------------------------------------------------------
+    # FINALIZE
+    # ----------------------------------------------------------------
+    def finalize(self):
+        """
+        Fine simulazione: svuota i buffer del trace e chiude lo store.
+        """
+        if self.tracer is not None:
+            self.tracer.flush()
+        if self.store is not None:
+            self.store.close()
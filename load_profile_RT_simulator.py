@@ -13,9 +13,15 @@
 # - aggiorna il valore a ogni slot orario (1h)
 
 import itertools
-import pandas as pd
+import numpy as np
 import mosaik_api_v3
 
+from entity_params import expand_params, unique_eid
+from profile_stream import DEFAULT_CHUNK_ROWS, open_profile_store
+from sim_profiling import SimProfilingMixin
+from sim_trace import make_tracer
+from time_axis import DEFAULT_RESOLUTION, TimeAxis
+
 
 # -------------------------------------------------------------------
 # META-DATA MOSAIK
@@ -32,7 +38,8 @@ META = {
 
             # Parametri alla creazione
             "params": [
-                "profile_id",  # nome colonna CSV
+                "profile_id",   # nome colonna CSV
+                "profile_ids",  # lista di colonne: una entità per valore
             ],
 
             # Attributi dinamici
@@ -44,7 +51,7 @@ META = {
 }
 
 
-class LoadProfileRTSimulator(mosaik_api_v3.Simulator):
+class LoadProfileRTSimulator(SimProfilingMixin, mosaik_api_v3.Simulator):
     """
     Simulatore mosaik per profili di carico REAL-TIME.
 
@@ -61,39 +68,50 @@ class LoadProfileRTSimulator(mosaik_api_v3.Simulator):
 
         self.sid = None
         self.step_size = None
-        self.data = None
+        self.store = None
+
+        # Tracer per il logging degli step (creato in init)
+        self.tracer = None
+
+        # Asse temporale dati -> step (creato in init)
+        self.axis = None
 
         # Stato interno entità
         self.entities = {}
 
+        # Indici di colonna delle entità, nell'ordine di creazione
+        self.cols = np.empty(0, dtype=np.intp)
+
+        # eid -> posizione nell'array dei valori
+        self.eid_pos = {}
+
         # Cache valori step corrente
-        self.cache = {}
+        # (un valore in kW per entità, allineato a self.cols)
+        self.cache = np.zeros(0)
 
         self.eid_counter = itertools.count()
 
     # ----------------------------------------------------------------
     # INIT
     # ----------------------------------------------------------------
-    def init(self, sid, csv_path, step_size=3600, **kwargs):
+    def init(self, sid, csv_path, step_size=3600, binary=True, stream=False, chunk_rows=DEFAULT_CHUNK_ROWS,
+             lazy=True, data_resolution=DEFAULT_RESOLUTION, interpolation="hold", **kwargs):
         self.sid = sid
         self.step_size = step_size
 
-        df = pd.read_csv(csv_path)
-        df = df.dropna(how="all")
-
-        if len(df) == 8761:
-            df = df.iloc[1:].reset_index(drop=True)
-        elif len(df) == 8759:
-            raise ValueError(
-                "CSV ha 8759 righe: manca un'ora (DST o dato mancante)"
-            )
+        # Profili condivisi (CSV letto una sola volta per processo,
+        # con binary=True mappato in memoria dal formato binario);
+        # stream=True legge il CSV a blocchi di chunk_rows righe;
+        # lazy=True carica solo le colonne dei profile_id usati nelle create
+        self.store = open_profile_store(csv_path, binary=binary, stream=stream, chunk_rows=chunk_rows,
+                                        lazy=lazy, resolution=data_resolution)
 
-        if len(df) != 8760:
-            raise ValueError(
-                f"Numero righe inatteso: {len(df)} (atteso 8760)"
-            )
+        # Asse temporale: risoluzione dei dati vs step della simulazione
+        # (interpolazione per step più brevi, media per step più lunghi)
+        self.axis = TimeAxis(step_size, data_resolution, interpolation)
 
-        self.data = df.astype(float)
+        # Logging per step (disattivato di default, vedi sim_trace.py)
+        self.tracer = make_tracer(sid, **kwargs)
 
         return META
 
@@ -102,15 +120,17 @@ class LoadProfileRTSimulator(mosaik_api_v3.Simulator):
     # ----------------------------------------------------------------
     def create(self, num, model, **model_params):
         entities = []
-        profile_id = model_params["profile_id"]
+        profile_ids = expand_params(num, model_params)["profile_id"]
+        new_cols = self.store.column_indices(profile_ids)
 
-        for _ in range(num):
-            eid = f"Home_{profile_id}"
+        for i, profile_id in enumerate(profile_ids):
+            eid = unique_eid(f"Home_{profile_id}", self.eid_pos, self.eid_counter)
 
             self.entities[eid] = {
                 "profile_id": profile_id,
-                "P_load_RT[kW]": 0.0,
+                "col": new_cols[i],
             }
+            self.eid_pos[eid] = len(self.cols) + i
 
             entities.append({
                 "eid": eid,
@@ -118,6 +138,10 @@ class LoadProfileRTSimulator(mosaik_api_v3.Simulator):
                 "rel": [],
             })
 
+        # Estende gli array con le nuove entità (una volta per create)
+        self.cols = np.concatenate([self.cols, new_cols])
+        self.cache = np.zeros(len(self.cols))
+
         return entities
 
     # ----------------------------------------------------------------
@@ -129,21 +153,13 @@ class LoadProfileRTSimulator(mosaik_api_v3.Simulator):
         - usa direttamente l'indice orario corrente
         """
 
-        hour_idx = int(time // self.step_size) % len(self.data)
-
-        self.cache = {}
+        hour_idx = self.axis.row_index(time) % len(self.store)
 
-        for eid, ent in self.entities.items():
-            profile = ent["profile_id"]
+        # Tutte le entità in una sola somma pesata di righe (W → kW)
+        self.cache = self.axis.sample(self.store, time, self.cols) / 1000.0
 
-            p_w = self.data.iloc[hour_idx][profile]
-            p_kw = p_w / 1000.0
-
-            print(f"[Load RT] time={time}, eid={eid}, "
-                  f"hour_idx={hour_idx}, P_load_RT={p_kw:.3f} kW")
-
-            ent["P_load_RT[kW]"] = p_kw
-            self.cache[eid] = p_kw
+        if self.tracer.enabled and self.tracer.sample():
+            self.tracer.record(time, self.cache, eids=self.eid_pos, hour_idx=hour_idx)
 
         return time + self.step_size
 
@@ -157,6 +173,19 @@ class LoadProfileRTSimulator(mosaik_api_v3.Simulator):
             data[eid] = {}
             for attr in attrs:
                 if attr == "P_load_RT[kW]":
-                    data[eid][attr] = self.cache.get(eid, 0.0)
+                    pos = self.eid_pos.get(eid)
+                    data[eid][attr] = self.cache[pos] if pos is not None else 0.0
 
         return data
+
+    # ----------------------------------------------------------------
+    # FINALIZE
+    # ----------------------------------------------------------------
+    def finalize(self):
+        """
+        Fine simulazione: svuota i buffer del trace e chiude lo store.
+        """
+        if self.tracer is not None:
+            self.tracer.flush()
+        if self.store is not None:
+            self.store.close()
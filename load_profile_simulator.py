@@ -16,9 +16,14 @@
 # le quantità scambiate sono quelle del singolo agente.
 
 import itertools
-import pandas as pd
 import mosaik_api_v3
 
+from entity_params import expand_params, unique_eid
+from profile_stream import DEFAULT_CHUNK_ROWS, open_profile_store
+from sim_profiling import SimProfilingMixin
+from sim_trace import make_tracer
+from time_axis import DA_HORIZON, DEFAULT_RESOLUTION, TimeAxis
+
 
 # -------------------------------------------------------------------
 # META-DATA MOSAIK
@@ -40,7 +45,8 @@ META = {
 
             # Parametri assegnati alla creazione dell'entità
             "params": [
-                "profile_id",  # nome della colonna del CSV
+                "profile_id",   # nome della colonna del CSV
+                "profile_ids",  # lista di colonne: una entità per valore
             ],
 
             # Attributi dinamici prodotti a ogni step
@@ -52,7 +58,7 @@ META = {
 }
 
 
-class LoadProfileSimulator(mosaik_api_v3.Simulator):
+class LoadProfileSimulator(SimProfilingMixin, mosaik_api_v3.Simulator):
     """
     Simulatore mosaik per profili di carico orari.
 
@@ -74,8 +80,14 @@ class LoadProfileSimulator(mosaik_api_v3.Simulator):
         # Dimensione dello step temporale (secondi)
         self.step_size = None
 
-        # DataFrame con i dati orari (8760 righe)
-        self.data = None
+        # Profili orari condivisi (ProfileStore, 8760 righe)
+        self.store = None
+
+        # Tracer per il logging degli step (creato in init)
+        self.tracer = None
+
+        # Asse temporale dati -> step (creato in init)
+        self.axis = None
 
         # Stato interno delle entità: eid -> dict
         self.entities = {}
@@ -89,7 +101,8 @@ class LoadProfileSimulator(mosaik_api_v3.Simulator):
     # ----------------------------------------------------------------
     # INIT
     # ----------------------------------------------------------------
-    def init(self, sid, csv_path, step_size=3600, **kwargs):
+    def init(self, sid, csv_path, step_size=3600, binary=True, stream=False, chunk_rows=DEFAULT_CHUNK_ROWS,
+             lazy=True, data_resolution=DEFAULT_RESOLUTION, interpolation="hold", **kwargs):
         """
         Inizializzazione del simulatore.
         - Carica CSV
@@ -99,31 +112,19 @@ class LoadProfileSimulator(mosaik_api_v3.Simulator):
         self.sid = sid
         self.step_size = step_size
 
-        # Caricamento CSV (pandas legge automaticamente la prima riga come intestazione)
-        df = pd.read_csv(csv_path)
-
-        # Rimuove eventuali righe completamente vuote
-        df = df.dropna(how="all")
+        # Profili condivisi (CSV letto una sola volta per processo,
+        # con binary=True mappato in memoria dal formato binario);
+        # stream=True legge il CSV a blocchi di chunk_rows righe;
+        # lazy=True carica solo le colonne dei profile_id usati nelle create
+        self.store = open_profile_store(csv_path, binary=binary, stream=stream, chunk_rows=chunk_rows,
+                                        lazy=lazy, resolution=data_resolution)
 
-        # Controllo: 8760 righe (ore), 10 colonne (profili 0–9)
-        # Se ci sono 8761 righe → la prima è identificativa
-        if len(df) == 8761:
-            df = df.iloc[1:].reset_index(drop=True)
+        # Asse temporale: risoluzione dei dati vs step della simulazione
+        # (interpolazione per step più brevi, media per step più lunghi)
+        self.axis = TimeAxis(step_size, data_resolution, interpolation)
 
-        # Se ce n'è una in meno (caso reale che stai vedendo)
-        elif len(df) == 8759:
-            raise ValueError(
-                "CSV ha 8759 righe: manca un'ora. "
-                "Controlla DST o dati mancanti."
-            )
-
-        if len(df) != 8760:
-            raise ValueError(
-                f"Numero righe inatteso: {len(df)} (atteso 8760)"
-            )
-
-        # Salva i dati
-        self.data = df.astype(float)
+        # Logging per step (disattivato di default, vedi sim_trace.py)
+        self.tracer = make_tracer(sid, **kwargs)
 
         return META
 
@@ -140,13 +141,14 @@ class LoadProfileSimulator(mosaik_api_v3.Simulator):
         """
 
         entities = []
-        profile_id = model_params["profile_id"]
+        profile_ids = expand_params(num, model_params)["profile_id"]
 
-        for _ in range(num):
-            eid = f"Home_{profile_id}"
+        for profile_id in profile_ids:
+            eid = unique_eid(f"Home_{profile_id}", self.entities, self.eid_counter)
 
             self.entities[eid] = {
                 "profile_id": profile_id,
+                "col": self.store.column_index(profile_id),
                 "P_load_DA+24h[kW]": 0.0,
             }
 
@@ -166,28 +168,28 @@ class LoadProfileSimulator(mosaik_api_v3.Simulator):
         Aggiornamento dello stato a ogni step temporale.
 
         - time è espresso in secondi dall'inizio simulazione
-        - 1 step = 1 ora
+        - step e risoluzione dei dati raccordati da TimeAxis (time_axis.py)
         - il valore viene letto dal CSV e convertito in kW
         """
 
-        # Conversione tempo mosaik → indice orario
-        hour_idx = int(time // self.step_size) % len(self.data)
+        # Conversione tempo mosaik → riga dei dati
+        hour_idx = self.axis.row_index(time) % len(self.store)
 
         self.cache = {}
 
         for eid, ent in self.entities.items():
-            profile = ent["profile_id"]
+            col = ent["col"]
 
             # Consumo Day-Ahead t+24h
-            future_idx = (hour_idx + 24) % len(self.data)
-            p_kw_da = self.data.iloc[future_idx][profile] / 1000.0
+            p_kw_da = self.axis.sample(self.store, time + DA_HORIZON, col) / 1000.0
             ent["P_load_DA[kW]"] = p_kw_da
 
-            print(f"[Load] time={time}, eid={eid}, step_idx={hour_idx}, "
-                  f"t+24h_idx={future_idx}, P_load_DA={p_kw_da:.3f} kW")
-
             self.cache[eid] =  p_kw_da
 
+        if self.tracer.enabled and self.tracer.sample():
+            self.tracer.record(time, list(self.cache.values()), eids=self.cache,
+                               hour_idx=hour_idx)
+
         # Richiesta del prossimo step
         return time + self.step_size
 
@@ -209,3 +211,15 @@ class LoadProfileSimulator(mosaik_api_v3.Simulator):
                     data[eid][attr] = self.cache.get(eid, 0.0)
 
         return data
+
+    # ----------------------------------------------------------------
+    # FINALIZE
+    # ----------------------------------------------------------------
+    def finalize(self):
+        """
+        Fine simulazione: svuota i buffer del trace e chiude lo store.
+        """
+        if self.tracer is not None:
+            self.tracer.flush()
+        if self.store is not None:
+            self.store.close()
@@ -0,0 +1,181 @@
+# offchain_clearing.py
+#
+# Motore di clearing off-chain per il mercato Day-Ahead.
+#
+# Gli ordini di uno slot vengono abbinati in Python, senza una
+# transazione per ordine; sulla blockchain va solo il risultato
+# (una transazione di settlement con la Merkle root dei trade).
+#
+# Regole disponibili:
+# - "price_time": book con heap, priorità prezzo-tempo; ogni trade
+#   avviene al prezzo dell'ordine arrivato prima (resting order)
+# - "uniform": asta a prezzo uniforme; tutti i trade al prezzo di
+#   equilibrio (media tra bid e ask marginali)
+#
+# I trade hanno lo stesso formato di getTrades del contratto:
+#   (seller, buyer, kwh, price_wei, timestamp)
+
+import heapq
+from collections import namedtuple
+from web3 import Web3
+
+
+# Ordine di uno slot: seq = ordine di arrivo (priorità temporale)
+Order = namedtuple("Order", ["account", "is_sell", "kwh", "price_wei", "seq"])
+
+# Tolleranza sulle quantità residue (kWh)
+QTY_EPS = 1e-12
+
+
+class OrderBook:
+    """
+    Book di uno slot con due heap:
+    - bids: prezzo decrescente, poi arrivo
+    - asks: prezzo crescente, poi arrivo
+    """
+
+    def __init__(self):
+        self.bids = []
+        self.asks = []
+        self.seq = 0
+
+    def add(self, account, is_sell, kwh, price_wei):
+        if kwh <= QTY_EPS:
+            return None
+        order = Order(account, is_sell, kwh, price_wei, self.seq)
+        self.seq += 1
+        if is_sell:
+            heapq.heappush(self.asks, (price_wei, order.seq, order))
+        else:
+            heapq.heappush(self.bids, (-price_wei, order.seq, order))
+        return order
+
+    def orders(self):
+        return [o for _, _, o in self.bids] + [o for _, _, o in self.asks]
+
+
+def match_price_time(book, timestamp=0):
+    """
+    Abbina il book con priorità prezzo-tempo.
+    Consuma il book; restituisce la lista dei trade.
+    """
+    trades = []
+    bids, asks = book.bids, book.asks
+
+    while bids and asks and -bids[0][0] >= asks[0][0]:
+        _, _, bid = bids[0]
+        _, _, ask = asks[0]
+
+        qty = min(bid.kwh, ask.kwh)
+        price = bid.price_wei if bid.seq < ask.seq else ask.price_wei
+        trades.append((ask.account, bid.account, qty, price, timestamp))
+
+        _consume(bids, bid, qty)
+        _consume(asks, ask, qty)
+
+    return trades
+
+
+def clear_uniform_price(book, timestamp=0):
+    """
+    Asta a prezzo uniforme sul book dello slot.
+    Consuma il book; restituisce la lista dei trade, tutti allo stesso prezzo.
+    """
+    bids = [heapq.heappop(book.bids)[2] for _ in range(len(book.bids))]
+    asks = [heapq.heappop(book.asks)[2] for _ in range(len(book.asks))]
+
+    # Quantità scambiabile: si scorrono le curve finché bid >= ask
+    pairs = []
+    bi = ai = 0
+    bid_left = bids[0].kwh if bids else 0.0
+    ask_left = asks[0].kwh if asks else 0.0
+    while bi < len(bids) and ai < len(asks) and bids[bi].price_wei >= asks[ai].price_wei:
+        qty = min(bid_left, ask_left)
+        pairs.append((asks[ai], bids[bi], qty))
+        bid_left -= qty
+        ask_left -= qty
+        if bid_left <= QTY_EPS:
+            bi += 1
+            bid_left = bids[bi].kwh if bi < len(bids) else 0.0
+        if ask_left <= QTY_EPS:
+            ai += 1
+            ask_left = asks[ai].kwh if ai < len(asks) else 0.0
+
+    if not pairs:
+        return []
+
+    # Prezzo di equilibrio: media tra l'ultimo bid e l'ultimo ask abbinati
+    last_ask, last_bid, _ = pairs[-1]
+    price = (last_ask.price_wei + last_bid.price_wei) // 2
+
+    return [(ask.account, bid.account, qty, price, timestamp) for ask, bid, qty in pairs]
+
+
+CLEARING_RULES = {
+    "price_time": match_price_time,
+    "uniform": clear_uniform_price,
+}
+
+
+def clear_slot(orders, rule="uniform", timestamp=0):
+    """
+    Clearing di uno slot.
+
+    orders: iterabile di (account, is_sell, kwh, price_wei)
+    """
+    try:
+        clear = CLEARING_RULES[rule]
+    except KeyError:
+        raise ValueError(f"Regola di clearing non valida: {rule}") from None
+
+    book = OrderBook()
+    for account, is_sell, kwh, price_wei in orders:
+        book.add(account, is_sell, kwh, price_wei)
+    return clear(book, timestamp)
+
+
+def _consume(heap, order, qty):
+    left = order.kwh - qty
+    if left <= QTY_EPS:
+        heapq.heappop(heap)
+    else:
+        key = heap[0][0]
+        heapq.heapreplace(heap, (key, order.seq, order._replace(kwh=left)))
+
+
+# -------------------------------------------------------------------
+# MERKLE ROOT DEI TRADE
+# -------------------------------------------------------------------
+def trade_leaf(trade):
+    """
+    Foglia di un trade: keccak256(abi.encodePacked(seller, buyer, Wh, price_wei, ts)).
+    Le quantità sono codificate in Wh interi.
+    """
+    seller, buyer, kwh, price_wei, ts = trade
+    return Web3.solidity_keccak(
+        ["address", "address", "uint256", "uint256", "uint256"],
+        [Web3.to_checksum_address(seller), Web3.to_checksum_address(buyer),
+         int(round(kwh * 1000)), int(price_wei), int(ts)],
+    )
+
+
+def merkle_root(trades):
+    """
+    Merkle root (keccak256, coppie ordinate come OpenZeppelin MerkleProof)
+    dei trade di uno slot; 32 byte nulli se non ci sono trade.
+    """
+    level = [trade_leaf(t) for t in trades]
+    if not level:
+        return b"\x00" * 32
+
+    while len(level) > 1:
+        nxt = []
+        for i in range(0, len(level), 2):
+            if i + 1 == len(level):
+                nxt.append(level[i])
+                continue
+            a, b = sorted((level[i], level[i + 1]))
+            nxt.append(Web3.keccak(a + b))
+        level = nxt
+
+    return bytes(level[0])
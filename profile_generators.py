@@ -0,0 +1,117 @@
+# profile_generators.py
+#
+# Generatori vettorizzati dei profili sintetici usati dagli script
+# *_csv_creator.py.
+#
+# Ogni generatore lavora su array interi (ore × profili):
+# - i pesi orari gaussiani sono calcolati una sola volta (vettore di 24)
+# - tutte le estrazioni casuali sono array della stessa forma dei dati
+# - le modifiche sono applicate con np.where, senza cicli Python
+#
+# Le estrazioni usano un np.random.Generator: a parità di seed (e di
+# forma dei dati) il risultato è riproducibile.
+
+import numpy as np
+
+
+# Ore in un giorno (periodo dei pesi orari)
+HOURS_PER_DAY = 24
+
+# Parametri delle deviazioni Real-Time dei consumi
+RT_CHANGE_PROB = 0.10     # probabilità di modifica di una cella
+RT_PEAK_HOUR = 15.5       # picco alle 15-16
+RT_PEAK_WIDTH = 2.0       # larghezza della curva
+RT_MAX_INCREASE = 2000.0  # aumento massimo (W) all'ora di picco
+
+# Parametri della previsione PV Day-Ahead
+PV_PEAK_HOUR = 12.0       # picco a mezzogiorno
+PV_PEAK_WIDTH = 2.0       # larghezza della curva
+PV_CAPACITY = 5000.0      # produzione massima (W) all'ora di picco
+PV_DECIMALS = 1           # precisione 0.1 W
+
+
+def hour_weights(mu, sigma):
+    """
+    Pesi gaussiani delle 24 ore del giorno:
+    w[h] = exp(-(h - mu)^2 / (2 sigma^2))
+
+    Con mu/sigma vettori (uno per profilo) restituisce una tabella (24 × profili).
+    """
+    hours = np.arange(HOURS_PER_DAY, dtype=np.float64)
+    if np.ndim(mu) or np.ndim(sigma):
+        hours = hours[:, None]
+    return np.exp(-((hours - mu) ** 2) / (2 * np.square(sigma)))
+
+
+def per_profile(value, n_profiles, name):
+    """
+    Parametro scalare o per profilo -> vettore float64 di lunghezza n_profiles.
+    """
+    arr = np.asarray(value, dtype=np.float64)
+    if arr.ndim == 0:
+        return np.full(n_profiles, float(arr))
+    if arr.shape != (n_profiles,):
+        raise ValueError(f"{name}: attesi {n_profiles} valori, trovati {arr.shape}")
+    return arr
+
+
+def row_weights(n_rows, mu, sigma, start_hour=0):
+    """
+    Peso gaussiano di ogni riga oraria, come colonna (n_rows, 1)
+    pronta per il broadcasting sui profili.
+    """
+    hours = (np.arange(n_rows) + start_hour) % HOURS_PER_DAY
+    return hour_weights(mu, sigma)[hours][:, None]
+
+
+def generate_rt_profiles(da_values, p=RT_CHANGE_PROB, mu=RT_PEAK_HOUR, sigma=RT_PEAK_WIDTH,
+                         max_increase=RT_MAX_INCREASE, seed=None, start_hour=0):
+    """
+    Consumi Real-Time ottenuti perturbando i consumi Day-Ahead.
+
+    da_values: array (ore × profili) dei consumi DA in W
+    seed: intero, np.random.Generator oppure None (non riproducibile)
+
+    Ogni cella viene modificata con probabilità p; se modificata,
+    con probabilità 0.5:
+    - aumenta di uniform(0, max_increase * w)
+    - diminuisce di uniform(0, x * w)
+    con w peso gaussiano dell'ora. Restituisce un nuovo array float64.
+    """
+    x = np.asarray(da_values, dtype=np.float64)
+    rng = np.random.default_rng(seed)
+
+    w = row_weights(x.shape[0], mu, sigma, start_hour)
+
+    modify = rng.random(x.shape) < p
+    up = rng.random(x.shape) < 0.5
+    u = rng.random(x.shape)
+
+    # uniform(0, a) = a * u
+    delta = np.where(up, u * (max_increase * w), -u * (x * w))
+    return np.where(modify, x + delta, x)
+
+
+def generate_pv_da_profiles(n_rows, n_profiles, mu=PV_PEAK_HOUR, sigma=PV_PEAK_WIDTH, capacity=PV_CAPACITY,
+                            seed=None, start_hour=0, decimals=PV_DECIMALS):
+    """
+    Previsioni PV Day-Ahead (ore × profili) in W, in un solo passaggio.
+
+    mu, sigma, capacity: scalari oppure un valore per profilo
+    seed: intero, np.random.Generator oppure None (non riproducibile)
+
+    Ogni cella vale uniform(0, capacity * w), con w peso gaussiano
+    dell'ora per il profilo, arrotondata a `decimals` cifre.
+    """
+    mu = per_profile(mu, n_profiles, "mu")
+    sigma = per_profile(sigma, n_profiles, "sigma")
+    capacity = per_profile(capacity, n_profiles, "capacity")
+    rng = np.random.default_rng(seed)
+
+    # Tabella (24 × profili) dei massimi orari, poi una riga per ora
+    max_production = hour_weights(mu, sigma) * capacity
+    hours = (np.arange(n_rows) + start_hour) % HOURS_PER_DAY
+
+    values = rng.random((n_rows, n_profiles))
+    values *= max_production[hours]
+    return np.round(values, decimals, out=values)
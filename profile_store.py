@@ -0,0 +1,383 @@
+# profile_store.py
+#
+# Archivio condiviso dei profili orari letti dai CSV.
+#
+# Ogni CSV viene letto UNA sola volta per processo e convertito in un
+# array NumPy float64 contiguo indicizzato da (ora, colonna profilo).
+# L'array è in ordine column-major: ogni profilo è contiguo in memoria.
+#
+# Tutti i simulatori che puntano allo stesso csv_path condividono
+# la stessa istanza di ProfileStore: le letture nello step sono
+# semplici accessi per indice, senza costruire righe pandas.
+#
+# Formato binario:
+# - alla prima lettura il CSV viene convertito in un file .npy
+#   (float64, column-major) con un header JSON a fianco
+#   (righe, colonne, unità, impronta del CSV sorgente)
+# - le esecuzioni successive mappano il .npy in memoria (memmap)
+#   invece di rifare il parsing testuale del CSV
+# - se il CSV cambia (dimensione o mtime), il binario viene ricostruito
+# - i generatori di profili possono scrivere direttamente il binario
+#   (write_binary); un percorso .npy si apre come un CSV
+#
+# Conversione manuale:
+#   python profile_store.py csv_data/*.csv
+
+import argparse
+import json
+import os
+import numpy as np
+import pandas as pd
+
+
+# Numero di ore attese in un anno di dati
+HOURS_PER_YEAR = 8760
+
+# Risoluzione dei dati di default (s): profili orari
+SECONDS_PER_HOUR = 3600
+
+# Cartella (accanto al CSV) che contiene i file binari convertiti
+BINARY_DIR = ".profile_cache"
+
+# Versione del formato binario (header JSON)
+BINARY_FORMAT_VERSION = 1
+
+# Cache di processo degli store completi: (percorso assoluto del CSV, binario?, risoluzione) -> ProfileStore
+_STORES = {}
+
+
+class ProfileStore:
+    """
+    Profili orari in un array NumPy (ore × profili).
+
+    - values: array float64 column-major, shape (ore, colonne)
+      (ndarray in memoria oppure np.memmap sul file binario)
+    - columns: nomi delle colonne del CSV (profile_id)
+    - units: unità di misura dei valori (es. "W")
+    """
+
+    def __init__(self, values, columns, source=None, units="W"):
+        self.values = values
+        self.columns = [str(c) for c in columns]
+        self.source = source
+        self.units = units
+
+        # Nome colonna -> indice di colonna nell'array
+        self.col_index = {c: i for i, c in enumerate(self.columns)}
+
+    def __len__(self):
+        return self.values.shape[0]
+
+    def row(self, idx, cols):
+        """
+        Valori della riga idx per gli indici di colonna cols.
+        """
+        return self.values[idx, cols]
+
+    def take(self, cols):
+        """
+        Colonne cols per tutte le righe (copia ore × len(cols)).
+        """
+        return self.values[:, cols]
+
+    def close(self):
+        """
+        Nulla da rilasciare: lo store è condiviso per tutto il processo.
+        """
+
+    def select(self, profile_ids):
+        """
+        Nuovo ProfileStore in memoria con le sole colonne profile_ids.
+        Su un memmap column-major ogni colonna è contigua: vengono lette
+        solo le pagine del file che contengono le colonne scelte.
+        """
+        idx = self.column_indices(profile_ids)
+        values = np.asfortranarray(self.values[:, idx], dtype=np.float64)
+        return ProfileStore(values, profile_ids, source=self.source, units=self.units)
+
+    def column_index(self, profile_id):
+        """
+        Indice di colonna associato a un profile_id.
+        """
+        try:
+            return self.col_index[str(profile_id)]
+        except KeyError:
+            raise KeyError(
+                f"Profilo '{profile_id}' non presente in {self.source}"
+            ) from None
+
+    def column_indices(self, profile_ids):
+        """
+        Indici di colonna per una lista di profile_id (array intp).
+        """
+        return np.array(
+            [self.column_index(pid) for pid in profile_ids],
+            dtype=np.intp,
+        )
+
+
+# -------------------------------------------------------------------
+# LETTURA CSV
+# -------------------------------------------------------------------
+def read_profile_columns(csv_path):
+    """
+    Nomi delle colonne del CSV (solo l'header, senza leggere i dati).
+    """
+    return [str(c) for c in pd.read_csv(csv_path, nrows=0).columns]
+
+
+def expected_rows(resolution=SECONDS_PER_HOUR):
+    """
+    Righe attese per un anno di dati con la risoluzione data (s):
+    8760 per dati orari, 35040 per dati a 15 minuti.
+    """
+    return HOURS_PER_YEAR * SECONDS_PER_HOUR // resolution
+
+
+def read_profile_csv(csv_path, usecols=None, resolution=SECONDS_PER_HOUR):
+    """
+    Legge un CSV di profili e ne verifica la consistenza.
+
+    - usecols: legge solo queste colonne (più la prima, l'indice dell'ora,
+      che serve a riconoscere le righe vuote come nella lettura completa)
+    - rimuove le righe completamente vuote
+    - resolution: intervallo tra due righe (s); le righe attese sono
+      expected_rows(resolution), es. 8760 per dati orari
+    - con una riga in più, la prima è identificativa e viene scartata
+    """
+    if usecols is None:
+        df = pd.read_csv(csv_path)
+    else:
+        usecols = [str(c) for c in usecols]
+        first = read_profile_columns(csv_path)[0]
+        df = pd.read_csv(csv_path, usecols=[first] + [c for c in usecols if c != first])
+    df = df.dropna(how="all")
+
+    n = expected_rows(resolution)
+    if len(df) == n + 1:
+        df = df.iloc[1:].reset_index(drop=True)
+    elif resolution <= SECONDS_PER_HOUR and len(df) == n - SECONDS_PER_HOUR // resolution:
+        raise ValueError(
+            f"CSV {csv_path} ha {len(df)} righe: manca un'ora "
+            "(DST o dato mancante)"
+        )
+
+    if len(df) != n:
+        raise ValueError(
+            f"Numero righe inatteso in {csv_path}: {len(df)} (atteso {n})"
+        )
+
+    if usecols is not None:
+        df = df[usecols]
+    return df
+
+
+# -------------------------------------------------------------------
+# FORMATO BINARIO
+# -------------------------------------------------------------------
+def binary_paths(csv_path, out_dir=None):
+    """
+    Percorsi (.npy, .json) del binario associato a csv_path.
+    """
+    if out_dir is None:
+        out_dir = os.path.join(os.path.dirname(os.path.abspath(csv_path)), BINARY_DIR)
+    name = os.path.splitext(os.path.basename(csv_path))[0]
+    base = os.path.join(out_dir, name)
+    return base + ".npy", base + ".json"
+
+
+def csv_fingerprint(csv_path):
+    """
+    Impronta del CSV sorgente: dimensione e mtime (ns).
+
+    Economica da calcolare (solo stat) e sufficiente per
+    accorgersi di un CSV rigenerato o modificato.
+    """
+    st = os.stat(csv_path)
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def write_binary(values, columns, npy_path, units="W", source=None, fingerprint=None):
+    """
+    Scrive un array (ore × colonne) nel formato binario:
+    - <nome>.npy: array float64 column-major
+    - <nome>.json: header con righe, colonne, unità e impronta della sorgente
+
+    I file vengono scritti su un temporaneo e poi rinominati,
+    così un lettore concorrente non vede mai un file a metà.
+    """
+    header_path = os.path.splitext(npy_path)[0] + ".json"
+    os.makedirs(os.path.dirname(os.path.abspath(npy_path)), exist_ok=True)
+
+    values = np.asfortranarray(values, dtype=np.float64)
+
+    header = {
+        "version": BINARY_FORMAT_VERSION,
+        "rows": int(values.shape[0]),
+        "columns": [str(c) for c in columns],
+        "units": units,
+        "dtype": "float64",
+        "source": source,
+        "fingerprint": fingerprint,
+    }
+
+    tmp_npy = f"{npy_path}.{os.getpid()}.tmp"
+    with open(tmp_npy, "wb") as f:
+        np.save(f, values)
+    os.replace(tmp_npy, npy_path)
+
+    # L'header viene scritto per ultimo: fa da marcatore di validità
+    tmp_header = f"{header_path}.{os.getpid()}.tmp"
+    with open(tmp_header, "w") as f:
+        json.dump(header, f, indent=2)
+    os.replace(tmp_header, header_path)
+
+    return npy_path
+
+
+def convert_csv_to_binary(csv_path, out_dir=None, units="W", resolution=SECONDS_PER_HOUR):
+    """
+    Converte un CSV di profili nel formato binario (vedi write_binary).
+    Restituisce il percorso del file .npy.
+    """
+    npy_path, _ = binary_paths(csv_path, out_dir)
+    df = read_profile_csv(csv_path, resolution=resolution)
+    return write_binary(df.to_numpy(dtype=np.float64), df.columns, npy_path, units=units,
+                        source=os.path.basename(csv_path), fingerprint=csv_fingerprint(csv_path))
+
+
+def read_binary_header(csv_path, out_dir=None):
+    """
+    Header del binario associato a csv_path, oppure None
+    se il binario manca o non corrisponde più al CSV.
+    """
+    npy_path, header_path = binary_paths(csv_path, out_dir)
+    if not (os.path.exists(npy_path) and os.path.exists(header_path)):
+        return None
+
+    try:
+        with open(header_path) as f:
+            header = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if header.get("version") != BINARY_FORMAT_VERSION:
+        return None
+    if header.get("fingerprint") != csv_fingerprint(csv_path):
+        return None
+
+    return header
+
+
+def open_binary_store(csv_path, out_dir=None, resolution=SECONDS_PER_HOUR):
+    """
+    ProfileStore mappato in memoria sul binario di csv_path.
+
+    Il binario viene (ri)costruito se manca o se il CSV è cambiato.
+    """
+    header = read_binary_header(csv_path, out_dir)
+    if header is None:
+        convert_csv_to_binary(csv_path, out_dir, resolution=resolution)
+        header = read_binary_header(csv_path, out_dir)
+    elif header["rows"] != expected_rows(resolution):
+        # Binario convertito in precedenza: stesso controllo del CSV
+        raise ValueError(
+            f"Numero righe inatteso in {csv_path}: {header['rows']} (atteso {expected_rows(resolution)})"
+        )
+
+    npy_path, _ = binary_paths(csv_path, out_dir)
+    return open_binary_file(npy_path, header, source=csv_path)
+
+
+def open_binary_file(npy_path, header=None, source=None):
+    """
+    ProfileStore mappato in memoria su un file .npy del formato binario
+    (anche scritto direttamente da un generatore, senza CSV sorgente).
+    """
+    if header is None:
+        with open(os.path.splitext(npy_path)[0] + ".json") as f:
+            header = json.load(f)
+        if header.get("version") != BINARY_FORMAT_VERSION:
+            raise ValueError(f"Versione del binario {npy_path} non supportata: {header.get('version')}")
+
+    values = np.load(npy_path, mmap_mode="r")
+
+    if values.shape != (header["rows"], len(header["columns"])):
+        raise ValueError(
+            f"Binario {npy_path} non coerente con l'header: {values.shape}"
+        )
+
+    return ProfileStore(values, header["columns"], source=source or npy_path, units=header["units"])
+
+
+# -------------------------------------------------------------------
+# ACCESSO CONDIVISO
+# -------------------------------------------------------------------
+def load_profile_store(csv_path, binary=True, columns=None, resolution=SECONDS_PER_HOUR):
+    """
+    Restituisce il ProfileStore condiviso per csv_path.
+
+    - binary=True: usa (e se serve crea) il binario memmap
+    - binary=False: legge il CSV in memoria con pandas
+    - un percorso .npy viene aperto direttamente come binario
+    - columns: carica in memoria solo queste colonne (slice delle colonne
+      del memmap, oppure usecols sul CSV)
+    - resolution: intervallo tra le righe (s), per il controllo delle righe
+
+    Il file viene aperto solo alla prima richiesta; le chiamate
+    successive (anche da altri simulatori) riusano lo stesso array.
+    In cache vanno solo gli store completi: un sottoinsieme di colonne
+    è una copia del chiamante, ricavata ogni volta dallo store completo
+    (o con usecols dal CSV) e mai memorizzata.
+    """
+    key = (os.path.realpath(csv_path), binary, resolution)
+
+    store = _STORES.get(key)
+    if store is None and csv_path.endswith(".npy"):
+        store = _STORES[key] = open_binary_file(csv_path)
+    elif store is None and binary:
+        try:
+            store = _STORES[key] = open_binary_store(csv_path, resolution=resolution)
+        except OSError:
+            # Cartella non scrivibile: ripiega sul parsing del CSV
+            store = None
+
+    if columns is not None:
+        columns = [str(c) for c in columns]
+        if store is not None:
+            return store.select(columns)
+        df = read_profile_csv(csv_path, usecols=columns, resolution=resolution)
+        values = np.asfortranarray(df.to_numpy(dtype=np.float64))
+        return ProfileStore(values, df.columns, source=csv_path)
+
+    if store is None:
+        df = read_profile_csv(csv_path, resolution=resolution)
+        values = np.asfortranarray(df.to_numpy(dtype=np.float64))
+        store = _STORES[key] = ProfileStore(values, df.columns, source=csv_path)
+
+    return store
+
+
+# -------------------------------------------------------------------
+# CLI: conversione una tantum dei CSV
+# -------------------------------------------------------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Converte CSV di profili orari nel formato binario memmap."
+    )
+    parser.add_argument("csv_paths", nargs="+", help="CSV da convertire")
+    parser.add_argument("--out-dir", default=None,
+                        help=f"cartella di destinazione (default: <dir CSV>/{BINARY_DIR})")
+    parser.add_argument("--units", default="W", help="unità dei valori (default: W)")
+    parser.add_argument("--resolution", type=int, default=SECONDS_PER_HOUR,
+                        help="intervallo tra le righe in secondi (default: 3600)")
+    parser.add_argument("--force", action="store_true",
+                        help="riconverte anche se il binario è aggiornato")
+    args = parser.parse_args()
+
+    for path in args.csv_paths:
+        if not args.force and read_binary_header(path, args.out_dir) is not None:
+            print(f"{path}: binario aggiornato, nessuna conversione")
+            continue
+        npy_path = convert_csv_to_binary(path, args.out_dir, units=args.units, resolution=args.resolution)
+        print(f"{path} -> {npy_path}")
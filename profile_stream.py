@@ -0,0 +1,310 @@
+# profile_stream.py
+#
+# Lettura in streaming dei CSV di profili troppo grandi per la RAM
+# (più anni, risoluzione sub-oraria, decine di migliaia di profili).
+#
+# Il CSV viene letto a blocchi di righe (pd.read_csv con chunksize e
+# usecols) da un thread in background, che prepara i blocchi successivi
+# mentre la simulazione usa quello corrente (prefetch).
+#
+# In memoria resta solo una finestra scorrevole di blocchi: quelli che
+# coprono le righe da (ultima richiesta - lookback) in avanti. Con
+# lookback=24 un simulatore può leggere sia hour_idx sia hour_idx+24.
+#
+# StreamingProfileStore espone la stessa interfaccia di lettura di
+# ProfileStore (columns, column_indices, len, row, close): i simulatori
+# la scelgono con init(stream=True), tramite open_profile_store.
+#
+# Caricamento selettivo delle colonne: LazyProfileStore registra i
+# profile_id richiesti nelle create e alla prima lettura apre uno store
+# con le sole colonne usate (slice del memmap, usecols sul CSV o sul
+# reader in streaming), invece di tutte le colonne del file.
+
+import queue
+import threading
+import numpy as np
+import pandas as pd
+
+from profile_store import SECONDS_PER_HOUR, expected_rows, load_profile_store, read_profile_columns
+
+
+# Righe per blocco (una settimana di dati orari)
+DEFAULT_CHUNK_ROWS = 24 * 7
+
+# Blocchi preparati in anticipo dal thread di lettura
+DEFAULT_PREFETCH = 2
+
+# Righe precedenti l'ultima lettura da tenere in memoria
+DEFAULT_LOOKBACK = 24
+
+
+def count_rows(csv_path):
+    """
+    Numero di righe di dati (non vuote, header escluso) del CSV,
+    contate leggendo il file in binario, senza parsing.
+    """
+    n = 0
+    with open(csv_path, "rb") as f:
+        next(f, None)
+        for line in f:
+            if line.strip():
+                n += 1
+    return n
+
+
+class StreamingProfileStore:
+    """
+    Profili orari letti a blocchi dal CSV, con prefetch in background.
+
+    - columns: colonne lette (tutte, oppure usecols)
+    - row(idx, cols): valori della riga idx per gli indici di colonna cols
+
+    Le letture devono essere (quasi) sequenziali: tornare indietro oltre
+    la finestra, o ricominciare dopo l'ultima riga, fa ripartire la
+    lettura del file dal blocco richiesto.
+    """
+
+    def __init__(self, csv_path, usecols=None, chunk_rows=DEFAULT_CHUNK_ROWS, prefetch=DEFAULT_PREFETCH,
+                 lookback=DEFAULT_LOOKBACK, units="W", resolution=SECONDS_PER_HOUR):
+        self.source = csv_path
+        self.units = units
+        self.chunk_rows = chunk_rows
+        self.prefetch = prefetch
+        self.lookback = lookback
+
+        header = [str(c) for c in pd.read_csv(csv_path, nrows=0).columns]
+        self.columns = header if usecols is None else [str(c) for c in usecols]
+        missing = set(self.columns) - set(header)
+        if missing:
+            raise KeyError(f"Colonne non presenti in {csv_path}: {sorted(missing)}")
+        self.col_index = {c: i for i, c in enumerate(self.columns)}
+
+        # Stessa regola di read_profile_csv: con una riga in più la prima è identificativa
+        n_rows = count_rows(csv_path)
+        self.skip_first = n_rows == expected_rows(resolution) + 1
+        self.n_rows = n_rows - self.skip_first
+
+        # Finestra residente: indice di blocco -> array (righe × colonne)
+        self.window = {}
+
+        # Thread di lettura corrente
+        self.reader = None
+        self.chunks = None
+        self.stop = None
+        self.next_chunk = 0
+
+    def __len__(self):
+        return self.n_rows
+
+    def column_index(self, profile_id):
+        try:
+            return self.col_index[str(profile_id)]
+        except KeyError:
+            raise KeyError(
+                f"Profilo '{profile_id}' non presente in {self.source}"
+            ) from None
+
+    def column_indices(self, profile_ids):
+        return np.array(
+            [self.column_index(pid) for pid in profile_ids],
+            dtype=np.intp,
+        )
+
+    def row(self, idx, cols):
+        """
+        Valori della riga idx per gli indici di colonna cols.
+        """
+        k, offset = divmod(idx, self.chunk_rows)
+        values = self.chunk(k)[offset, cols]
+
+        # Finestra scorrevole: scarta i blocchi interamente prima di idx - lookback
+        first = max(idx - self.lookback, 0) // self.chunk_rows
+        for old in [c for c in self.window if c < first]:
+            del self.window[old]
+
+        return values
+
+    # ------------------------
+    # Blocchi e prefetch
+    # ------------------------
+    def chunk(self, k):
+        """
+        Blocco k della finestra; se manca viene preso dal thread di lettura.
+        """
+        data = self.window.get(k)
+        if data is not None:
+            return data
+
+        if self.reader is None or k < self.next_chunk:
+            self.restart(k)
+
+        while self.next_chunk <= k:
+            data = self.chunks.get()
+            if isinstance(data, Exception):
+                self.close()
+                raise data
+            if data is None:
+                raise IndexError(f"Riga {k * self.chunk_rows} oltre la fine di {self.source}")
+            self.window[self.next_chunk] = data
+            self.next_chunk += 1
+
+        return self.window[k]
+
+    def restart(self, k):
+        """
+        (Ri)avvia la lettura del file a partire dal blocco k.
+        """
+        self.close()
+        self.window.clear()
+
+        self.chunks = queue.Queue(maxsize=self.prefetch)
+        self.stop = threading.Event()
+        self.next_chunk = k
+        self.reader = threading.Thread(target=self._read, args=(k, self.chunks, self.stop), daemon=True)
+        self.reader.start()
+
+    def _read(self, first_chunk, chunks, stop):
+        """
+        Thread di lettura: mette in coda i blocchi dal first_chunk in poi,
+        poi None a fine file (o l'eccezione, in caso di errore).
+        """
+        skip = int(self.skip_first) + first_chunk * self.chunk_rows
+        try:
+            reader = pd.read_csv(
+                self.source,
+                usecols=self.columns,
+                skiprows=range(1, skip + 1),
+                chunksize=self.chunk_rows,
+            )
+            with reader:
+                for df in reader:
+                    data = np.asfortranarray(df[self.columns].to_numpy(dtype=np.float64))
+                    if not self._put(chunks, data, stop):
+                        return
+            self._put(chunks, None, stop)
+        except Exception as e:
+            self._put(chunks, e, stop)
+
+    @staticmethod
+    def _put(chunks, item, stop):
+        while not stop.is_set():
+            try:
+                chunks.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def close(self):
+        """
+        Ferma il thread di lettura corrente.
+        """
+        if self.reader is None:
+            return
+        self.stop.set()
+        self.reader.join()
+        self.reader = None
+
+
+class LazyProfileStore:
+    """
+    Store dei profili aperto solo alla prima lettura e limitato
+    alle colonne effettivamente richieste dal simulatore.
+
+    - column_indices(profile_ids): registra le colonne e restituisce
+      le posizioni nello store ridotto (nell'ordine di prima richiesta)
+    - len / row / close: aprono (se serve) e delegano allo store ridotto
+
+    Colonne richieste dopo l'apertura chiudono lo store, che viene
+    riaperto con l'insieme aggiornato alla lettura successiva.
+    """
+
+    def __init__(self, csv_path, binary=True, stream=False, chunk_rows=DEFAULT_CHUNK_ROWS,
+                 resolution=SECONDS_PER_HOUR):
+        self.source = csv_path
+        self.binary = binary
+        self.stream = stream
+        self.chunk_rows = chunk_rows
+        self.resolution = resolution
+
+        # Colonne del file (solo header), lette alla prima create
+        self.available = None
+
+        # Colonne richieste: nome -> posizione nello store ridotto
+        self.columns = []
+        self.col_index = {}
+
+        self.store = None
+
+    def column_index(self, profile_id):
+        return int(self.column_indices([profile_id])[0])
+
+    def column_indices(self, profile_ids):
+        if self.available is None:
+            self.available = set(self.file_columns())
+
+        idx = []
+        for pid in profile_ids:
+            pid = str(pid)
+            pos = self.col_index.get(pid)
+            if pos is None:
+                if pid not in self.available:
+                    raise KeyError(f"Profilo '{pid}' non presente in {self.source}")
+                pos = self.col_index[pid] = len(self.columns)
+                self.columns.append(pid)
+                self.close()
+                self.store = None
+            idx.append(pos)
+        return np.array(idx, dtype=np.intp)
+
+    def file_columns(self):
+        if self.source.endswith(".npy"):
+            return load_profile_store(self.source).columns
+        return read_profile_columns(self.source)
+
+    def open(self):
+        if self.store is None:
+            if self.stream:
+                # Senza entità basta la prima colonna per contare le righe
+                usecols = self.columns or read_profile_columns(self.source)[:1]
+                self.store = StreamingProfileStore(self.source, usecols=usecols, chunk_rows=self.chunk_rows,
+                                                   resolution=self.resolution)
+            else:
+                self.store = load_profile_store(self.source, binary=self.binary, columns=self.columns,
+                                                resolution=self.resolution)
+        return self.store
+
+    def __len__(self):
+        return len(self.open())
+
+    def row(self, idx, cols):
+        return self.open().row(idx, cols)
+
+    def take(self, cols):
+        """
+        Colonne intere, solo se lo store aperto è in memoria (non streaming).
+        """
+        take = getattr(self.open(), "take", None)
+        if take is None:
+            raise AttributeError("take non disponibile in streaming")
+        return take(cols)
+
+    def close(self):
+        if self.store is not None:
+            self.store.close()
+
+
+def open_profile_store(csv_path, binary=True, stream=False, chunk_rows=DEFAULT_CHUNK_ROWS, lazy=True,
+                       resolution=SECONDS_PER_HOUR):
+    """
+    Store dei profili per un simulatore:
+    - lazy=True: LazyProfileStore, solo le colonne richieste nelle create
+    - stream=False: ProfileStore condiviso (load_profile_store)
+    - stream=True: StreamingProfileStore privato del simulatore
+    - resolution: intervallo tra le righe del file (s), per il numero di righe atteso
+    """
+    if lazy:
+        return LazyProfileStore(csv_path, binary=binary, stream=stream, chunk_rows=chunk_rows, resolution=resolution)
+    if stream:
+        return StreamingProfileStore(csv_path, chunk_rows=chunk_rows, resolution=resolution)
+    return load_profile_store(csv_path, binary=binary, resolution=resolution)
@@ -1,49 +1,77 @@
-import pandas as pd
+# pv_DA_csv_creator.py
+#
+# Genera le previsioni PV Day-Ahead (generate_pv_da_profiles in
+# profile_generators.py) e le scrive in CSV o nel formato binario
+# dei profili (profile_store.write_binary, estensione .npy).
+#
+# Uso:
+#   python pv_DA_csv_creator.py --seed 42
+#   python pv_DA_csv_creator.py --profiles 1000 --capacity 3000 6000 ... \
+#       --output csv_data/pv_DA.npy
+
+import argparse
 import numpy as np
+import pandas as pd
+
+from profile_generators import PV_CAPACITY, PV_PEAK_HOUR, PV_PEAK_WIDTH, generate_pv_da_profiles
+from profile_store import HOURS_PER_YEAR, read_profile_csv, write_binary
 
 INPUT_FILE = "csv_data/load_istat_social_groups.csv"
 OUTPUT_FILE = "pv_DA_production_prediction.csv"
 
-# Carica il CSV per ottenere la struttura
-df = pd.read_csv(INPUT_FILE)
-
-# Header e prima colonna intatti
-col_ids = df.columns
-row_ids = df.iloc[:, 0]
-
-# Dati interni (usati solo per la forma)
-data = df.iloc[1:, 1:].astype(float).reset_index(drop=True)
-
-modified = data.copy()
 
-# Per PV production, genera valori casuali con pattern giornaliero
-# Probabilità di modifica (qui usata per generare nuovi valori)
-p = 1.0  # Sempre genera nuovi valori
+def write_profiles(values, columns, output_file):
+    """
+    Scrive la matrice (ore × profili): .npy -> formato binario, altrimenti CSV
+    con la prima colonna come indice dell'ora.
+    """
+    if output_file.endswith(".npy"):
+        return write_binary(values, columns, output_file, units="W", source="pv_DA_csv_creator")
 
-# Parametri della gaussiana per PV (picco a mezzogiorno)
-mu = 12.0      # picco alle 12
-sigma = 2.0    # larghezza della curva
+    df = pd.DataFrame(values, columns=[str(c) for c in columns])
+    df.to_csv(output_file, index=True)
+    return output_file
 
-for i in range(len(data)):
-    hour = i % 24
 
-    # Peso gaussiano per l'ora (massima produzione a mezzogiorno)
-    w = np.exp(-((hour - mu) ** 2) / (2 * sigma ** 2))
+def create_pv_profiles(columns, output_file=OUTPUT_FILE, rows=HOURS_PER_YEAR, seed=None, **params):
+    """
+    Genera le previsioni PV per le colonne indicate (profile_id, es.
+    [str(i) for i in range(n)]) e le scrive su output_file.
+    Restituisce l'array generato.
+    """
+    values = generate_pv_da_profiles(rows, len(columns), seed=seed, **params)
+    write_profiles(values, columns, output_file)
+    return values
 
-    # Produzione massima scalata dalla gaussiana
-    max_production = 5000 * w
 
-    for j in range(data.shape[1]):
-        # Genera produzione casuale tra 0 e max_production
-        val = np.random.uniform(0, max_production)
+def one_or_many(values):
+    """
+    Argomento CLI con uno o più valori: scalare oppure array per profilo.
+    """
+    return values[0] if len(values) == 1 else np.array(values)
 
-        # Arrotonda alla prima cifra decimale in Watt e assicurati >= 0
-        val = max(0, round(val, 1))  # precisione 0.1 W
 
-        modified.iat[i, j] = val
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Genera le previsioni PV Day-Ahead.")
+    parser.add_argument("--input", default=INPUT_FILE,
+                        help=f"CSV da cui prendere i profile_id (default: {INPUT_FILE})")
+    parser.add_argument("--profiles", type=int, default=None,
+                        help="numero di profili 0..N-1 (al posto dei profile_id di --input)")
+    parser.add_argument("--rows", type=int, default=HOURS_PER_YEAR, help="numero di ore")
+    parser.add_argument("--output", default=OUTPUT_FILE, help="file di uscita (.csv oppure .npy binario)")
+    parser.add_argument("--seed", type=int, default=None, help="seed del generatore casuale")
+    parser.add_argument("--mu", type=float, nargs="+", default=[PV_PEAK_HOUR],
+                        help="ora di picco (un valore o uno per profilo)")
+    parser.add_argument("--sigma", type=float, nargs="+", default=[PV_PEAK_WIDTH],
+                        help="larghezza della gaussiana (un valore o uno per profilo)")
+    parser.add_argument("--capacity", type=float, nargs="+", default=[PV_CAPACITY],
+                        help="produzione massima in W (un valore o uno per profilo)")
+    args = parser.parse_args()
 
-# Ricostruzione finale
-df_out = pd.concat([row_ids, modified], axis=1)
-df_out.columns = col_ids
+    if args.profiles is not None:
+        columns = [str(i) for i in range(args.profiles)]
+    else:
+        columns = list(read_profile_csv(args.input).columns[1:])
 
-df_out.to_csv(OUTPUT_FILE, index=False)
\ No newline at end of file
+    create_pv_profiles(columns, args.output, rows=args.rows, seed=args.seed, mu=one_or_many(args.mu),
+                       sigma=one_or_many(args.sigma), capacity=one_or_many(args.capacity))
@@ -15,9 +15,15 @@
 # Non è presente alcun fattore di scala.
 
 import itertools
-import pandas as pd
+import numpy as np
 import mosaik_api_v3
 
+from entity_params import expand_params, unique_eid
+from profile_stream import DEFAULT_CHUNK_ROWS, open_profile_store
+from sim_profiling import SimProfilingMixin
+from sim_trace import make_tracer
+from time_axis import DA_HORIZON, DEFAULT_RESOLUTION, ForecastHorizon, TimeAxis
+
 
 # -------------------------------------------------------------------
 # META-DATA MOSAIK
@@ -34,19 +40,21 @@ META = {
 
             # Parametri assegnati alla creazione dell'entità
             "params": [
-                "profile_id",  # nome della colonna del CSV
+                "profile_id",   # nome della colonna del CSV
+                "profile_ids",  # lista di colonne: una entità per valore
             ],
 
             # Attributi dinamici prodotti a ogni step
             "attrs": [
                 "P_PV_DA[kW]",  # Previsione produzione PV Day-Ahead
+                "P_PV_DA_block[kW]",  # produzione prevista del blocco DA (lista)
             ],
         },
     },
 }
 
 
-class PVDAProductionSimulator(mosaik_api_v3.Simulator):
+class PVDAProductionSimulator(SimProfilingMixin, mosaik_api_v3.Simulator):
     """
     Simulatore mosaik per previsioni orarie
     di produzione fotovoltaica Day-Ahead.
@@ -65,8 +73,15 @@ class PVDAProductionSimulator(mosaik_api_v3.Simulator):
         self.sid = None
         self.step_size = None
 
-        # DataFrame con i dati orari (8760 righe)
-        self.data = None
+        # Profili orari condivisi (ProfileStore, 8760 righe)
+        self.store = None
+
+        # Tracer per il logging degli step (creato in init)
+        self.tracer = None
+
+        # Asse temporale dati -> step e orizzonte di previsione (creati in init)
+        self.axis = None
+        self.forecast = None
 
         # Stato interno delle entità: eid -> dict
         self.entities = {}
@@ -74,13 +89,25 @@ class PVDAProductionSimulator(mosaik_api_v3.Simulator):
         # Contatore per ID univoci
         self.eid_counter = itertools.count()
 
+        # Indici di colonna delle entità, nell'ordine di creazione
+        self.cols = np.empty(0, dtype=np.intp)
+
+        # eid -> posizione nell'array dei valori
+        self.eid_pos = {}
+
         # Cache dei valori calcolati nello step corrente
-        self.cache = {}
+        # (un valore in kW per entità, allineato a self.cols)
+        self.cache = np.zeros(0)
+
+        # Blocco DA dello step corrente (da_block × entità, in kW)
+        self.block = np.zeros((0, 0))
 
     # ----------------------------------------------------------------
     # INIT
     # ----------------------------------------------------------------
-    def init(self, sid, csv_path, step_size=3600, **kwargs):
+    def init(self, sid, csv_path, step_size=3600, binary=True, stream=False, chunk_rows=DEFAULT_CHUNK_ROWS,
+             lazy=True, data_resolution=DEFAULT_RESOLUTION, interpolation="hold", horizon=DA_HORIZON, da_block=0,
+             precompute=True, **kwargs):
         """
         Inizializzazione:
         - carica CSV
@@ -89,23 +116,24 @@ class PVDAProductionSimulator(mosaik_api_v3.Simulator):
         self.sid = sid
         self.step_size = step_size
 
-        df = pd.read_csv(csv_path)
-        df = df.dropna(how="all")
+        # Profili condivisi (CSV letto una sola volta per processo,
+        # con binary=True mappato in memoria dal formato binario);
+        # stream=True legge il CSV a blocchi di chunk_rows righe;
+        # lazy=True carica solo le colonne dei profile_id usati nelle create
+        self.store = open_profile_store(csv_path, binary=binary, stream=stream, chunk_rows=chunk_rows,
+                                        lazy=lazy, resolution=data_resolution)
 
-        # Gestione intestazione / righe extra
-        if len(df) == 8761:
-            df = df.iloc[1:].reset_index(drop=True)
-        elif len(df) == 8759:
-            raise ValueError(
-                "CSV ha 8759 righe: manca un'ora (DST o dato mancante)"
-            )
+        # Asse temporale: risoluzione dei dati vs step della simulazione
+        # (interpolazione per step più brevi, media per step più lunghi)
+        self.axis = TimeAxis(step_size, data_resolution, interpolation)
 
-        if len(df) != 8760:
-            raise ValueError(
-                f"Numero righe inatteso: {len(df)} (atteso 8760)"
-            )
+        # Previsione a time + horizon (s); con da_block > 0 anche il blocco
+        # dei da_block valori orari successivi. precompute=True ruota una
+        # volta le colonne delle entità invece di indicizzare a ogni step.
+        self.forecast = ForecastHorizon(self.axis, horizon=horizon, block=da_block, precompute=precompute)
 
-        self.data = df.astype(float)
+        # Logging per step (disattivato di default, vedi sim_trace.py)
+        self.tracer = make_tracer(sid, **kwargs)
 
         return META
 
@@ -119,16 +147,17 @@ class PVDAProductionSimulator(mosaik_api_v3.Simulator):
         """
 
         entities = []
-        profile_id = model_params["profile_id"]
+        profile_ids = expand_params(num, model_params)["profile_id"]
+        new_cols = self.store.column_indices(profile_ids)
 
-        for _ in range(num):
-            # Uniforme a LoadProfileSimulator
-            eid = f"Home_{profile_id}"
+        for i, profile_id in enumerate(profile_ids):
+            eid = unique_eid(f"Home_{profile_id}", self.eid_pos, self.eid_counter)
 
             self.entities[eid] = {
                 "profile_id": profile_id,
-                "P_PV_DA[kW]": 0.0,
+                "col": new_cols[i],
             }
+            self.eid_pos[eid] = len(self.cols) + i
 
             entities.append({
                 "eid": eid,
@@ -136,6 +165,10 @@ class PVDAProductionSimulator(mosaik_api_v3.Simulator):
                 "rel": [],
             })
 
+        # Estende gli array con le nuove entità (una volta per create)
+        self.cols = np.concatenate([self.cols, new_cols])
+        self.cache = np.zeros(len(self.cols))
+
         return entities
 
     # ----------------------------------------------------------------
@@ -145,27 +178,25 @@ class PVDAProductionSimulator(mosaik_api_v3.Simulator):
         """
         Aggiornamento a ogni step temporale.
 
-        - 1 step = 1 ora
+        - step e risoluzione dei dati raccordati da TimeAxis (time_axis.py)
         - lettura dal CSV
         - conversione W → kW
         """
 
-        hour_idx = int(time // self.step_size) % len(self.data)
+        # Indice futuro: horizon dopo lo step corrente
+        future_idx = self.axis.row_index(time + self.forecast.horizon) % len(self.store)
 
-        self.cache = {}
+        # Tabella di previsione (ri)preparata quando cambiano le entità
+        if self.forecast.cols is not self.cols:
+            self.forecast.prepare(self.store, self.cols)
 
-        for eid, ent in self.entities.items():
-            profile = ent["profile_id"]
+        # Tutte le entità in una sola lettura (W → kW)
+        self.cache = self.forecast.point(time) / 1000.0
+        if self.forecast.block:
+            self.block = self.forecast.values(time) / 1000.0
 
-            # Indice futuro: 24h dopo lo step corrente
-            future_idx = (hour_idx + 24) % len(self.data)
-            p_w = self.data.iloc[future_idx][profile]
-            p_kw = p_w / 1000.0
-
-            print(f"[PV_DA] time={time}, eid={eid}, t+24h_idx={future_idx}, value={p_kw:.3f} kW")
-
-            ent["P_PV_DA[kW]"] = p_kw
-            self.cache[eid] = p_kw
+        if self.tracer.enabled and self.tracer.sample():
+            self.tracer.record(time, self.cache, eids=self.eid_pos, future_idx=future_idx)
 
         return time + self.step_size
 
@@ -183,6 +214,22 @@ class PVDAProductionSimulator(mosaik_api_v3.Simulator):
             data[eid] = {}
             for attr in attrs:
                 if attr == "P_PV_DA[kW]":
-                    data[eid][attr] = self.cache.get(eid, 0.0)
+                    pos = self.eid_pos.get(eid)
+                    data[eid][attr] = self.cache[pos] if pos is not None else 0.0
+                elif attr == "P_PV_DA_block[kW]":
+                    pos = self.eid_pos.get(eid)
+                    data[eid][attr] = self.block[:, pos].tolist() if pos is not None and self.block.size else []
 
         return data
+
+    # ----------------------------------------------------------------
+    # FINALIZE
+    # ----------------------------------------------------------------
+    def finalize(self):
+        """
+        Fine simulazione: svuota i buffer del trace e chiude lo store.
+        """
+        if self.tracer is not None:
+            self.tracer.flush()
+        if self.store is not None:
+            self.store.close()
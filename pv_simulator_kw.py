@@ -1,6 +1,12 @@
 import itertools
+from datetime import datetime, timedelta
+import numpy as np
 import mosaik_api_v3
 
+from entity_params import expand_params, unique_eid
+from sim_profiling import SimProfilingMixin
+from sim_trace import make_tracer
+
 meta = {
     "api_version": "3.0",
     "type": "hybrid",
@@ -9,6 +15,7 @@ meta = {
             "public": True,
             "params": [
                 "profile_id",
+                "profile_ids",  # lista di profili: un impianto per valore
                 "latitude",
                 "area",
                 "efficiency",
@@ -24,61 +31,151 @@ meta = {
     },
 }
 
+# Data di inizio di default (anno dei profili CSV)
+DEFAULT_START_DATE = "2023-01-01 00:00:00"
+
+
+class PVFleet:
+    """
+    Parco PV in forma di array: una posizione per impianto.
+
+    - area [m2], efficiency, max_kW: modello di potenza
+    - latitude, el_tilt, az_tilt [gradi]: orientamento del pannello
+      (el_tilt = inclinazione sull'orizzontale, az_tilt = 0 a sud,
+      positivo verso ovest)
+    """
+
+    PARAMS = ["area", "efficiency", "max_kW", "latitude", "el_tilt", "az_tilt"]
+
+    def __init__(self):
+        self.arrays = {p: np.zeros(0) for p in self.PARAMS}
+
+    def __len__(self):
+        return len(self.arrays["area"])
+
+    def add(self, **params):
+        """
+        Aggiunge impianti; ogni parametro è uno scalare o un array
+        della stessa lunghezza. Restituisce le posizioni assegnate.
+        """
+        n = max(np.size(v) for v in params.values())
+        start = len(self)
+        for p in self.PARAMS:
+            values = np.broadcast_to(np.asarray(params[p], dtype=float), (n,))
+            self.arrays[p] = np.concatenate([self.arrays[p], values])
+        return range(start, start + n)
+
+    def poa_factor(self, when):
+        """
+        Fattore di piano dei moduli: cos dell'angolo di incidenza
+        del fascio diretto sul pannello (0 se il sole è sotto l'orizzonte).
+
+        Geometria solare semplificata (ora solare = ora del timestamp):
+        - declinazione di Cooper
+        - angolo orario 15°/h dal mezzogiorno solare
+        - incidenza su superficie inclinata (Duffie & Beckman)
+        """
+        n = when.timetuple().tm_yday
+        hour = when.hour + when.minute / 60.0 + when.second / 3600.0
 
-class PVSimulatorKW(mosaik_api_v3.Simulator):
+        decl = np.radians(23.45) * np.sin(np.radians(360.0 * (284 + n) / 365.0))
+        omega = np.radians(15.0 * (hour - 12.0))
+
+        phi = np.radians(self.arrays["latitude"])
+        beta = np.radians(self.arrays["el_tilt"])
+        gamma = np.radians(self.arrays["az_tilt"])
+
+        sin_d, cos_d = np.sin(decl), np.cos(decl)
+        sin_phi, cos_phi = np.sin(phi), np.cos(phi)
+        sin_b, cos_b = np.sin(beta), np.cos(beta)
+        cos_w = np.cos(omega)
+
+        sin_elev = sin_phi * sin_d + cos_phi * cos_d * cos_w
+        cos_inc = (
+            sin_d * sin_phi * cos_b
+            - sin_d * cos_phi * sin_b * np.cos(gamma)
+            + cos_d * cos_phi * cos_b * cos_w
+            + cos_d * sin_phi * sin_b * np.cos(gamma) * cos_w
+            + cos_d * sin_b * np.sin(gamma) * np.sin(omega)
+        )
+        return np.where(sin_elev > 0, np.clip(cos_inc, 0.0, None), 0.0)
+
+    def power(self, dni, when=None):
+        """
+        Potenza [kW] di tutti gli impianti dato il DNI [W/m2] per impianto.
+        Con `when` applica la correzione di piano (poa_factor).
+        """
+        a = self.arrays
+        irr = dni if when is None else dni * self.poa_factor(when)
+        return np.minimum(irr * a["area"] * a["efficiency"] / 1000.0, a["max_kW"])  # W -> kW
+
+
+class PVSimulatorKW(SimProfilingMixin, mosaik_api_v3.Simulator):
     def __init__(self):
         super().__init__(meta)
-        self._entities = {}
-        self.eid_counters = {}
-        self.cache = {}
+        self.fleet = PVFleet()
+        self.eid_pos = {}
+        self.eid_counter = itertools.count()
+        self.irradiance = np.zeros(0)
+        self.cache = np.zeros(0)
+        self.tracer = None
 
-    def init(self, sid, start_date=None, step_size=900, **kwargs):
+    def init(self, sid, start_date=None, step_size=900, poa_correction=False, **kwargs):
         self.sid = sid
         self.step_size = step_size  # in secondi
+
+        # Correzione di piano dei moduli (usa latitude, el_tilt, az_tilt)
+        self.poa_correction = poa_correction
+        self.start_date = datetime.fromisoformat(start_date or DEFAULT_START_DATE)
+
+        # Logging per step (disattivato di default, vedi sim_trace.py)
+        self.tracer = make_tracer(sid, **kwargs)
         return self.meta
 
     def create(self, num, model, **model_params):
         entities = []
 
-        profile_id = model_params["profile_id"]
-        eid = f"Home_{profile_id}_PV_Production"
+        params = expand_params(num, model_params)
+
+        pos = self.fleet.add(
+            area=params["area"],
+            efficiency=params["efficiency"],
+            max_kW=params.get("max_kW", 6),
+            latitude=params.get("latitude", 0.0),
+            el_tilt=params.get("el_tilt", 0.0),
+            az_tilt=params.get("az_tilt", 0.0),
+        )
+        for i, profile_id in zip(pos, params["profile_id"]):
+            eid = unique_eid(f"Home_{profile_id}_PV_Production", self.eid_pos, self.eid_counter)
+            self.eid_pos[eid] = i
+            entities.append({
+                'eid': eid,
+                'type': model,
+                'rel': []
+            })
 
-        self._entities[eid] = {
-            **model_params,
-            "P[kW]": 0,
-            "irradiance": 0,
-        }
-        entities.append({
-            'eid': eid, 
-            'type': model, 
-            'rel': []
-        })
+        self.irradiance = np.zeros(len(self.fleet))
+        self.cache = np.zeros(len(self.fleet))
 
         return entities
 
     def step(self, time, inputs, max_advance=None):
-        self.cache = {}
+        # Irradianza per impianto: 0 per chi non riceve input
+        irr = self.irradiance
+        irr[:] = 0.0
         for eid, attrs in inputs.items():
             # prende il primo valore della sorgente (es. Weather.Function-0)
             irr_dict = attrs.get("DNI[W/m2]", {})
             if irr_dict:
-                irr = list(irr_dict.values())[0]
-            else:
-                irr = 0
+                irr[self.eid_pos[eid]] = next(iter(irr_dict.values()))
 
-            ent = self._entities[eid]
-            ent["irradiance"] = irr
+        # Potenza di tutto il parco in un'unica espressione NumPy
+        when = self.start_date + timedelta(seconds=time) if self.poa_correction else None
+        self.cache = self.fleet.power(irr, when)
 
-            # Potenza teorica
-            P_theor = irr * ent["area"] * ent["efficiency"] / 1000.0  # W -> kW
+        if self.tracer.enabled and self.tracer.sample():
+            self.tracer.record(time, self.cache, eids=self.eid_pos)
 
-            # Limite contatore
-            max_kw = ent.get("max_kW", 6)
-            ent["P[kW]"] = min(P_theor, max_kw)
-
-            self.cache[eid] = ent["P[kW]"]
-            print(f"Step time={time}, inputs={irr_dict}, P={ent['P[kW]']}")
-        
         return time + self.step_size
 
 
@@ -88,5 +185,11 @@ class PVSimulatorKW(mosaik_api_v3.Simulator):
             data[eid] = {}
             for attr in attrs:
                 if attr == "P[kW]":
-                    data[eid][attr] = self.cache.get(eid, 0)
+                    pos = self.eid_pos.get(eid)
+                    data[eid][attr] = self.cache[pos] if pos is not None else 0
         return data
+
+    def finalize(self):
+        # Svuota i buffer del trace a fine simulazione
+        if self.tracer is not None:
+            self.tracer.flush()
@@ -1,54 +1,51 @@
+# real_time_csv_creator.py
+#
+# Genera il CSV dei consumi Real-Time perturbando i consumi Day-Ahead
+# (generate_rt_profiles in profile_generators.py).
+#
+# Uso:
+#   python real_time_csv_creator.py --input load_istat_social_groups.csv \
+#       --output rt_consumes.csv --seed 42
+
+import argparse
 import pandas as pd
-import numpy as np
+
+from profile_generators import (
+    RT_CHANGE_PROB, RT_MAX_INCREASE, RT_PEAK_HOUR, RT_PEAK_WIDTH, generate_rt_profiles,
+)
 
 INPUT_FILE = "load_istat_social_groups.csv"
 OUTPUT_FILE = "rt_consumes.csv"
 
-# Carica il CSV
-df = pd.read_csv(INPUT_FILE)
-
-# Header e prima colonna intatti
-col_ids = df.columns
-row_ids = df.iloc[:, 0]
-
-# Dati interni
-data = df.iloc[1:, 1:].astype(float).reset_index(drop=True)
-
-modified = data.copy()
-
-# Probabilità di modifica
-p = 0.10
-
-# Parametri della gaussiana
-mu = 15.5      # picco alle 15-16
-sigma = 2.0    # larghezza della curva
-
-for i in range(len(data)):
-    hour = i % 24
-
-    # Peso gaussiano per l'ora
-    w = np.exp(-((hour - mu) ** 2) / (2 * sigma ** 2))
-
-    # Aumento massimo scalato dalla gaussiana
-    max_increase = 2000 * w
-
-    for j in range(data.shape[1]):
-        x = data.iat[i, j]
-
-        if np.random.rand() < p:
-            if np.random.rand() < 0.5:
-                # Aumento proporzionale al peso gaussiano
-                delta = np.random.uniform(0, max_increase)
-                modified.iat[i, j] = x + delta
-            else:
-                # Diminuzione proporzionale al peso gaussiano
-                delta = np.random.uniform(0, x * w)
-                modified.iat[i, j] = x - delta
-        else:
-            modified.iat[i, j] = x
-
-# Ricostruzione finale
-df_out = pd.concat([row_ids, modified], axis=1)
-df_out.columns = col_ids
 
-df_out.to_csv(OUTPUT_FILE, index=False)
\ No newline at end of file
+def create_rt_csv(input_file=INPUT_FILE, output_file=OUTPUT_FILE, seed=None, **params):
+    """
+    Legge i consumi DA, genera i consumi RT e li scrive su output_file.
+    Header e prima colonna (indice ora) restano intatti.
+    Restituisce l'array generato (ore × profili).
+    """
+    df = pd.read_csv(input_file)
+    df = df.dropna(how="all")
+
+    rt = generate_rt_profiles(df.iloc[:, 1:].to_numpy(dtype=float), seed=seed, **params)
+
+    df_out = df.copy()
+    df_out.iloc[:, 1:] = rt
+    df_out.to_csv(output_file, index=False)
+    return rt
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Genera i consumi Real-Time dai consumi Day-Ahead.")
+    parser.add_argument("--input", default=INPUT_FILE, help=f"CSV dei consumi DA (default: {INPUT_FILE})")
+    parser.add_argument("--output", default=OUTPUT_FILE, help=f"CSV di uscita (default: {OUTPUT_FILE})")
+    parser.add_argument("--seed", type=int, default=None, help="seed del generatore casuale")
+    parser.add_argument("--p", type=float, default=RT_CHANGE_PROB, help="probabilità di modifica di una cella")
+    parser.add_argument("--mu", type=float, default=RT_PEAK_HOUR, help="ora di picco della gaussiana")
+    parser.add_argument("--sigma", type=float, default=RT_PEAK_WIDTH, help="larghezza della gaussiana (ore)")
+    parser.add_argument("--max-increase", type=float, default=RT_MAX_INCREASE,
+                        help="aumento massimo (W) all'ora di picco")
+    args = parser.parse_args()
+
+    create_rt_csv(args.input, args.output, seed=args.seed, p=args.p, mu=args.mu, sigma=args.sigma,
+                  max_increase=args.max_increase)
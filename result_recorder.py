@@ -0,0 +1,624 @@
+# result_recorder.py
+#
+# Simulatore mosaik di output colonnare (sostituisce il Dict di
+# mosaik.basic_simulators:OutputSimulator).
+#
+# Ogni entità Recorder accetta qualsiasi attributo (any_inputs) e salva
+# i valori in array NumPy preallocati (step × colonna), una colonna per
+# coppia (attributo, sorgente). Quando un blocco di chunk_steps righe è
+# pieno viene:
+# - scritto su file (output_format "parquet", "arrow" o "hdf5"),
+#   così la memoria resta limitata a un blocco
+# - oppure tenuto in memoria come array compatto (output_format=None)
+#
+# A fine simulazione get_frame(eid) restituisce un DataFrame con indice
+# il tempo e colonne MultiIndex (attributo, sorgente).
+#
+# Le librerie dei formati su file sono opzionali e importate solo
+# quando servono: pyarrow per parquet/arrow, h5py per hdf5.
+#
+# Modalità sink (init(sink="csv"|"jsonl"|"arrow")): nessun blocco in
+# memoria, ogni step viene accodato subito a un file append-only da un
+# thread di scrittura (coda limitata, flush a ogni riga). La memoria
+# resta costante per tutta la simulazione, il file si può leggere
+# mentre la simulazione è in corso e un'interruzione perde al massimo
+# gli step ancora in coda.
+
+import csv
+import importlib
+import json
+import os
+import queue
+import threading
+import numpy as np
+import pandas as pd
+import mosaik_api_v3
+
+from sim_profiling import SimProfilingMixin
+
+
+META = {
+    "api_version": "3.0",
+    "type": "event-based",
+    "extra_methods": ["get_frame", "get_dict"],
+    "models": {
+        "Recorder": {
+            "public": True,
+            "any_inputs": True,
+            "params": [],
+            "attrs": [],
+        },
+    },
+}
+
+# Righe (step) per blocco
+DEFAULT_CHUNK_STEPS = 1024
+
+# Separatore tra sorgente e attributo nei nomi di colonna su file
+COLUMN_SEP = "/"
+
+# Step in attesa di scrittura nella coda del sink
+DEFAULT_SINK_QUEUE = 64
+
+
+def column_name(attr, src):
+    return f"{src}{COLUMN_SEP}{attr}"
+
+
+def split_column_name(name):
+    src, attr = name.rsplit(COLUMN_SEP, 1)
+    return attr, src
+
+
+def check_scalar(pairs):
+    """
+    Solo valori scalari sono registrabili (una cella per step): gli
+    attributi a lista (es. P_load_DA_block[kW]) danno errore al primo
+    step in cui compaiono invece di interrompere la scrittura a metà.
+    pairs: coppie (attributo, valore).
+    """
+    bad = sorted({attr for attr, value in pairs if np.ndim(value) != 0})
+    if bad:
+        raise ValueError(f"Recorder: attributi non scalari non registrabili: {bad}")
+
+
+# -------------------------------------------------------------------
+# WRITER SU FILE
+# -------------------------------------------------------------------
+class ParquetChunkWriter:
+    """
+    Blocchi come row group di un file Parquet (pyarrow).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.writer = None
+
+    def table(self, columns, times, values):
+        import pyarrow as pa
+
+        arrays = [pa.array(times)] + [pa.array(values[:, i]) for i in range(values.shape[1])]
+        names = ["time"] + [column_name(attr, src) for attr, src in columns]
+        return pa.Table.from_arrays(arrays, names=names)
+
+    def open(self, table):
+        import pyarrow.parquet as pq
+
+        return pq.ParquetWriter(self.path, table.schema)
+
+    def write(self, columns, times, values):
+        table = self.table(columns, times, values)
+        if self.writer is None:
+            self.writer = self.open(table)
+        self.writer.write_table(table)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+    def read(self):
+        import pyarrow.parquet as pq
+
+        return pq.read_table(self.path).to_pandas()
+
+
+class ArrowChunkWriter(ParquetChunkWriter):
+    """
+    Blocchi come record batch di un file Arrow IPC (pyarrow).
+    """
+
+    def open(self, table):
+        import pyarrow as pa
+
+        return pa.ipc.new_file(self.path, table.schema)
+
+    def read(self):
+        import pyarrow as pa
+
+        with pa.memory_map(self.path) as source:
+            return pa.ipc.open_file(source).read_all().to_pandas()
+
+
+class HDF5ChunkWriter:
+    """
+    Blocchi accodati a due dataset HDF5 estendibili (h5py):
+    "time" (step) e "values" (step × colonne); nomi di colonna come attributo.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+
+    def write(self, columns, times, values):
+        import h5py
+
+        if self.file is None:
+            self.file = h5py.File(self.path, "w")
+            self.file.create_dataset("time", shape=(0,), maxshape=(None,), dtype="i8", chunks=True)
+            self.file.create_dataset("values", shape=(0, values.shape[1]), maxshape=(None, values.shape[1]),
+                                     dtype="f8", chunks=True)
+            self.file["values"].attrs["columns"] = [column_name(attr, src) for attr, src in columns]
+
+        n = self.file["time"].shape[0]
+        self.file["time"].resize((n + len(times),))
+        self.file["time"][n:] = times
+        self.file["values"].resize((n + len(times), values.shape[1]))
+        self.file["values"][n:] = values
+        self.file.flush()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def read(self):
+        import h5py
+
+        with h5py.File(self.path, "r") as f:
+            columns = [c.decode() if isinstance(c, bytes) else c for c in f["values"].attrs["columns"]]
+            df = pd.DataFrame(f["values"][:], columns=columns)
+            df.insert(0, "time", f["time"][:])
+        return df
+
+
+# formato -> (writer, estensione, libreria richiesta)
+WRITERS = {
+    "parquet": (ParquetChunkWriter, ".parquet", "pyarrow"),
+    "arrow": (ArrowChunkWriter, ".arrow", "pyarrow"),
+    "hdf5": (HDF5ChunkWriter, ".h5", "h5py"),
+}
+
+
+# -------------------------------------------------------------------
+# SINK IN STREAMING (una riga per step)
+# -------------------------------------------------------------------
+def row_items(inputs):
+    """
+    Coppie (nome colonna, valore) di uno step; inputs: {attr: {src: valore}}.
+    """
+    return [(column_name(attr, src), value) for attr, srcs in inputs.items() for src, value in srcs.items()]
+
+
+def frame_from_rows(df):
+    """
+    DataFrame letto da un sink (colonna "time" + colonne "src/attr")
+    nella forma di ResultTable.frame().
+    """
+    df = df.set_index("time")
+    df.columns = pd.MultiIndex.from_tuples([split_column_name(c) for c in df.columns], names=["attr", "src"])
+    return df
+
+
+def empty_frame(columns=()):
+    """
+    DataFrame senza righe nella forma di ResultTable.frame(): per un
+    Recorder che non ha ricevuto step il file non viene mai creato.
+    """
+    return pd.DataFrame(
+        np.empty((0, len(columns))),
+        index=pd.Index(np.empty(0, dtype=np.int64), name="time"),
+        columns=pd.MultiIndex.from_tuples(list(columns), names=["attr", "src"]),
+    )
+
+
+class CsvRowWriter:
+    """
+    CSV largo: header (time + colonne) fissato dal primo step,
+    celle vuote per i valori mancanti.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.f = None
+        self.writer = None
+        self.columns = None
+        self.known = None
+
+    def write(self, time, inputs):
+        items = dict(row_items(inputs))
+        if self.f is None:
+            check_scalar((attr, v) for attr, srcs in inputs.items() for v in srcs.values())
+            self.columns = list(items)
+            self.known = set(self.columns)
+            self.f = open(self.path, "w", newline="")
+            self.writer = csv.writer(self.f)
+            self.writer.writerow(["time"] + self.columns)
+        elif not items.keys() <= self.known:
+            raise ValueError(f"Nuove colonne dopo il primo step: {sorted(items.keys() - self.known)}")
+        self.writer.writerow([time] + [items.get(c, "") for c in self.columns])
+
+    def flush(self):
+        if self.f is not None:
+            self.f.flush()
+
+    def close(self):
+        if self.f is not None:
+            self.f.close()
+            self.f = None
+
+    def read(self):
+        return frame_from_rows(pd.read_csv(self.path))
+
+
+class JsonlRowWriter:
+    """
+    Un oggetto JSON per step: {"time": t, "src/attr": valore, ...}.
+    Le colonne possono cambiare da uno step all'altro.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.f = open(path, "w")
+
+    def write(self, time, inputs):
+        self.f.write(json.dumps({"time": time, **dict(row_items(inputs))}, default=float))
+        self.f.write("\n")
+
+    def flush(self):
+        self.f.flush()
+
+    def close(self):
+        self.f.close()
+
+    def read(self):
+        return frame_from_rows(pd.read_json(self.path, lines=True))
+
+
+class ArrowRowWriter:
+    """
+    Un record batch per step in un file Arrow IPC in formato stream
+    (pyarrow), leggibile anche se incompleto. Schema fissato dal primo step.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.sink = None
+        self.writer = None
+        self.schema = None
+        self.columns = None
+        self.known = None
+
+    def write(self, time, inputs):
+        import pyarrow as pa
+
+        items = dict(row_items(inputs))
+        if self.writer is None:
+            check_scalar((attr, v) for attr, srcs in inputs.items() for v in srcs.values())
+            self.columns = list(items)
+            self.known = set(self.columns)
+            fields = [pa.field("time", pa.int64())] + [pa.field(c, pa.float64()) for c in self.columns]
+            self.schema = pa.schema(fields)
+            self.sink = pa.OSFile(self.path, "wb")
+            self.writer = pa.ipc.new_stream(self.sink, self.schema)
+        elif not items.keys() <= self.known:
+            raise ValueError(f"Nuove colonne dopo il primo step: {sorted(items.keys() - self.known)}")
+        arrays = [pa.array([time], pa.int64())] + [pa.array([items.get(c)], pa.float64()) for c in self.columns]
+        self.writer.write_batch(pa.record_batch(arrays, schema=self.schema))
+
+    def flush(self):
+        if self.sink is not None:
+            self.sink.flush()
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.sink.close()
+            self.writer = None
+
+    def read(self):
+        import pyarrow as pa
+
+        with pa.OSFile(self.path, "rb") as source:
+            return frame_from_rows(pa.ipc.open_stream(source).read_all().to_pandas())
+
+
+# formato -> (writer, estensione, libreria richiesta)
+SINKS = {
+    "csv": (CsvRowWriter, ".csv", None),
+    "jsonl": (JsonlRowWriter, ".jsonl", None),
+    "arrow": (ArrowRowWriter, ".arrows", "pyarrow"),
+}
+
+
+class StreamingSink:
+    """
+    Scrittura asincrona degli step: step() mette (time, inputs) in una
+    coda limitata (si blocca se il disco è più lento della simulazione),
+    un thread li scrive e fa flush del file dopo ogni riga.
+
+    Un errore del thread viene rilanciato al put o al close successivo.
+    """
+
+    def __init__(self, writer, queue_size=DEFAULT_SINK_QUEUE):
+        self.writer = writer
+        self.rows = queue.Queue(maxsize=queue_size)
+        self.error = None
+
+        # Step ricevuti: senza step il file non esiste
+        self.steps = 0
+        self.thread = threading.Thread(target=self._write, daemon=True)
+        self.thread.start()
+
+    def put(self, time, inputs):
+        if self.error is not None:
+            raise self.error
+        self.rows.put((time, inputs))
+        self.steps += 1
+
+    def _write(self):
+        """
+        Thread di scrittura: scrive fino a None. Dopo un errore continua
+        a svuotare la coda, così put non resta bloccato.
+        """
+        while True:
+            row = self.rows.get()
+            if row is None:
+                break
+            if self.error is not None:
+                continue
+            try:
+                self.writer.write(*row)
+                self.writer.flush()
+            except Exception as e:
+                self.error = e
+        try:
+            self.writer.close()
+        except Exception as e:
+            self.error = self.error or e
+
+    def close(self):
+        if self.thread is not None:
+            self.rows.put(None)
+            self.thread.join()
+            self.thread = None
+        if self.error is not None:
+            raise self.error
+
+    def frame(self):
+        self.close()
+        if self.steps == 0:
+            return empty_frame()
+        return self.writer.read()
+
+
+# -------------------------------------------------------------------
+# TABELLA COLONNARE
+# -------------------------------------------------------------------
+class ResultTable:
+    """
+    Valori di un Recorder: un blocco preallocato (chunk_steps × colonne)
+    e l'elenco delle colonne (attributo, sorgente). I valori mancanti
+    in uno step restano NaN; gli attributi non scalari sono rifiutati
+    (check_scalar) quando compaiono la prima volta.
+    """
+
+    def __init__(self, chunk_steps=DEFAULT_CHUNK_STEPS, writer=None):
+        self.chunk_steps = chunk_steps
+        self.writer = writer
+
+        # Colonne: (attr, src) -> indice
+        self.columns = []
+        self.col_index = {}
+
+        # Blocco corrente e righe occupate
+        self.times = np.empty(chunk_steps, dtype=np.int64)
+        self.values = np.full((chunk_steps, 0), np.nan)
+        self.n = 0
+
+        # Blocchi completi tenuti in memoria (senza writer)
+        self.chunks = []
+
+        # Colonne fissate dalla prima scrittura su file
+        self.written_columns = None
+
+    def append(self, time, inputs):
+        """
+        Aggiunge una riga; inputs: {attr: {src: valore}} come nello step mosaik.
+        """
+        keys = [(attr, src) for attr, srcs in inputs.items() for src in srcs]
+        new = [k for k in keys if k not in self.col_index]
+        if new:
+            check_scalar((attr, inputs[attr][src]) for attr, src in new)
+            for k in new:
+                self.col_index[k] = len(self.columns)
+                self.columns.append(k)
+            pad = np.full((self.chunk_steps, len(new)), np.nan)
+            self.values = np.hstack([self.values, pad])
+
+        row = self.n
+        self.times[row] = time
+        self.values[row] = np.nan
+        idx = [self.col_index[k] for k in keys]
+        self.values[row, idx] = [v for srcs in inputs.values() for v in srcs.values()]
+
+        self.n += 1
+        if self.n == self.chunk_steps:
+            self.flush()
+
+    def flush(self):
+        """
+        Chiude il blocco corrente: su file se c'è un writer, altrimenti in memoria.
+        """
+        if self.n == 0:
+            return
+        times = self.times[:self.n].copy()
+        values = self.values[:self.n].copy()
+        self.n = 0
+
+        if self.writer is None:
+            self.chunks.append((times, values))
+            return
+
+        if self.written_columns is None:
+            self.written_columns = list(self.columns)
+        elif self.written_columns != self.columns:
+            raise ValueError(
+                "Nuove colonne dopo la prima scrittura su file: "
+                f"{self.columns[len(self.written_columns):]}"
+            )
+        self.writer.write(self.columns, times, values)
+
+    def close(self):
+        self.flush()
+        if self.writer is not None:
+            self.writer.close()
+
+    def frame(self):
+        """
+        DataFrame (indice: tempo, colonne: MultiIndex attributo/sorgente).
+        Con un writer chiude il file e lo rilegge (se è stato scritto).
+        """
+        self.close()
+
+        if self.written_columns is not None:
+            return frame_from_rows(self.writer.read())
+
+        width = len(self.columns)
+        times = np.concatenate([t for t, _ in self.chunks]) if self.chunks else np.empty(0, dtype=np.int64)
+        values = np.vstack([
+            np.pad(v, ((0, 0), (0, width - v.shape[1])), constant_values=np.nan) for _, v in self.chunks
+        ]) if self.chunks else np.empty((0, width))
+
+        # I blocchi in memoria restano uno solo, già compattato
+        self.chunks = [(times, values)] if self.chunks else []
+
+        if not self.chunks:
+            return empty_frame(self.columns)
+        return pd.DataFrame(
+            values,
+            index=pd.Index(times, name="time"),
+            columns=pd.MultiIndex.from_tuples(self.columns, names=["attr", "src"]),
+        )
+
+
+# -------------------------------------------------------------------
+# SIMULATORE
+# -------------------------------------------------------------------
+def require_format(param, fmt, formats):
+    """
+    Controlla il formato e la sua libreria opzionale: errore subito
+    in init, non alla prima scrittura.
+    """
+    if fmt not in formats:
+        raise ValueError(f"{param} non valido: {fmt} (ammessi: {list(formats)})")
+    module = formats[fmt][2]
+    if module is None:
+        return
+    try:
+        importlib.import_module(module)
+    except ImportError:
+        raise ImportError(f"{param}={fmt!r} richiede il pacchetto {module}") from None
+
+
+class ResultRecorderSimulator(SimProfilingMixin, mosaik_api_v3.Simulator):
+    """
+    Output colonnare: una ResultTable per entità Recorder.
+
+    init(output_format=None|"parquet"|"arrow"|"hdf5", output_path=..., chunk_steps=...)
+    output_path può contenere {eid}; senza estensione si aggiunge quella del formato.
+
+    init(sink="csv"|"jsonl"|"arrow", output_path=..., sink_queue=...):
+    ogni step scritto subito su file da un StreamingSink (al posto
+    della ResultTable); get_frame rilegge il file.
+    """
+
+    def __init__(self):
+        super().__init__(META)
+        self.tables = {}
+        self.output_format = None
+        self.output_path = None
+        self.chunk_steps = DEFAULT_CHUNK_STEPS
+        self.sink = None
+        self.sink_queue = DEFAULT_SINK_QUEUE
+
+    def init(self, sid, time_resolution=1, output_format=None, output_path="results_{eid}",
+             chunk_steps=DEFAULT_CHUNK_STEPS, sink=None, sink_queue=DEFAULT_SINK_QUEUE, **kwargs):
+        if output_format is not None and sink is not None:
+            raise ValueError("output_format e sink sono alternativi")
+        if output_format is not None:
+            require_format("output_format", output_format, WRITERS)
+        if sink is not None:
+            require_format("sink", sink, SINKS)
+        self.output_format = output_format
+        self.output_path = output_path
+        self.chunk_steps = chunk_steps
+        self.sink = sink
+        self.sink_queue = sink_queue
+        return self.meta
+
+    def create(self, num, model, **model_params):
+        entities = []
+        start = len(self.tables)
+        for i in range(start, start + num):
+            eid = f"{model}-{i}"
+            if self.sink is not None:
+                self.tables[eid] = StreamingSink(self.make_writer(eid, SINKS, self.sink), self.sink_queue)
+            else:
+                self.tables[eid] = ResultTable(self.chunk_steps, self.make_writer(eid, WRITERS, self.output_format))
+            entities.append({"eid": eid, "type": model})
+        return entities
+
+    def make_writer(self, eid, formats, fmt):
+        if fmt is None:
+            return None
+        writer_cls, ext, _ = formats[fmt]
+        path = self.output_path.format(eid=eid)
+        if not os.path.splitext(path)[1]:
+            path += ext
+        return writer_cls(path)
+
+    def step(self, time, inputs, max_advance):
+        if self.sink is not None:
+            for eid, attrs in inputs.items():
+                self.tables[eid].put(time, attrs)
+            return
+        for eid, attrs in inputs.items():
+            self.tables[eid].append(time, attrs)
+
+    def get_data(self, outputs):
+        raise RuntimeError("Recorder: simulatore di sola lettura degli input")
+
+    def get_frame(self, eid):
+        """
+        DataFrame dei valori registrati dall'entità eid.
+        """
+        return self.tables[eid].frame()
+
+    def get_dict(self, eid):
+        """
+        Stessa struttura del Dict di OutputSimulator:
+        {time: {attr: {src: valore}}} (valori NaN omessi).
+        """
+        df = self.get_frame(eid)
+        result = {}
+        for time, row in zip(df.index, df.to_numpy()):
+            step = result.setdefault(int(time), {})
+            for (attr, src), value in zip(df.columns, row):
+                if not np.isnan(value):
+                    step.setdefault(attr, {})[src] = value
+        return result
+
+    def finalize(self):
+        for table in self.tables.values():
+            table.close()
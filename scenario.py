@@ -2,8 +2,11 @@ import nest_asyncio
 nest_asyncio.apply()
 
 import random
-from pprint import pprint
+import sys
 import mosaik
+from loguru import logger
+
+from scenario_builder import build_scenario, load_spec
 
 STEP = 3600  # 1 ora
 END = 3600 * 12 # 12 ore
@@ -15,8 +18,9 @@ SIM_CONFIG = {
     "LoadPred": {"python": "load_profile_DA_simulator:LoadProfileDASimulator"},
     "LoadRT": {"python": "load_profile_RT_simulator:LoadProfileRTSimulator"},
     "SmartMeter": {"python": "smart_meter_simulator:SmartMeterSimulator"},
-    # "DAMarket": {"python": "DA_market_simulator:DAMarketSimulator"},
-    "Output": {"python": "mosaik.basic_simulators:OutputSimulator"},
+    "Household": {"python": "household_simulator:HouseholdSimulator"},
+    "DAMarket": {"python": "DA_market_simulator:DAMarketSimulator"},
+    "Output": {"python": "result_recorder:ResultRecorderSimulator"},
 }
 
 # Percorso al CSV dei profili di carico
@@ -24,162 +28,210 @@ LOAD_CSV_PATH_PRED = "csv_data/load_istat_social_groups.csv"
 LOAD_CSV_PATH_RT = "csv_data/rt_consumes.csv"
 PV_DA_CSV_PATH = "csv_data/pv_DA_production_prediction.csv"
 
-with mosaik.World(SIM_CONFIG) as world:
-    # --- Start simulators ---
-    weathersim = world.start(
-        "Weather", 
-        sim_id="Weather", 
-        step_size=STEP
-    )
-
-    pvsim = world.start(
-        "PV", 
-        sim_id="PV", 
-        step_size=STEP
-    )
-
-    pv_da_sim = world.start(
-        "PV_DA",
-        sim_id="PV_DA",
-        csv_path=PV_DA_CSV_PATH,
-        step_size=STEP
-    )
-
-    load_pred_sim = world.start(
-        "LoadPred", 
-        sim_id="LoadPred", 
-        csv_path=LOAD_CSV_PATH_PRED, 
-        step_size=STEP
-    )
-
-    load_rt_sim = world.start(
-        "LoadRT", 
-        sim_id="LoadRT", 
-        csv_path=LOAD_CSV_PATH_RT, 
-        step_size=STEP
-    )
-
-    smart_sim = world.start(
-        "SmartMeter",
-        sim_id="SmartMeter",
-        step_size=STEP
-    )
-    
-    """ da_market = world.start(
-        "DAMarket",
-        sim_id="DAMarket",
-        step_size=STEP
-    ) """
-    
-    outputsim = world.start("Output")
-
-    # --- Weather: genera valori casuali tra 0 e 1000 W/m2 ---
-    weather = weathersim.Function(function=lambda t: random.uniform(0, 1000))
-
-    profile_ids = [str(i) for i in range(10)]   # Ho 10 profili di carico e faccio dipendere
-                                                # la produzione PV (cambia l'area) dallo 
-                                                # stesso ID
-
-    # --- Crea PV con limite 6 kW ---
-    pvs = [pvsim.HomePV.create(
-            1, 
-            profile_id=pid,
-            area=10 +float(pid)*0.1,    # Cast a float per calcolo dell'area
-            latitude=53.14, 
-            efficiency=0.5, 
-            el_tilt=32.0, 
-            az_tilt=0.0 
-        )[0]
-        for pid in profile_ids
-    ]
-
-    # --- Connect Weather → PV ---
-    for pv in pvs:
-        world.connect(weather, pv, ("value", "DNI[W/m2]"))
-
-    # -----------------------------
-    # PV Day-Ahead production profiles
-    # -----------------------------
-    pv_da_profiles = []
-
-    for pid in profile_ids:
-        pv_da_profiles.append(
-            pv_da_sim.PV_DA_Production.create(
-                1,
-                profile_id=pid
-            )[0]
-        )
-
-    # -----------------------------
-    # Load profiles creation
-    # -----------------------------
-    # CSV contiene colonne '0' a '9' (da usare come profile_id)
-
-    loads_pred = []
-    loads_rt = []
-
-    for pid in profile_ids:
-        loads_pred.append(
-            load_pred_sim.LoadProfileDA.create(1, profile_id=pid)[0]
-        )
-        loads_rt.append(
-            load_rt_sim.LoadProfileRT.create(1, profile_id=pid)[0]
-        )
-
-    # -------------------------
-    # Smart Meters creation
-    # -------------------------
-    smart_meters = []
-
-    for pid in profile_ids:
-        sm = smart_sim.SmartMeter.create(
-            1,
-            profile_id=pid
-        )[0]
-        smart_meters.append(sm)
-    # -------------------------
-    # DA Market creation
-    # -------------------------
-    """ market = da_market.DAMarket.create(1)[0] """
-
-    # -------------------------------------------------
-    # CONNECTIONS
-    # -------------------------------------------------
-    for pv, pv_da, lp, lr, sm in zip(pvs, pv_da_profiles, loads_pred, loads_rt, smart_meters):
-        # PV → SmartMeter
-        world.connect(pv, sm, ("P[kW]", "P_PV_RT[kW]"))
-
-        # PV DA → SmartMeter
-        world.connect(pv_da, sm, ("P_PV_DA[kW]", "P_PV_DA[kW]"))
-
-        # LoadPred → SmartMeter (Day-Ahead)
-        world.connect(lp, sm, ("P_load_DA[kW]", "P_load_DA[kW]"))
-
-        # LoadRT → SmartMeter (Real-Time)
-        world.connect(lr, sm, ("P_load_RT[kW]", "P_load_RT[kW]"))
-
-    # --- Connect PV + Load -> OutputSimulator ---
-    output = outputsim.Dict()
-    for sm in smart_meters:
-        world.connect(
-            sm,
-            output,
-            "P_PV_DA[kW]",
-            "P_PV_RT[kW]",
-            "P_load_DA[kW]",
-            "P_load_RT[kW]",
-
-            # "P_DA_committed[kW]",
-            # "P_RT_committed[kW]",
-
-            # "P_net_DA[kW]",
-            # "P_net_phys_RT[kW]",
-            # "P_net_RT[kW]",
-        )
-    
-    # --- Run simulation ---
-    world.run(until=END)
-
-    # --- Get results from OutputSimulator ---
-    result = outputsim.get_dict(output.eid)
-    pprint(result)
+# True: ogni casa è una sola entità Household (PV, profili e smart meter
+# calcolati nello stesso simulatore) invece di cinque entità collegate
+FUSED_HOUSEHOLDS = False
+
+# Sink dei risultati: None = tabella in memoria, oppure "csv"/"jsonl"/"arrow"
+# per scrivere ogni step subito su OUTPUT_PATH (leggibile durante la simulazione)
+OUTPUT_SINK = None
+OUTPUT_PATH = "results_{eid}"
+
+# Profili di carico (colonne '0' a '9' dei CSV) e parametri PV di default
+PROFILE_IDS = [str(i) for i in range(10)]
+PV_AREA = 10.0        # area della casa '0' (m2)
+PV_AREA_STEP = 0.1    # incremento dell'area per profile_id
+PV_EFFICIENCY = 0.5
+
+# Attributi degli smart meter registrati dall'Output
+OUTPUT_ATTRS = [
+    "P_PV_DA[kW]",
+    "P_PV_RT[kW]",
+    "P_load_DA[kW]",
+    "P_load_RT[kW]",
+
+    # "P_DA_committed[kW]",
+    # "P_RT_committed[kW]",
+
+    # "P_net_DA[kW]",
+    # "P_net_phys_RT[kW]",
+    # "P_net_RT[kW]",
+]
+
+
+def irradiance(seed=None, low=0.0, high=1000.0):
+    """
+    Funzione del tempo per il Weather: valori casuali tra low e high W/m2.
+    """
+    rng = random.Random(seed)
+    return lambda t: rng.uniform(low, high)
+
+
+def market_accounts(n):
+    """
+    Account fittizi per il mercato DA con backend in memoria: un
+    indirizzo deterministico per casa (nessuna chiave privata).
+    """
+    return ["0x" + f"{i + 1:040x}" for i in range(n)]
+
+
+def market_meter_accounts(meters):
+    """
+    meter_accounts del DAMarket: full_id dello smart meter -> account.
+    """
+    return dict(zip(meters, market_accounts(len(meters))))
+
+
+# -------------------------------------------------
+# SPECIFICA DELLO SCENARIO
+# -------------------------------------------------
+def default_spec(step=STEP, end=END, profile_ids=None, pv_area=PV_AREA, pv_area_step=PV_AREA_STEP,
+                 pv_efficiency=PV_EFFICIENCY, seed=None, market=False, fused=FUSED_HOUSEHOLDS,
+                 output_sink=OUTPUT_SINK, output_path=OUTPUT_PATH, profile_dir=None, profile_cprofile=False):
+    """
+    Specifica (scenario_builder) dello scenario delle case:
+    - profile_ids: profili delle case (default PROFILE_IDS)
+    - pv_area, pv_area_step: area PV = pv_area + profile_id * pv_area_step
+    - seed: seed dell'irradianza casuale (None = non riproducibile)
+    - market: aggiunge il mercato DA (backend in memoria, senza chiavi
+      private) che riceve P_net_DA dagli smart meter
+    - fused: una entità Household per casa invece di cinque entità
+    - profile_dir, profile_cprofile: strumentazione dei simulatori del
+      progetto (sim_profiling), spenta senza profile_dir
+    """
+    if profile_ids is None:
+        profile_ids = PROFILE_IDS
+    profile_ids = [str(pid) for pid in profile_ids]
+    n = len(profile_ids)
+
+    # Stessi parametri PV per HomePV e Household
+    pv_params = {
+        "profile_ids": profile_ids,
+        "area": [pv_area + float(pid)*pv_area_step for pid in profile_ids],    # Cast a float per calcolo dell'area
+        "latitude": 53.14,
+        "efficiency": pv_efficiency,
+        "el_tilt": 32.0,
+        "az_tilt": 0.0,
+    }
+
+    simulators = {"Weather": {"params": {"step_size": step}}}
+    entities = {
+        # --- Weather: genera valori casuali tra 0 e 1000 W/m2 ---
+        "weather": {"simulator": "Weather", "model": "Function",
+                    "params": {"function": {"$call": "scenario:irradiance", "seed": seed}}},
+    }
+
+    if fused:
+        # --- Case fuse: PV, profili e meter nello stesso simulatore ---
+        simulators["Household"] = {"params": {
+            "load_da_csv": LOAD_CSV_PATH_PRED,
+            "load_rt_csv": LOAD_CSV_PATH_RT,
+            "pv_da_csv": PV_DA_CSV_PATH,
+            "step_size": step,
+        }}
+        entities["meters"] = {"simulator": "Household", "model": "Household", "num": n, "params": pv_params}
+        connections = [
+            # Weather → Household
+            {"from": "weather", "to": "meters", "attrs": [["value", "DNI[W/m2]"]]},
+        ]
+    else:
+        simulators.update({
+            "PV": {"params": {"step_size": step}},
+            "PV_DA": {"params": {"csv_path": PV_DA_CSV_PATH, "step_size": step}},
+            "LoadPred": {"params": {"csv_path": LOAD_CSV_PATH_PRED, "step_size": step}},
+            "LoadRT": {"params": {"csv_path": LOAD_CSV_PATH_RT, "step_size": step}},
+            "SmartMeter": {"params": {"step_size": step}},
+        })
+        ids = {"profile_ids": profile_ids}
+        entities.update({
+            # PV con limite 6 kW, previsioni PV DA, profili DA/RT e smart meter
+            "pvs": {"simulator": "PV", "model": "HomePV", "num": n, "params": pv_params},
+            "pv_da": {"simulator": "PV_DA", "model": "PV_DA_Production", "num": n, "params": ids},
+            "loads_pred": {"simulator": "LoadPred", "model": "LoadProfileDA", "num": n, "params": ids},
+            "loads_rt": {"simulator": "LoadRT", "model": "LoadProfileRT", "num": n, "params": ids},
+            "meters": {"simulator": "SmartMeter", "model": "SmartMeter", "num": n, "params": ids},
+        })
+        connections = [
+            # Weather → PV
+            {"from": "weather", "to": "pvs", "attrs": [["value", "DNI[W/m2]"]]},
+            # PV, PV DA, LoadPred (Day-Ahead), LoadRT (Real-Time) → SmartMeter
+            {"from": "pvs", "to": "meters", "attrs": [["P[kW]", "P_PV_RT[kW]"]]},
+            {"from": "pv_da", "to": "meters", "attrs": ["P_PV_DA[kW]"]},
+            {"from": "loads_pred", "to": "meters", "attrs": ["P_load_DA[kW]"]},
+            {"from": "loads_rt", "to": "meters", "attrs": ["P_load_RT[kW]"]},
+        ]
+
+    if market:
+        # --- DA Market: netto Day-Ahead dei meter per gli ordini ---
+        simulators["DAMarket"] = {"params": {
+            "step_size": step,
+            "backend": "memory",
+        }}
+        entities["market"] = {"simulator": "DAMarket", "model": "DAMarket", "params": {
+            "meter_accounts": {"$call": "scenario:market_meter_accounts", "meters": {"$full_ids": "meters"}},
+        }}
+        connections.append({"from": "meters", "to": "market", "attrs": ["P_net_DA[kW]"]})
+
+    # --- SmartMeter → Output ---
+    simulators["Output"] = {"params": {"sink": output_sink, "output_path": output_path}}
+    entities["output"] = {"simulator": "Output", "model": "Recorder"}
+    connections.append({"from": "meters", "to": "output", "attrs": OUTPUT_ATTRS})
+
+    # Strumentazione di tutti i simulatori del progetto (non del Weather di mosaik)
+    if profile_dir is not None:
+        for name, sim in simulators.items():
+            if name != "Weather":
+                sim["params"].update(profile_dir=profile_dir, profile_cprofile=profile_cprofile)
+
+    return {
+        "end": end,
+        "simulators": simulators,
+        "entities": entities,
+        "connections": connections,
+        "result": "output",
+    }
+
+
+# -------------------------------------------------
+# ESECUZIONE
+# -------------------------------------------------
+def run_spec(spec, port=None, quiet=False):
+    """
+    Costruisce ed esegue lo scenario descritto da spec; restituisce il
+    DataFrame del Recorder spec["result"] (tempo × attributo/sorgente).
+
+    - port: porta del socket mosaik (una diversa per ogni World in
+      parallelo); None = default di mosaik
+    - quiet: niente logo, log e barra di avanzamento (sweep)
+    """
+    mosaik_config = {"addr": ("127.0.0.1", port)} if port is not None else None
+    if quiet:
+        logger.disable("mosaik")
+
+    with mosaik.World(spec.get("sim_config", SIM_CONFIG), mosaik_config=mosaik_config, skip_greetings=quiet,
+                      configure_logging=not quiet) as world:
+        sims, entities = build_scenario(world, spec)
+
+        # --- Run simulation ---
+        world.run(until=spec["end"], print_progress=not quiet)
+
+        # --- Risultati: DataFrame (tempo × attributo/sorgente) ---
+        result = spec.get("result", "output")
+        output = entities[result][0]
+        return sims[spec["entities"][result]["simulator"]].get_frame(output.eid)
+
+
+def run_scenario(port=None, quiet=False, **params):
+    """
+    Esegue lo scenario delle case (parametri di default_spec).
+    """
+    return run_spec(default_spec(**params), port=port, quiet=quiet)
+
+
+if __name__ == "__main__":
+    # python scenario.py [specifica.json|.toml|.yaml]
+    if len(sys.argv) > 1:
+        result = run_spec(load_spec(sys.argv[1]))
+    else:
+        result = run_scenario()
+    print(result)
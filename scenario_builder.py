@@ -0,0 +1,173 @@
+# scenario_builder.py
+#
+# Scenari mosaik descritti da una specifica dichiarativa (dict, file
+# JSON, TOML o YAML) invece che da codice:
+#
+#   {
+#     "end": 43200,
+#     "simulators": {                       # world.start, sim_id = nome
+#       "PV": {"sim": "PV", "params": {"step_size": 3600}},
+#       ...
+#     },
+#     "entities": {                         # una create per gruppo
+#       "pvs": {"simulator": "PV", "model": "HomePV", "num": 10,
+#               "params": {"profile_ids": ["0", ...], "area": [10.0, ...]}},
+#       ...
+#     },
+#     "connections": [                      # connect_many tra gruppi
+#       {"from": "pvs", "to": "meters", "attrs": [["P[kW]", "P_PV_RT[kW]"]]},
+#       ...
+#     ],
+#     "result": "output"                    # gruppo del Recorder
+#   }
+#
+# Valori speciali nei parametri (risolti in build_scenario):
+# - {"$call": "modulo:funzione", ...}: risultato della funzione chiamata
+#   con le altre chiavi come argomenti (es. la funzione dell'irradianza);
+#   solo funzioni definite nei moduli di CALL_MODULES (o call_modules di
+#   build_scenario): una specifica letta da file non può chiamare
+#   funzioni arbitrarie (es. "os:system")
+# - {"$full_ids": "gruppo"}: full_id delle entità di un gruppo già creato
+#
+# Ogni gruppo di entità è creato con una sola create (parametri per
+# entità come liste, vedi entity_params.expand_params), e i collegamenti
+# sono definiti per gruppi: la specifica resta compatta anche con
+# migliaia di case, e si può generare, salvare e riusare. I collegamenti
+# restano comunque un world.connect per coppia di entità.
+
+import importlib
+import inspect
+import json
+import os
+
+
+# Moduli del progetto le cui funzioni si possono chiamare con "$call"
+CALL_MODULES = frozenset({"scenario"})
+
+
+# -------------------------------------------------------------------
+# FILE DELLA SPECIFICA
+# -------------------------------------------------------------------
+def load_spec(path):
+    """
+    Specifica da file: .json, .toml (tomllib) oppure .yaml/.yml (PyYAML, opzionale).
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".json":
+        with open(path) as f:
+            return json.load(f)
+    if ext == ".toml":
+        import tomllib
+
+        with open(path, "rb") as f:
+            return tomllib.load(f)
+    if ext in (".yaml", ".yml"):
+        try:
+            import yaml
+        except ImportError:
+            raise ImportError(f"Per leggere {path} serve il pacchetto PyYAML") from None
+        with open(path) as f:
+            return yaml.safe_load(f)
+    raise ValueError(f"Formato della specifica non supportato: {path} (ammessi: .json, .toml, .yaml)")
+
+
+def save_spec(spec, path):
+    """
+    Salva la specifica in JSON (per riusarla senza rigenerarla).
+    """
+    with open(path, "w") as f:
+        json.dump(spec, f, indent=2)
+    return path
+
+
+# -------------------------------------------------------------------
+# RISOLUZIONE DEI PARAMETRI
+# -------------------------------------------------------------------
+def import_callable(ref, modules=CALL_MODULES):
+    """
+    "modulo:funzione" -> funzione, solo se il modulo è in modules e la
+    funzione è pubblica e definita nel modulo stesso (non importata).
+    """
+    module, _, name = ref.partition(":")
+    if module not in modules:
+        raise ValueError(f"$call non ammesso: {ref} (moduli ammessi: {sorted(modules)})")
+    obj = getattr(importlib.import_module(module), name, None)
+    if name.startswith("_") or not inspect.isfunction(obj) or obj.__module__ != module:
+        raise ValueError(f"$call non ammesso: {ref} (non è una funzione pubblica di {module})")
+    return obj
+
+
+def resolve(value, entities, modules=CALL_MODULES):
+    """
+    Sostituisce ricorsivamente i valori speciali "$call" e "$full_ids".
+    """
+    if isinstance(value, list):
+        return [resolve(v, entities, modules) for v in value]
+    if not isinstance(value, dict):
+        return value
+    if "$full_ids" in value:
+        return [e.full_id for e in entities[value["$full_ids"]]]
+    if "$call" in value:
+        args = {k: resolve(v, entities, modules) for k, v in value.items() if k != "$call"}
+        return import_callable(value["$call"], modules)(**args)
+    return {k: resolve(v, entities, modules) for k, v in value.items()}
+
+
+# -------------------------------------------------------------------
+# COLLEGAMENTI
+# -------------------------------------------------------------------
+def connect_many(world, srcs, dests, *attr_pairs, **kwargs):
+    """
+    Collega due gruppi di entità con gli stessi attributi:
+    - stessa lunghezza: uno a uno, per posizione (PV i → meter i)
+    - una sorgente: verso tutte le destinazioni (meteo → tutti i PV)
+    - una destinazione: da tutte le sorgenti (meter → Output)
+
+    È un ciclo di world.connect, uno per coppia: semplifica la
+    specifica, non rende più veloce la costruzione dello scenario.
+
+    kwargs (time_shifted, initial_data, weak, ...) passati a world.connect.
+    Restituisce il numero di coppie collegate.
+    """
+    if len(srcs) == len(dests):
+        pairs = zip(srcs, dests)
+    elif len(srcs) == 1:
+        pairs = ((srcs[0], dest) for dest in dests)
+    elif len(dests) == 1:
+        pairs = ((src, dests[0]) for src in srcs)
+    else:
+        raise ValueError(f"Gruppi non collegabili: {len(srcs)} sorgenti, {len(dests)} destinazioni")
+
+    attr_pairs = [a if isinstance(a, str) else tuple(a) for a in attr_pairs]
+    n = 0
+    for src, dest in pairs:
+        world.connect(src, dest, *attr_pairs, **kwargs)
+        n += 1
+    return n
+
+
+# -------------------------------------------------------------------
+# COSTRUZIONE
+# -------------------------------------------------------------------
+def build_scenario(world, spec, call_modules=CALL_MODULES):
+    """
+    Avvia i simulatori, crea i gruppi di entità e li collega secondo spec.
+    call_modules: moduli le cui funzioni sono ammesse in "$call".
+    Restituisce (simulatori, entità): nome -> ModelFactory e nome -> lista di entità.
+    """
+    sims = {}
+    for name, sim in spec.get("simulators", {}).items():
+        params = resolve(sim.get("params", {}), {}, call_modules)
+        sims[name] = world.start(sim.get("sim", name), sim_id=name, **params)
+
+    entities = {}
+    for name, group in spec.get("entities", {}).items():
+        factory = getattr(sims[group["simulator"]], group["model"])
+        params = resolve(group.get("params", {}), entities, call_modules)
+        entities[name] = factory.create(group.get("num", 1), **params)
+
+    for conn in spec.get("connections", []):
+        kwargs = {k: v for k, v in conn.items() if k not in ("from", "to", "attrs")}
+        connect_many(world, entities[conn["from"]], entities[conn["to"]], *conn["attrs"], **kwargs)
+
+    return sims, entities
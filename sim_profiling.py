@@ -0,0 +1,286 @@
+# sim_profiling.py
+#
+# Strumentazione dei simulatori mosaik del progetto: dove passa il
+# tempo una simulazione (PV, PV_DA, LoadPred, LoadRT, SmartMeter,
+# mercato, Output), senza profiler esterni.
+#
+# Il mixin SimProfilingMixin, messo prima di mosaik_api_v3.Simulator
+# nelle basi, avvolge init/create/step/get_data della classe e registra:
+# - durata di ogni chiamata (istogramma e percentili per metodo)
+# - entità create
+# - dimensione degli input dello step e degli output di get_data
+#   (numero di valori)
+# A fine simulazione (finalize) scrive in profile_dir:
+# - <sid>.report.json: riepilogo del simulatore
+# - <sid>.trace.json: eventi in formato Chrome trace (chrome://tracing,
+#   Perfetto), uno per chiamata
+# - <sid>.prof: dump cProfile delle chiamate (solo con profile_cprofile)
+#
+# Parametri accettati da init() dei simulatori (via **kwargs):
+# - profile_dir:      cartella dei file; senza, la strumentazione è
+#                     spenta (default: variabile d'ambiente SIM_PROFILE_DIR)
+# - profile_cprofile: True per attivare cProfile durante le chiamate
+#
+# Per unire i file di una run:
+#   python sim_profiling.py <profile_dir>
+# stampa la tabella dei tempi per simulatore e scrive <profile_dir>/trace.json.
+
+import cProfile
+import functools
+import glob
+import json
+import os
+import sys
+import time
+import zlib
+import numpy as np
+import pandas as pd
+
+
+# Metodi avvolti dal mixin
+PROFILED_METHODS = ("init", "create", "step", "get_data")
+
+# Variabile d'ambiente con la cartella di default (utile nei processi dello sweep)
+PROFILE_DIR_ENV = "SIM_PROFILE_DIR"
+
+
+def count_values(data):
+    """
+    Numero di valori in {eid: {attr: valore}} o {eid: {attr: {src: valore}}}.
+    """
+    n = 0
+    for attrs in data.values():
+        for value in attrs.values():
+            n += len(value) if isinstance(value, dict) else 1
+    return n
+
+
+def histogram(durations_us):
+    """
+    Istogramma a potenze di 2 (µs): conteggi per limite superiore del bucket.
+    """
+    buckets = np.ceil(np.log2(np.maximum(durations_us, 1.0))).astype(int)
+    counts = np.bincount(buckets)
+    return {str(2 ** k): int(c) for k, c in enumerate(counts) if c}
+
+
+class SimProfiler:
+    """
+    Misure di un simulatore: durate per metodo, entità, payload ed eventi trace.
+    """
+
+    def __init__(self, sid, profile_dir, cprofile=False):
+        self.sid = sid
+        self.profile_dir = profile_dir
+        self.profile = cProfile.Profile() if cprofile else None
+
+        # metodo -> durate (ns)
+        self.durations = {name: [] for name in PROFILED_METHODS}
+        self.entities = 0
+        self.step_inputs = []
+        self.data_outputs = []
+
+        # Eventi Chrome trace: (metodo, inizio ns, durata ns, tempo mosaik)
+        self.events = []
+
+    def record(self, name, start, duration, args, result):
+        self.durations[name].append(duration)
+        sim_time = None
+        if name == "step":
+            sim_time = args[0]
+            self.step_inputs.append(count_values(args[1]))
+        elif name == "get_data":
+            self.data_outputs.append(count_values(result))
+        elif name == "create":
+            self.entities += len(result)
+        self.events.append((name, start, duration, sim_time))
+
+    def report(self, cls_name):
+        methods = {}
+        for name, durations in self.durations.items():
+            if not durations:
+                continue
+            us = np.array(durations) / 1000.0
+            methods[name] = {
+                "calls": len(us),
+                "total_s": float(us.sum() / 1e6),
+                "mean_us": float(us.mean()),
+                "p50_us": float(np.percentile(us, 50)),
+                "p90_us": float(np.percentile(us, 90)),
+                "p99_us": float(np.percentile(us, 99)),
+                "max_us": float(us.max()),
+                "histogram_us": histogram(us),
+            }
+
+        def sizes(values):
+            if not values:
+                return None
+            return {"mean": float(np.mean(values)), "max": int(max(values)), "total": int(sum(values))}
+
+        return {
+            "sid": self.sid,
+            "class": cls_name,
+            "entities": self.entities,
+            "methods": methods,
+            "step_inputs": sizes(self.step_inputs),
+            "get_data_outputs": sizes(self.data_outputs),
+        }
+
+    def trace(self):
+        """
+        Eventi in formato Chrome trace: una riga (tid) per simulatore.
+        """
+        pid = os.getpid()
+        tid = zlib.crc32(self.sid.encode())
+        events = [{"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": self.sid}}]
+        for name, start, duration, sim_time in self.events:
+            event = {"name": name, "cat": self.sid, "ph": "X", "pid": pid, "tid": tid,
+                     "ts": start / 1000.0, "dur": duration / 1000.0}
+            if sim_time is not None:
+                event["args"] = {"time": sim_time}
+            events.append(event)
+        return events
+
+    def dump(self, cls_name):
+        os.makedirs(self.profile_dir, exist_ok=True)
+        base = os.path.join(self.profile_dir, self.sid)
+        with open(f"{base}.report.json", "w") as f:
+            json.dump(self.report(cls_name), f, indent=2)
+        with open(f"{base}.trace.json", "w") as f:
+            json.dump({"traceEvents": self.trace()}, f)
+        if self.profile is not None:
+            self.profile.dump_stats(f"{base}.prof")
+
+
+def instrument(name, method):
+    """
+    Avvolge un metodo: con il profiler spento costa un controllo di attributo.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        prof = self._profiler
+        if prof is None:
+            return method(self, *args, **kwargs)
+        if prof.profile is not None:
+            prof.profile.enable()
+        start = time.perf_counter_ns()
+        try:
+            result = method(self, *args, **kwargs)
+        finally:
+            duration = time.perf_counter_ns() - start
+            if prof.profile is not None:
+                prof.profile.disable()
+        prof.record(name, start, duration, args, result)
+        return result
+
+    wrapper.__profiled__ = True
+    return wrapper
+
+
+class SimProfilingMixin:
+    """
+    Mixin per i simulatori: class X(SimProfilingMixin, mosaik_api_v3.Simulator).
+    """
+
+    _profiler = None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        for name in PROFILED_METHODS:
+            method = getattr(cls, name, None)
+            if method is None or getattr(method, "__profiled__", False):
+                continue
+            if name == "init":
+                setattr(cls, name, instrument_init(method))
+            else:
+                setattr(cls, name, instrument(name, method))
+
+        finalize = getattr(cls, "finalize", None)
+        if finalize is not None and not getattr(finalize, "__profiled__", False):
+            setattr(cls, "finalize", instrument_finalize(finalize))
+
+
+def instrument_init(method):
+    """
+    init: crea il profiler (se richiesto) prima di misurare init stesso.
+    """
+    timed = instrument("init", method)
+
+    @functools.wraps(method)
+    def wrapper(self, sid, *args, profile_dir=None, profile_cprofile=False, **kwargs):
+        profile_dir = profile_dir or os.environ.get(PROFILE_DIR_ENV)
+        if profile_dir:
+            self._profiler = SimProfiler(sid, profile_dir, cprofile=profile_cprofile)
+        return timed(self, sid, *args, **kwargs)
+
+    wrapper.__profiled__ = True
+    return wrapper
+
+
+def instrument_finalize(method):
+    """
+    finalize: dopo quello del simulatore scrive report, trace e dump cProfile.
+    """
+    @functools.wraps(method)
+    def wrapper(self):
+        try:
+            return method(self)
+        finally:
+            if self._profiler is not None:
+                self._profiler.dump(type(self).__name__)
+
+    wrapper.__profiled__ = True
+    return wrapper
+
+
+# -------------------------------------------------------------------
+# REPORT DI UNA RUN
+# -------------------------------------------------------------------
+def load_reports(profile_dir):
+    reports = []
+    for path in sorted(glob.glob(os.path.join(profile_dir, "*.report.json"))):
+        with open(path) as f:
+            reports.append(json.load(f))
+    return reports
+
+
+def summary_table(profile_dir):
+    """
+    Tabella (simulatore, metodo) -> chiamate, tempo totale e percentili,
+    ordinata per tempo totale decrescente.
+    """
+    rows = []
+    for rep in load_reports(profile_dir):
+        for name, stats in rep["methods"].items():
+            rows.append({
+                "sid": rep["sid"],
+                "method": name,
+                "entities": rep["entities"],
+                **{k: v for k, v in stats.items() if k != "histogram_us"},
+            })
+    if not rows:
+        return pd.DataFrame()
+    return pd.DataFrame(rows).set_index(["sid", "method"]).sort_values("total_s", ascending=False)
+
+
+def merge_traces(profile_dir, output="trace.json"):
+    """
+    Unisce i <sid>.trace.json della cartella in un solo file Chrome trace.
+    """
+    events = []
+    for path in sorted(glob.glob(os.path.join(profile_dir, "*.trace.json"))):
+        if os.path.basename(path) == output:
+            continue
+        with open(path) as f:
+            events.extend(json.load(f)["traceEvents"])
+    path = os.path.join(profile_dir, output)
+    with open(path, "w") as f:
+        json.dump({"traceEvents": events}, f)
+    return path
+
+
+if __name__ == "__main__":
+    profile_dir = sys.argv[1] if len(sys.argv) > 1 else "profiles"
+    with pd.option_context("display.width", 200, "display.max_columns", 20):
+        print(summary_table(profile_dir))
+    print(f"Chrome trace: {merge_traces(profile_dir)}")
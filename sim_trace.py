@@ -0,0 +1,239 @@
+# sim_trace.py
+#
+# Logging strutturato condiviso dai simulatori mosaik del progetto.
+#
+# Sostituisce le print per-entità negli step:
+# - livelli (standard logging): DEBUG = valori di tutte le entità,
+#   INFO = riepilogo per step (n, somma, min, max), WARNING+ = nessun record
+# - campionamento per simulatore: un record ogni `log_every` step
+# - sink bufferizzati: JSONL (testo) o binario (float64 grezzi)
+#
+# Con il logging disattivato (default) lo step paga solo il controllo
+# di un attributo booleano:
+#
+#     if self.tracer.enabled and self.tracer.sample():
+#         self.tracer.record(time, self.cache, eids=self.eid_pos)
+#
+# Parametri accettati da init() dei simulatori (via **kwargs):
+# - log_level:    "DEBUG", "INFO", "WARNING", ... (default "WARNING")
+# - log_every:    campionamento in step (default 1 = ogni step)
+# - trace_path:   file di destinazione; "{sid}" viene sostituito con
+#                 l'ID del simulatore. Senza trace_path i record vanno
+#                 al modulo logging standard.
+# - trace_format: "jsonl" (default) oppure "binary"
+
+import atexit
+import json
+import logging
+import os
+import struct
+import numpy as np
+
+
+# Dimensione del buffer dei file di trace (byte)
+TRACE_BUFFER_SIZE = 1 << 20
+
+# Sink aperti nel processo: percorso assoluto -> sink
+_SINKS = {}
+
+
+# -------------------------------------------------------------------
+# SINK
+# -------------------------------------------------------------------
+class JsonlTraceSink:
+    """
+    Un record JSON per riga su file bufferizzato.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.f = open(path, "w", buffering=TRACE_BUFFER_SIZE)
+
+    def write(self, sid, time, level, values, eids, extra):
+        rec = {"sim": sid, "t": time, **extra}
+        if level <= logging.DEBUG:
+            rec["values"] = dict(zip(eids, np.asarray(values).tolist()))
+        else:
+            rec.update(_summary(values))
+        self.f.write(json.dumps(rec))
+        self.f.write("\n")
+
+    def flush(self):
+        self.f.flush()
+
+    def close(self):
+        self.f.close()
+
+
+class BinaryTraceSink:
+    """
+    Record binari a lunghezza variabile su file bufferizzato.
+
+    Ogni record: header little-endian (sid_len: u16, time: f64, n: u32),
+    poi sid (utf-8) e n valori float64. L'ordine delle entità di ogni
+    simulatore è scritto in un file JSON a fianco (<path>.eids.json).
+    Per rileggere il file: read_binary_trace(path).
+    """
+
+    HEADER = struct.Struct("<HdI")
+
+    def __init__(self, path):
+        self.path = path
+        self.f = open(path, "wb", buffering=TRACE_BUFFER_SIZE)
+        self.eids = {}
+
+    def write(self, sid, time, level, values, eids, extra):
+        values = np.asarray(values, dtype="<f8")
+        if level > logging.DEBUG:
+            s = _summary(values)
+            values = np.array([s["n"], s["sum"], s["min"], s["max"]], dtype="<f8")
+            eids = ["n", "sum", "min", "max"]
+
+        eids = list(eids)
+        if self.eids.get(sid) != eids:
+            self.eids[sid] = eids
+            with open(self.path + ".eids.json", "w") as f:
+                json.dump(self.eids, f)
+
+        sid_b = sid.encode()
+        self.f.write(self.HEADER.pack(len(sid_b), float(time), len(values)))
+        self.f.write(sid_b)
+        self.f.write(values.tobytes())
+
+    def flush(self):
+        self.f.flush()
+
+    def close(self):
+        self.f.close()
+
+
+class LoggingTraceSink:
+    """
+    Inoltra i record al modulo logging standard (debug interattivo).
+    """
+
+    def write(self, sid, time, level, values, eids, extra):
+        logger = logging.getLogger(f"mosaik_thesis.{sid}")
+        if level <= logging.DEBUG:
+            payload = dict(zip(eids, np.asarray(values).tolist()))
+        else:
+            payload = _summary(values)
+        logger.log(level, "time=%s %s %s", time, extra, payload)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def read_binary_trace(path):
+    """
+    Rilegge un trace binario come lista di
+    (sid, time, eids, valori ndarray).
+    """
+    with open(path + ".eids.json") as f:
+        eids = json.load(f)
+
+    records = []
+    header = BinaryTraceSink.HEADER
+    with open(path, "rb") as f:
+        buf = f.read()
+
+    pos = 0
+    while pos < len(buf):
+        sid_len, time, n = header.unpack_from(buf, pos)
+        pos += header.size
+        sid = buf[pos:pos + sid_len].decode()
+        pos += sid_len
+        values = np.frombuffer(buf, dtype="<f8", count=n, offset=pos)
+        pos += 8 * n
+        records.append((sid, time, eids[sid], values))
+
+    return records
+
+
+def _summary(values):
+    values = np.asarray(values, dtype=float)
+    if values.size == 0:
+        return {"n": 0, "sum": 0.0, "min": 0.0, "max": 0.0}
+    return {
+        "n": int(values.size),
+        "sum": float(values.sum()),
+        "min": float(values.min()),
+        "max": float(values.max()),
+    }
+
+
+def _open_sink(trace_path, trace_format):
+    path = os.path.abspath(trace_path)
+    sink = _SINKS.get(path)
+    if sink is None:
+        if trace_format == "binary":
+            sink = BinaryTraceSink(path)
+        elif trace_format == "jsonl":
+            sink = JsonlTraceSink(path)
+        else:
+            raise ValueError(f"trace_format non valido: {trace_format}")
+        _SINKS[path] = sink
+    return sink
+
+
+@atexit.register
+def _close_sinks():
+    for sink in _SINKS.values():
+        sink.close()
+    _SINKS.clear()
+
+
+# -------------------------------------------------------------------
+# TRACER
+# -------------------------------------------------------------------
+class SimTracer:
+    """
+    Tracer di un singolo simulatore.
+
+    - enabled: False se il livello non produce record per step
+    - sample(): True una volta ogni `every` chiamate
+    - record(): scrive un record (valori per entità o riepilogo)
+    """
+
+    def __init__(self, sid, level=logging.WARNING, every=1, sink=None):
+        self.sid = sid
+        self.level = level
+        self.every = max(1, int(every))
+        self.sink = sink if sink is not None else LoggingTraceSink()
+        self.enabled = level <= logging.INFO
+        self._count = 0
+
+    def sample(self):
+        self._count += 1
+        return (self._count - 1) % self.every == 0
+
+    def record(self, time, values, eids, **extra):
+        """
+        - values: array (o sequenza) di valori, uno per entità
+        - eids: eid allineati ai valori (lista o dict eid -> posizione)
+        - extra: campi aggiuntivi del record (es. hour_idx)
+        """
+        self.sink.write(self.sid, time, self.level, values, eids, extra)
+
+    def flush(self):
+        self.sink.flush()
+
+
+def make_tracer(sid, log_level="WARNING", log_every=1, trace_path=None,
+                trace_format="jsonl", **kwargs):
+    """
+    Crea il tracer di un simulatore a partire dai kwargs di init().
+    I kwargs non relativi al logging vengono ignorati.
+    """
+    level = logging.getLevelName(log_level) if isinstance(log_level, str) else int(log_level)
+    if not isinstance(level, int):
+        raise ValueError(f"log_level non valido: {log_level}")
+
+    sink = None
+    if trace_path is not None and level <= logging.INFO:
+        sink = _open_sink(trace_path.format(sid=sid), trace_format)
+
+    return SimTracer(sid, level=level, every=log_every, sink=sink)
@@ -1,5 +1,10 @@
+import itertools
+import numpy as np
 import mosaik_api_v3
 
+from entity_params import expand_params, unique_eid
+from sim_profiling import SimProfilingMixin
+
 
 META = {
     "api_version": "3.0",
@@ -7,7 +12,7 @@ META = {
     "models": {
         "SmartMeter": {
             "public": True,
-            "params": ["profile_id"],
+            "params": ["profile_id", "profile_ids"],
             "attrs": [
                 # Input / misure
                 "P_PV_DA[kW]",         # Previsione produzione PV Day-Ahead
@@ -30,12 +35,58 @@ META = {
 }
 
 
-class SmartMeterSimulator(mosaik_api_v3.Simulator):
+# Attributi letti dagli input mosaik (misure e commit di mercato)
+INPUT_ATTRS = [
+    "P_PV_DA[kW]",
+    "P_PV_RT[kW]",
+    "P_load_DA[kW]",
+    "P_load_RT[kW]",
+    "P_DA_committed[kW]",
+    "P_RT_committed[kW]",
+]
+
+# Attributi calcolati a ogni step
+OUTPUT_ATTRS = [
+    "P_net_DA[kW]",
+    "P_net_phys_RT[kW]",
+    "P_net_RT[kW]",
+]
+
+
+def compute_balances(arrays):
+    """
+    Calcola i bilanci di tutti i contatori con operazioni su array.
+
+    arrays: attr -> array NumPy (un valore per contatore), aggiornato in place.
+    """
+    # Se positivo: posso vendere, se negativo: possibile acquisto
+    np.subtract(arrays["P_PV_DA[kW]"], arrays["P_load_DA[kW]"], out=arrays["P_net_DA[kW]"])
+
+    # Bilancio fisico in RT
+    np.subtract(arrays["P_PV_RT[kW]"], arrays["P_load_RT[kW]"], out=arrays["P_net_phys_RT[kW]"])
+
+    # Bilancio netto in RT (considera anche i commit DA) per accedere
+    # al mercato RT e acquistare/vendere energia (P_RT)
+    np.add(arrays["P_net_phys_RT[kW]"], arrays["P_DA_committed[kW]"], out=arrays["P_net_RT[kW]"])
+
+
+class SmartMeterSimulator(SimProfilingMixin, mosaik_api_v3.Simulator):
+    """
+    Smart meter in forma struct-of-arrays:
+    un array NumPy per attributo, una posizione per contatore.
+    """
 
     def __init__(self):
         super().__init__(META)
-        self.entities = {}
-        self.cache = {}
+
+        # eid -> posizione negli array
+        self.eid_pos = {}
+
+        # Contatore per eid univoci (più contatori sullo stesso profilo)
+        self.eid_counter = itertools.count()
+
+        # attr -> array dei valori (input, commit e bilanci)
+        self.arrays = {attr: np.zeros(0) for attr in INPUT_ATTRS + OUTPUT_ATTRS}
 
     # --------------------------------------------------
     # INIT
@@ -50,82 +101,51 @@ class SmartMeterSimulator(mosaik_api_v3.Simulator):
     # --------------------------------------------------
 
     def create(self, num, model, **model_params):
-        pid = model_params["profile_id"]
-        eid = f"Home_{pid}_SmartMeter"
-
-        self.entities[eid] = {
-            "P_PV_DA[kW]": 0.0,
-            "P_load_DA[kW]": 0.0,
-            "P_PV_RT[kW]": 0.0,
-            "P_load_RT[kW]": 0.0,
-
-            # Commit (per ora nulli)
-            "P_DA_committed[kW]": 0.0,
-            "P_RT_committed[kW]": 0.0,
-
-            # Calcolati
-            "P_net_DA[kW]": 0.0,
-            "P_net_phys_RT[kW]": 0.0,
-            "P_net_RT[kW]": 0.0,
-        }
-
-        return [{
-            "eid": eid,
-            "type": model,
-            "rel": [],
-        }]
+        entities = []
+
+        for pid in expand_params(num, model_params)["profile_id"]:
+            eid = unique_eid(f"Home_{pid}_SmartMeter", self.eid_pos, self.eid_counter)
+            self.eid_pos[eid] = len(self.eid_pos)
+
+            entities.append({
+                "eid": eid,
+                "type": model,
+                "rel": [],
+            })
+
+        # Nuovi contatori: tutti gli attributi a 0 (commit per ora nulli)
+        for attr, arr in self.arrays.items():
+            self.arrays[attr] = np.concatenate([arr, np.zeros(len(entities))])
+
+        return entities
 
     # --------------------------------------------------
     # STEP
     # --------------------------------------------------
 
     def step(self, time, inputs, max_advance=None):
-        self.cache = {}
-
-        for eid, ent in self.entities.items():
-            attrs = inputs.get(eid, {})
-
-            def read(attr):
-                d = attrs.get(attr, {})
-                return list(d.values())[0] if d else ent[attr]
-
-            # Lettura input
-            P_PV_DA = read("P_PV_DA[kW]")          # Previsione produzione PV (+24h)
-            P_load_DA = read("P_load_DA[kW]")       # Previsione energia consumata (+24h)
-
-            P_PV_RT = read("P_PV_RT[kW]")           # Energia prodotta dal PV reale in RT
-            P_load_RT = read("P_load_RT[kW]")       # Energia consumata reale in RT
-
-            P_DA = read("P_DA_committed[kW]")       # Energia DA acquistata/venduta
-            P_RT = read("P_RT_committed[kW]")       # Energia RT acquistata/venduta
-
-            # Calcoli
-            P_net_DA = P_PV_DA - P_load_DA      # Se positivo: posso vendere, se negativo: possibile acquisto
-            P_net_phys_RT = P_PV_RT - P_load_RT    # Bilancio fisico in RT
-            P_net_RT = P_net_phys_RT + P_DA     # Bilancio netto in RT (considera anche i commit DA) per accedere
-                                                # al mercato RT e acquistare/vendere energia (P_RT)
-
-            ent.update({
-                "P_PV_DA[kW]": P_PV_DA,
-                "P_PV_RT[kW]": P_PV_RT,
-                "P_load_DA[kW]": P_load_DA,
-                "P_load_RT[kW]": P_load_RT,
-                "P_DA_committed[kW]": P_DA,
-                "P_RT_committed[kW]": P_RT,
-                "P_net_DA[kW]": P_net_DA,
-                "P_net_phys_RT[kW]": P_net_phys_RT,
-                "P_net_RT[kW]": P_net_RT,
-            })
+        arrays = self.arrays
+        eid_pos = self.eid_pos
+
+        # Scatter degli input mosaik negli array: si prende il primo
+        # valore della sorgente; senza input resta il valore precedente
+        for eid, attrs in inputs.items():
+            pos = eid_pos[eid]
+            for attr, values in attrs.items():
+                if values:
+                    arrays[attr][pos] = next(iter(values.values()))
 
-            self.cache[eid] = ent.copy()
+        # Bilanci di tutti i contatori in un colpo solo
+        compute_balances(arrays)
 
         return time + self.step_size
 
     def get_data(self, outputs):
-        return {
-            eid: {
-                attr: self.cache.get(eid, {}).get(attr, 0.0)
+        data = {}
+        for eid, attrs in outputs.items():
+            pos = self.eid_pos.get(eid)
+            data[eid] = {
+                attr: self.arrays[attr][pos] if pos is not None else 0.0
                 for attr in attrs
             }
-            for eid, attrs in outputs.items()
-        }
+        return data
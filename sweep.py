@@ -0,0 +1,173 @@
+# sweep.py
+#
+# Esecuzione in parallelo di molte varianti dello scenario
+# (scenario.run_scenario) su una griglia di parametri.
+#
+# Ogni variante è un mosaik.World indipendente eseguito in un processo
+# di un ProcessPoolExecutor, con una porta mosaik propria (base_port +
+# indice della variante): i World in parallelo non condividono né
+# socket né stato. Dal DataFrame dei risultati di ogni variante si
+# ricava un riepilogo (energie in kWh, autosufficienza RT, tempo di
+# esecuzione); i riepiloghi vengono raccolti in un unico DataFrame.
+#
+# Uso:
+#   python sweep.py --area 8 10 12 --efficiency 0.4 0.5 --seed 1 2 3 \
+#       --profiles 0-9 0-4 --market off on --workers 8 --output sweep.csv
+#
+# Con --results-dir ogni variante scrive anche i propri risultati
+# completi (sink CSV di result_recorder) in quella cartella; con
+# --profile-dir i file di sim_profiling in una sottocartella per variante.
+
+import argparse
+import itertools
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import pandas as pd
+
+from scenario import END, PROFILE_IDS, PV_AREA, PV_EFFICIENCY, STEP, run_scenario
+
+
+# Porta mosaik della prima variante (le altre seguono)
+DEFAULT_BASE_PORT = 5600
+
+# Attributi dello smart meter riassunti in kWh
+ENERGY_ATTRS = {
+    "P_PV_DA[kW]": "pv_DA_kWh",
+    "P_PV_RT[kW]": "pv_RT_kWh",
+    "P_load_DA[kW]": "load_DA_kWh",
+    "P_load_RT[kW]": "load_RT_kWh",
+}
+
+
+def parameter_grid(**axes):
+    """
+    Prodotto cartesiano degli assi: parameter_grid(seed=[1, 2], market=[False, True])
+    -> [{"seed": 1, "market": False}, {"seed": 1, "market": True}, ...]
+    """
+    names = list(axes)
+    return [dict(zip(names, values)) for values in itertools.product(*axes.values())]
+
+
+def summarize(result, step=STEP):
+    """
+    Riepilogo di una variante: energia totale per attributo (kWh)
+    e quota del consumo RT coperta dal PV RT, casa per casa.
+    """
+    hours = step / 3600
+    summary = {}
+    for attr, name in ENERGY_ATTRS.items():
+        if attr in result.columns.get_level_values("attr"):
+            summary[name] = float(result[attr].to_numpy().sum() * hours)
+
+    if "P_PV_RT[kW]" in result and "P_load_RT[kW]" in result:
+        pv = result["P_PV_RT[kW]"].to_numpy()
+        load = result["P_load_RT[kW]"].to_numpy()
+        total = load.sum()
+        summary["self_sufficiency_RT"] = float(np.minimum(pv, load).sum() / total) if total else np.nan
+
+    return summary
+
+
+def run_point(index, params, base_port=DEFAULT_BASE_PORT, results_dir=None, profile_dir=None):
+    """
+    Esegue una variante (nel processo del pool) e ne restituisce il
+    riepilogo; un errore non ferma lo sweep ma finisce nella colonna "error".
+    """
+    kwargs = dict(params)
+    if results_dir is not None:
+        kwargs["output_sink"] = "csv"
+        kwargs["output_path"] = os.path.join(results_dir, f"run_{index:04d}_{{eid}}")
+    if profile_dir is not None:
+        kwargs["profile_dir"] = os.path.join(profile_dir, f"run_{index:04d}")
+
+    row = {"run": index, **params}
+    start = time.perf_counter()
+    try:
+        result = run_scenario(port=base_port + index, quiet=True, **kwargs)
+        row.update(summarize(result, kwargs.get("step", STEP)))
+        row["error"] = None
+    except Exception:
+        row["error"] = traceback.format_exc(limit=3)
+    row["elapsed_s"] = time.perf_counter() - start
+    return row
+
+
+def run_sweep(grid, workers=None, base_port=DEFAULT_BASE_PORT, results_dir=None, profile_dir=None):
+    """
+    Esegue le varianti della griglia in parallelo (workers processi,
+    default: numero di CPU) e restituisce i riepiloghi in ordine di variante.
+    """
+    if results_dir is not None:
+        os.makedirs(results_dir, exist_ok=True)
+
+    rows = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(run_point, i, params, base_port, results_dir, profile_dir)
+            for i, params in enumerate(grid)
+        ]
+        for done, future in enumerate(as_completed(futures), 1):
+            row = future.result()
+            status = "errore" if row["error"] else f"{row['elapsed_s']:.1f} s"
+            print(f"[{done}/{len(futures)}] variante {row['run']}: {status}")
+            rows.append(row)
+
+    return pd.DataFrame(rows).sort_values("run").set_index("run")
+
+
+# -------------------------------------------------------------------
+# CLI
+# -------------------------------------------------------------------
+def parse_profiles(spec):
+    """
+    Insieme di profili da riga di comando: "0-9" (intervallo) o "0,3,5" (elenco).
+    """
+    if "-" in spec:
+        first, last = spec.split("-")
+        return [str(i) for i in range(int(first), int(last) + 1)]
+    return spec.split(",")
+
+
+def parse_switch(value):
+    if value not in ("on", "off"):
+        raise argparse.ArgumentTypeError(f"atteso on/off: {value}")
+    return value == "on"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sweep parallelo di varianti dello scenario.")
+    parser.add_argument("--area", type=float, nargs="+", default=[PV_AREA],
+                        help="area PV della casa '0' (m2)")
+    parser.add_argument("--efficiency", type=float, nargs="+", default=[PV_EFFICIENCY],
+                        help="efficienza dei pannelli")
+    parser.add_argument("--profiles", nargs="+", default=[f"{PROFILE_IDS[0]}-{PROFILE_IDS[-1]}"],
+                        help='insiemi di profili, es. "0-9" o "0,3,5"')
+    parser.add_argument("--seed", type=int, nargs="+", default=[0], help="seed dell'irradianza")
+    parser.add_argument("--market", type=parse_switch, nargs="+", default=[False],
+                        help="mercato DA: on/off")
+    parser.add_argument("--hours", type=int, default=END // 3600, help="durata della simulazione (ore)")
+    parser.add_argument("--workers", type=int, default=None, help="processi in parallelo (default: CPU)")
+    parser.add_argument("--base-port", type=int, default=DEFAULT_BASE_PORT, help="porta mosaik della variante 0")
+    parser.add_argument("--results-dir", default=None, help="cartella dei risultati completi (CSV per variante)")
+    parser.add_argument("--profile-dir", default=None, help="cartella dei profili dei simulatori (sim_profiling)")
+    parser.add_argument("--output", default="sweep_results.csv", help="CSV dei riepiloghi")
+    args = parser.parse_args()
+
+    grid = parameter_grid(
+        pv_area=args.area,
+        pv_efficiency=args.efficiency,
+        profile_ids=[parse_profiles(spec) for spec in args.profiles],
+        seed=args.seed,
+        market=args.market,
+        end=[args.hours * 3600],
+    )
+    print(f"{len(grid)} varianti, {args.workers or os.cpu_count()} processi")
+
+    summary = run_sweep(grid, workers=args.workers, base_port=args.base_port, results_dir=args.results_dir,
+                        profile_dir=args.profile_dir)
+    summary["profile_ids"] = summary["profile_ids"].map(",".join)
+    summary.to_csv(args.output)
+    print(summary.drop(columns="error"))
@@ -0,0 +1,244 @@
+# time_axis.py
+#
+# Asse temporale dei simulatori di profili: converte il tempo mosaik
+# (secondi) in righe dei dati, tenendo conto della risoluzione dei dati
+# (data_resolution) e dello step della simulazione (step_size).
+#
+# - step == risoluzione: una riga per step (nessuna conversione)
+# - step < risoluzione (upsampling, es. dati orari a 15 minuti):
+#   interpolazione tra le righe vicine
+#     "hold":   valore della riga corrente (gradino)
+#     "linear": interpolazione lineare tra riga corrente e successiva
+#     "spline": cubica di Hermite monotona (PCHIP, Fritsch-Carlson) sulle
+#               righe -1, 0, +1, +2: resta tra i valori delle righe
+#               vicine, quindi dati non negativi restano non negativi
+# - step > risoluzione (downsampling, es. dati a 15 minuti con step
+#   orario): media delle righe che cadono nello step
+#
+# In ogni caso un istante corrisponde a una riga base, a un insieme di
+# offset di riga e a un vettore di pesi. I pesi dipendono solo dalla
+# fase dell'istante all'interno della riga e vengono precalcolati una
+# volta per tutte le fasi possibili: nello step resta una somma pesata
+# di poche righe, vettorizzata su tutte le entità. Per "spline" i pesi
+# sono la base di Hermite, combinata con le derivate monotone calcolate
+# dalle quattro righe (pchip_slope).
+
+import math
+import numpy as np
+
+
+# Risoluzione dei dati dei CSV (secondi): profili orari
+DEFAULT_RESOLUTION = 3600
+
+# Orizzonte della previsione Day-Ahead (s)
+DA_HORIZON = 24 * 3600
+
+INTERPOLATION_METHODS = ("hold", "linear", "spline")
+
+# Offset di riga usati da ciascun metodo di upsampling
+METHOD_OFFSETS = {
+    "hold": np.array([0]),
+    "linear": np.array([0, 1]),
+    "spline": np.array([-1, 0, 1, 2]),
+}
+
+
+def interpolation_weights(method, f):
+    """
+    Pesi delle righe METHOD_OFFSETS[method] per la fase f in [0, 1).
+    """
+    if method == "hold":
+        return np.array([1.0])
+    if method == "linear":
+        return np.array([1.0 - f, f])
+    if method == "spline":
+        # Base di Hermite: (valore riga 0, derivata riga 0, valore riga 1, derivata riga 1)
+        f2, f3 = f * f, f * f * f
+        return np.array([
+            2 * f3 - 3 * f2 + 1,
+            f3 - 2 * f2 + f,
+            -2 * f3 + 3 * f2,
+            f3 - f2,
+        ])
+    raise ValueError(f"Interpolazione non valida: {method} (ammesse: {INTERPOLATION_METHODS})")
+
+
+def pchip_slope(d0, d1):
+    """
+    Derivata monotona in un nodo (Fritsch-Carlson) dalle differenze
+    d0, d1 con le righe vicine: media armonica se hanno lo stesso segno,
+    0 in un massimo o minimo locale (nessuna sovraelongazione).
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(d0 * d1 > 0, 2 * d0 * d1 / (d0 + d1), 0.0)
+
+
+class TimeAxis:
+    """
+    Conversione tempo mosaik -> righe dei dati.
+
+    - step_size: step della simulazione (s)
+    - resolution: intervallo tra due righe dei dati (s)
+    - method: interpolazione per l'upsampling ("hold", "linear", "spline")
+    """
+
+    def __init__(self, step_size, resolution=DEFAULT_RESOLUTION, method="hold"):
+        if method not in INTERPOLATION_METHODS:
+            raise ValueError(f"Interpolazione non valida: {method} (ammesse: {INTERPOLATION_METHODS})")
+        self.step_size = step_size
+        self.resolution = resolution
+        self.method = method
+        self.downsample = step_size > resolution
+
+        if self.downsample:
+            # Downsampling: media delle righe che cadono nello step
+            if step_size % resolution:
+                raise ValueError(
+                    f"step_size {step_size} non multiplo della risoluzione dei dati {resolution}"
+                )
+            n = step_size // resolution
+            self.offsets = np.arange(n)
+            self.quantum = resolution
+            self.weights = np.full((1, n), 1.0 / n)
+        else:
+            # Upsampling (o stessa risoluzione): una riga di pesi per fase.
+            # Gli istanti multipli di step cadono su multipli di quantum.
+            self.offsets = METHOD_OFFSETS[method]
+            self.quantum = math.gcd(step_size, resolution)
+            phases = resolution // self.quantum
+            self.weights = np.array([
+                interpolation_weights(method, k / phases) for k in range(phases)
+            ])
+
+        self.phases = len(self.weights)
+
+    def locate(self, time):
+        """
+        Riga base e pesi (allineati a self.offsets) per l'istante time (s).
+        """
+        if time % self.quantum == 0:
+            row, phase = divmod(int(time // self.quantum), self.phases)
+            return row, self.weights[phase]
+
+        # Istante fuori griglia: pesi calcolati al volo
+        row, rem = divmod(time, self.resolution)
+        if self.downsample:
+            return int(row), self.weights[0]
+        return int(row), interpolation_weights(self.method, rem / self.resolution)
+
+    def row_index(self, time):
+        """
+        Riga dei dati che contiene l'istante time (s).
+        """
+        return int(time // self.resolution)
+
+    def sample(self, store, time, cols):
+        """
+        Valori dello store all'istante time per gli indici di colonna cols.
+        Le righe oltre la fine dei dati ricominciano dall'inizio.
+        """
+        row, weights = self.locate(time)
+        n = len(store)
+
+        if len(self.offsets) == 1:
+            return store.row((row + self.offsets[0]) % n, cols) * weights[0]
+
+        if self.method == "spline" and not self.downsample:
+            if weights[0] == 1.0:
+                # Istante su una riga dei dati: nessuna interpolazione
+                return store.row(row % n, cols) * 1.0
+            ym1, y0, y1, y2 = (store.row((row + off) % n, cols) for off in self.offsets)
+            h00, h10, h01, h11 = weights
+            return (h00 * y0 + h10 * pchip_slope(y0 - ym1, y1 - y0)
+                    + h01 * y1 + h11 * pchip_slope(y1 - y0, y2 - y1))
+
+        values = None
+        for off, w in zip(self.offsets, weights):
+            if w == 0.0:
+                continue
+            contrib = store.row((row + off) % n, cols) * w
+            values = contrib if values is None else values + contrib
+        return values
+
+
+# -------------------------------------------------------------------
+# ORIZZONTE DI PREVISIONE
+# -------------------------------------------------------------------
+class ForecastHorizon:
+    """
+    Valori previsti per time + horizon, singoli o a blocchi.
+
+    - horizon: anticipo della previsione (s), es. 24h o 48h
+    - block: numero di valori del blocco DA (0 = nessun blocco),
+      distanziati di block_step secondi a partire da time + horizon
+
+    Se lo store è in memoria e lo step coincide con la risoluzione dei
+    dati, le colonne delle entità vengono ruotate una volta (np.roll di
+    horizon righe) ed estese di block-1 righe: nello step la previsione
+    è la riga h della tabella e il blocco la fetta [h, h + block),
+    senza modulo né somme pesate. Negli altri casi (streaming,
+    interpolazione) si campiona attraverso l'asse temporale.
+    """
+
+    def __init__(self, axis, horizon=DA_HORIZON, block=0, block_step=DEFAULT_RESOLUTION, precompute=True):
+        self.axis = axis
+        self.horizon = horizon
+        self.block = block
+        self.block_step = block_step
+        self.precompute = precompute
+
+        self.store = None
+        self.cols = None
+        self.table = None
+        self.n_rows = 0
+
+    def prepare(self, store, cols):
+        """
+        Associa store e colonne delle entità; con precompute costruisce
+        la tabella ruotata. Va richiamato quando cambiano le colonne.
+        """
+        self.store = store
+        self.cols = cols
+        self.table = None
+        self.n_rows = len(store)
+
+        aligned = (
+            self.axis.step_size == self.axis.resolution
+            and self.horizon % self.axis.resolution == 0
+            and (self.block <= 1 or self.block_step == self.axis.resolution)
+        )
+        if not (self.precompute and aligned):
+            return
+
+        try:
+            data = store.take(cols)
+        except AttributeError:
+            # Store in streaming: nessuna tabella, si campiona nello step
+            return
+
+        shift = self.horizon // self.axis.resolution
+        table = np.roll(data, -shift, axis=0)
+        if self.block > 1:
+            table = np.concatenate([table, table[:self.block - 1]])
+        self.table = np.ascontiguousarray(table)
+
+    def point(self, time):
+        """
+        Valori previsti per time + horizon (uno per colonna).
+        """
+        if self.table is not None:
+            return self.table[self.axis.row_index(time) % self.n_rows]
+        return self.axis.sample(self.store, time + self.horizon, self.cols)
+
+    def values(self, time):
+        """
+        Blocco di previsioni (block × colonne) a partire da time + horizon.
+        """
+        if self.table is not None:
+            h = self.axis.row_index(time) % self.n_rows
+            return self.table[h:h + self.block]
+        start = time + self.horizon
+        return np.array([
+            self.axis.sample(self.store, start + k * self.block_step, self.cols)
+            for k in range(self.block)
+        ])